@@ -1,39 +1,96 @@
-from django.contrib import admin
-from .models import Student, Position, Candidate, Vote
+import io
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.shortcuts import redirect, render
+from django.urls import path
+from .forms import VoterImportForm
+from .importers import VoterImportError, import_voters
+from .models import Student, Position, Candidate, Vote, OutboxEmail
+from . import tallies
+from .paginators import TableCountPaginator
+from .routers import ReplicaChangeListMixin, mark_recent_write
 
 class CandidateInline(admin.TabularInline):
     model = Candidate
     extra = 1  # Number of empty forms to display
 
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
+class StudentAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    change_list_template = 'admin/myweb/student/change_list.html'
     list_display = ('name', 'reg_no', 'email', 'is_active', 'has_voted')
     list_filter = ('is_active', 'has_voted')
+    # Substring searches: trigram-indexed on PostgreSQL, a scan of the roll on SQLite (migration 0028)
     search_fields = ('name', 'reg_no', 'email')
     ordering = ('name',)
+    # The voter roll is large: no COUNT(*) of the whole table per page
+    paginator = TableCountPaginator
+    show_full_result_count = False
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.select_related()  # Use select_related for performance optimization
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page, table_count=tallies.registered_voters
+        )
+
+    def get_urls(self):
+        urls = [
+            path('import-csv/', self.admin_site.admin_view(self.import_csv), name='myweb_student_import_csv'),
+        ]
+        return urls + super().get_urls()
+
+    def import_csv(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:myweb_student_changelist')
+        form = VoterImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            csv_file = io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8-sig', newline='')
+            try:
+                # Hashed inline by default: a web worker must not fork (see ADMIN_IMPORT_WORKERS)
+                report = import_voters(
+                    csv_file, user_id=request.user.pk, workers=getattr(settings, 'ADMIN_IMPORT_WORKERS', 1)
+                )
+            except (VoterImportError, UnicodeDecodeError) as e:
+                form.add_error('csv_file', str(e))
+            else:
+                messages.success(request, f"Voter roll imported: {report}.")
+                for error in report.errors:
+                    messages.warning(request, error)
+                return mark_recent_write(redirect('admin:myweb_student_changelist'))
+
+        return render(request, 'admin/myweb/student/import_csv.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import voters',
+            'form': form,
+        })
 
 @admin.register(Position)
-class PositionAdmin(admin.ModelAdmin):
+class PositionAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ('title',)
     search_fields = ('title',)
 
 from django.contrib import admin
+from django.db.models import Q
+from django.db.models.functions import Coalesce
 from django.utils.html import mark_safe
+from django.utils.text import smart_split, unescape_string_literal
 from .models import Candidate  # Adjust the import based on your project structure
 
 @admin.register(Candidate)
-class CandidateAdmin(admin.ModelAdmin):
+class CandidateAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ('name', 'email', 'position', 'votes_count', 'image_preview')
     list_filter = ('position',)
     search_fields = ('name', 'position__title')
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        # Read the trigger-maintained tally in the same query as the candidates
+        return qs.annotate(tally_votes=Coalesce('tally__votes', 0))
+
     def votes_count(self, obj):
-        return obj.get_vote_count()  # Using the method from the Candidate model
+        return obj.tally_votes
     votes_count.short_description = 'Votes Count'  # Custom label for the votes column
+    votes_count.admin_order_field = 'tally_votes'  # Sort on the tally table
 
     def image_preview(self, obj):
         if obj.image:
@@ -42,16 +99,62 @@ class CandidateAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Image'  # Custom label for the image column
 
 
+class PositionCandidateListFilter(admin.RelatedFieldListFilter):
+    """Lists the candidates of the selected position only, rather than every candidate."""
+
+    def field_choices(self, field, request, model_admin):
+        position_id = request.GET.get('position__id__exact', '')
+        if not position_id.isdigit():
+            return []
+        candidates = field.related_model._default_manager.filter(position_id=position_id).select_related('position')
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        if ordering:
+            candidates = candidates.order_by(*ordering)
+        # Candidate.__str__ shows the position title
+        return [(candidate.pk, str(candidate)) for candidate in candidates]
+
+
 @admin.register(Vote)
-class VoteAdmin(admin.ModelAdmin):
+class VoteAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ('student', 'candidate', 'timestamp')
-    list_filter = ('candidate',)
+    list_filter = ('position', ('candidate', PositionCandidateListFilter))
     search_fields = ('student__name', 'candidate__name', 'candidate__position__title')
     readonly_fields = ('timestamp',)  # Make timestamp read-only
+    # Searched select boxes instead of loading every student and candidate into the form
+    autocomplete_fields = ('student', 'candidate')
+    paginator = TableCountPaginator
+    show_full_result_count = False
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('student', 'candidate')  # Optimize related lookups
+        # Candidate.__str__ shows the position title
+        return qs.select_related('student', 'candidate__position')
+
+    def get_search_results(self, request, queryset, search_term):
+        # The same matches as the default search over search_fields, but the students
+        # and candidates are matched first and their votes fetched through the student
+        # and candidate indexes (as a UNION; SQLite will not use two indexes for an OR)
+        # instead of by scanning and joining every vote
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            students = Student.objects.filter(name__icontains=bit).values('pk')
+            candidates = Candidate.objects.filter(Q(name__icontains=bit) | Q(position__title__icontains=bit)).values('pk')
+            queryset = queryset.filter(pk__in=Vote.objects.filter(student__in=students).values('pk').union(
+                Vote.objects.filter(candidate__in=candidates).values('pk')
+            ))
+        return queryset, False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        # The trigger-maintained tallies add up to the number of votes
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, table_count=tallies.total_votes)
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = (('sent_at', admin.EmptyFieldListFilter),)
+    search_fields = ('subject',)
+    readonly_fields = ('created_at', 'attempts', 'last_error', 'sent_at')
 
 # Optionally, you can register your models without decorators
 # admin.site.register(Student, StudentAdmin)
@@ -1,13 +1,20 @@
 import os
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web.settings')
+
+# Set up Django before importing the routing, which pulls in the consumers and models
+django_asgi_app = get_asgi_application()
+
+from myweb import journal
+journal.start_if_enabled()  # Replays journals left by a crashed process before serving
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import myweb.routing
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web.settings')
-
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             myweb.routing.websocket_urlpatterns
@@ -0,0 +1,86 @@
+"""
+Async versions of the home, login, vote and success views.
+
+Served instead of the sync views when ASYNC_VIEWS is on (see urls.py).
+Reads go through the async ORM and cache APIs, password checks run on a
+bounded thread pool, and ballots are still recorded by the sync write path
+(submit_ballot), whose transactions cannot span an await.
+"""
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth import aauthenticate, alogin
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import redirect, render
+
+from . import results
+from .forms import LoginForm
+from .models import Vote
+from .routers import mark_recent_write
+from .vote_writer import submit_ballot
+from .voting import BallotError, aget_ballot, parse_ballot
+
+# Template rendering is sync (context processors may touch the session or the user), so it runs off the loop
+arender = sync_to_async(render)
+
+
+async def home(request):
+    snapshot = await results.aget_snapshot()
+    return await arender(request, 'home.html', {
+        'positions_with_candidates': snapshot['positions_with_candidates'],
+        'year': datetime.now().year,
+    })
+
+
+async def login_view(request):
+    if request.method == 'POST':
+        form = LoginForm(request.POST)
+        if form.is_valid():
+            student = await aauthenticate(
+                request, reg_no=form.cleaned_data['reg_no'], password=form.cleaned_data['password']
+            )
+            if student is not None:
+                await alogin(request, student)
+                return redirect('vote')
+            form.add_error(None, "Invalid registration number or password.")
+    else:
+        form = LoginForm()
+
+    return await arender(request, 'login.html', {'form': form})
+
+
+@login_required
+async def vote(request):
+    student = await request.auser()
+
+    if request.method == 'POST':
+        try:
+            await sync_to_async(submit_ballot)(student, parse_ballot(request.POST))
+        except BallotError as e:
+            messages.error(request, str(e))
+            return redirect('vote')
+
+        messages.success(request, "Your vote has been successfully cast!")
+        return mark_recent_write(redirect('success'))
+
+    voted_positions = {
+        position_id
+        async for position_id in Vote.objects.filter(student=student).values_list('position_id', flat=True)
+    }
+    ballot = await aget_ballot()
+
+    return await arender(request, 'vote.html', {
+        'ballot': ballot,
+        'student': student,
+        'voted_positions': voted_positions,
+    })
+
+
+async def success(request):
+    snapshot = await results.aget_snapshot()
+    return await arender(request, 'success.html', {
+        'positions_with_candidates': snapshot['positions_with_candidates'],
+        'total_students': snapshot['total_students'],
+        'total_votes': snapshot['total_votes'],
+    })
@@ -1,6 +1,29 @@
+from django.conf import settings
 from django.contrib.auth.backends import BaseBackend
+from django.db import DEFAULT_DB_ALIAS, transaction
 from .models import Student
+from . import results
 from django.contrib.auth.hashers import check_password
+from .credentials import acheck_password
+
+# Columns the voting pages need; anything else is loaded lazily on first access
+CACHED_USER_FIELDS = ('id', 'name', 'reg_no', 'password', 'is_active', 'is_staff')
+
+
+def cached_user_key(student_id):
+    return f'student:user:{student_id}'
+
+
+def invalidate_cached_user(student_id):
+    invalidate_cached_users([student_id])
+
+
+def invalidate_cached_users(student_ids):
+    """Drop the cached snapshots of these students once the current transaction commits."""
+    keys = [cached_user_key(student_id) for student_id in student_ids]
+    if keys:
+        transaction.on_commit(lambda: results.get_cache().delete_many(keys))
+
 
 class StudentBackend(BaseBackend):
     def authenticate(self, request, reg_no=None, password=None):
@@ -11,8 +34,39 @@ class StudentBackend(BaseBackend):
         except Student.DoesNotExist:
             return None
 
+    async def aauthenticate(self, request, reg_no=None, password=None):
+        # Used by the async login view: the hash check runs on the bounded password pool
+        try:
+            student = await Student.objects.aget(reg_no=reg_no)
+        except Student.DoesNotExist:
+            return None
+        if await acheck_password(password, student.password):
+            return student
+        return None
+
     def get_user(self, student_id):
+        if getattr(settings, 'STUDENT_USER_CACHE', False):
+            return self.get_cached_user(student_id)
         try:
             return Student.objects.get(pk=student_id)
         except Student.DoesNotExist:
             return None
+
+    def get_cached_user(self, student_id):
+        """
+        Build the request user from a compact cached snapshot instead of the student table.
+
+        The snapshot keeps the password hash so the session auth hash check
+        still works, and is dropped whenever the student is saved, deleted or
+        bulk-updated. It lives in the results cache, which has to be shared
+        between workers for a password change in one to log the user out in all.
+        """
+        cache = results.get_cache()
+        key = cached_user_key(student_id)
+        values = cache.get(key)
+        if values is None:
+            values = Student.objects.filter(pk=student_id).values_list(*CACHED_USER_FIELDS).first()
+            if values is None:
+                return None
+            cache.set(key, values, timeout=getattr(settings, 'STUDENT_USER_CACHE_TIMEOUT', 300))
+        return Student.from_db(DEFAULT_DB_ALIAS, CACHED_USER_FIELDS, values)
@@ -0,0 +1,65 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from .models import VoteTally
+
+logger = logging.getLogger(__name__)
+
+RESULTS_GROUP = 'results'
+NOTIFICATIONS_GROUP = 'notifications'
+
+_deferred = ContextVar('deferred_broadcast', default=None)
+
+
+def publish_tallies(candidate_ids):
+    """Send the current counts of the given candidates to every open results socket."""
+    try:
+        channel_layer = get_channel_layer()
+    except Exception:
+        logger.exception("Results broadcast skipped: channel layer is not available.")
+        return
+    if channel_layer is None:
+        return
+
+    tallies = list(VoteTally.objects.filter(candidate_id__in=set(candidate_ids)).values_list('candidate_id', 'votes'))
+    try:
+        async_to_sync(channel_layer.group_send)(RESULTS_GROUP, {
+            'type': 'results.tally',
+            'tallies': [list(tally) for tally in tallies],
+            'total_votes': VoteTally.objects.aggregate(total=Coalesce(Sum('votes'), 0))['total'],
+        })
+    except Exception:
+        # A broadcast failure must never fail the vote that triggered it
+        logger.exception("Results broadcast failed.")
+
+
+@contextmanager
+def deferred():
+    """
+    Collect the candidates passed to publish_on_commit inside the block
+    instead of broadcasting per transaction. The caller publishes the
+    collected set once, e.g. after a whole batch of ballots has committed.
+    """
+    candidate_ids = set()
+    token = _deferred.set(candidate_ids)
+    try:
+        yield candidate_ids
+    finally:
+        _deferred.reset(token)
+
+
+def publish_on_commit(candidate_ids):
+    """Broadcast the new counts of `candidate_ids` once the current transaction commits."""
+    collected = _deferred.get()
+    if collected is not None:
+        collected.update(candidate_ids)
+        return
+    candidate_ids = list(candidate_ids)
+    transaction.on_commit(lambda: publish_tallies(candidate_ids))
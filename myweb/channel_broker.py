@@ -0,0 +1,443 @@
+"""
+Single-machine channel layer without Redis.
+
+UnixSocketChannelLayer talks to a small broker over a Unix socket, so the
+worker processes of one machine share channels and groups. The broker is
+either started by the first process that needs it (autostart, the default)
+or run on its own with `manage.py run_channel_broker`. Either way it holds
+an exclusive lock next to the socket, so only one broker serves a path; if
+the process running it exits, the next process to connect takes over and
+the clients re-join their groups.
+
+Messages are pickled, so the socket is created mode 0600 and must live in a
+directory only the application user can write to.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from pathlib import Path
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!I')
+CONNECT_TIMEOUT = 5.0  # Seconds to wait for a broker that another process is starting
+SWEEP_INTERVAL = 10.0  # Seconds between broker passes dropping expired messages and memberships
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(HEADER.size)
+    return pickle.loads(await reader.readexactly(HEADER.unpack(header)[0]))
+
+
+def encode_frame(payload):
+    data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data)) + data
+
+
+def lock_path(path):
+    return f'{path}.lock'
+
+
+def acquire_broker_lock(path):
+    """Open and lock the broker lock file for `path`; returns the file, or None if a broker already holds it."""
+    lock_file = open(lock_path(path), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+class Broker:
+    """
+    Holds the channels and groups for every process on this machine.
+
+    Requests are (request_id, op, args) frames and every reply is
+    (request_id, status, result). A receive with nothing queued waits at the
+    broker and is answered when a message arrives, so delivery needs no polling.
+    """
+
+    def __init__(self, path, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None):
+        self.path = str(path)
+        self.expiry = expiry
+        self.group_expiry = group_expiry
+        # Reuses the channel_capacity pattern matching of the channels base class
+        self.limits = BaseChannelLayer(expiry=expiry, capacity=capacity)
+        self.limits.channel_capacity = self.limits.compile_capacities(channel_capacity or {})
+        self.channels = {}  # channel -> deque of (expires_at, message)
+        self.waiters = {}  # channel -> deque of (client, request_id)
+        self.groups = {}  # group -> {channel: joined_at}
+        self.server = None
+
+    async def serve(self, ready=None):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left by a broker that died; the lock proves nobody serves it
+        old_umask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(self.handle_client, path=self.path)
+        finally:
+            os.umask(old_umask)
+        if ready is not None:
+            ready.set()
+        sweeper = asyncio.ensure_future(self.sweep())
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            now = time.time()
+            for channel in list(self.channels):
+                self.drop_expired(channel, now)
+            joined_after = now - self.group_expiry
+            for group, members in list(self.groups.items()):
+                for channel, joined_at in list(members.items()):
+                    if joined_at < joined_after:
+                        del members[channel]
+                if not members:
+                    del self.groups[group]
+
+    def drop_expired(self, channel, now):
+        queue = self.channels.get(channel)
+        while queue and queue[0][0] < now:
+            queue.popleft()
+        if queue is not None and not queue:
+            del self.channels[channel]
+
+    async def handle_client(self, reader, writer):
+        client = writer
+        try:
+            while True:
+                request_id, op, args = await read_frame(reader)
+                try:
+                    result = getattr(self, f'op_{op}')(client, request_id, *args)
+                except ChannelFull:
+                    writer.write(encode_frame((request_id, 'full', None)))
+                    continue
+                if result is not _WAITING:
+                    writer.write(encode_frame((request_id, 'ok', result)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for channel, waiting in list(self.waiters.items()):
+                for entry in [entry for entry in waiting if entry[0] is client]:
+                    waiting.remove(entry)
+                if not waiting:
+                    del self.waiters[channel]
+            writer.close()
+
+    def deliver(self, channel, message):
+        """Hand `message` to a waiting receiver, or queue it. Raises ChannelFull."""
+        waiting = self.waiters.get(channel)
+        while waiting:
+            client, request_id = waiting.popleft()
+            if not waiting:
+                del self.waiters[channel]
+            if not client.is_closing():
+                client.write(encode_frame((request_id, 'ok', message)))
+                return
+        queue = self.channels.setdefault(channel, deque())
+        if len(queue) >= self.limits.get_capacity(channel):
+            raise ChannelFull(channel)
+        queue.append((time.time() + self.expiry, message))
+
+    def op_send(self, client, request_id, channel, message):
+        self.deliver(channel, message)
+
+    def op_receive(self, client, request_id, channel):
+        self.drop_expired(channel, time.time())
+        queue = self.channels.get(channel)
+        if queue:
+            message = queue.popleft()[1]
+            if not queue:
+                del self.channels[channel]
+            return message
+        self.waiters.setdefault(channel, deque()).append((client, request_id))
+        return _WAITING
+
+    def op_cancel(self, client, request_id, channel, receive_id):
+        # Only answered if the receive was still waiting; otherwise its message is already on the way
+        waiting = self.waiters.get(channel)
+        if waiting and (client, receive_id) in waiting:
+            waiting.remove((client, receive_id))
+            if not waiting:
+                del self.waiters[channel]
+            client.write(encode_frame((receive_id, 'cancelled', None)))
+        return _WAITING
+
+    def op_group_add(self, client, request_id, group, channel):
+        self.groups.setdefault(group, {})[channel] = time.time()
+
+    def op_group_discard(self, client, request_id, group, channel):
+        members = self.groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del self.groups[group]
+
+    def op_group_send(self, client, request_id, group, message):
+        joined_after = time.time() - self.group_expiry
+        for channel, joined_at in list(self.groups.get(group, {}).items()):
+            if joined_at < joined_after:
+                continue
+            try:
+                self.deliver(channel, message)
+            except ChannelFull:
+                pass  # Like the other layers: a full member misses the message
+
+    def op_flush(self, client, request_id):
+        self.channels.clear()
+        self.groups.clear()
+
+
+_WAITING = object()
+
+
+def serve_forever(path, **config):
+    """Run a broker for `path` in this thread until the process exits. Returns False if another broker holds the lock."""
+    lock_file = acquire_broker_lock(path)
+    if lock_file is None:
+        return False
+    try:
+        asyncio.run(Broker(path, **config).serve())
+    finally:
+        lock_file.close()
+    return True
+
+
+def start_broker_thread(path, **config):
+    """Start a broker on a daemon thread unless another process already runs one. Returns True if started."""
+    lock_file = acquire_broker_lock(path)
+    if lock_file is None:
+        return False
+    ready = threading.Event()
+
+    def run():
+        try:
+            asyncio.run(Broker(path, **config).serve(ready))
+        except Exception:
+            logger.exception("Channel broker on %s stopped.", path)
+        finally:
+            lock_file.close()
+
+    threading.Thread(target=run, name='channel-broker', daemon=True).start()
+    ready.wait(CONNECT_TIMEOUT)
+    return True
+
+
+class BrokerConnection:
+    """One process's connection to the broker from one event loop."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.pending = {}  # request_id -> (future, channel for receives)
+        self.buffered = {}  # channel -> messages that arrived for a receive cancelled meanwhile
+        self.closed = False
+        self.read_task = asyncio.ensure_future(self.read())
+
+    async def read(self):
+        try:
+            while True:
+                request_id, status, result = await read_frame(self.reader)
+                future, channel = self.pending.pop(request_id, (None, None))
+                if future is None or status == 'cancelled':
+                    continue
+                if future.done():
+                    if channel is not None and status == 'ok':
+                        self.buffered.setdefault(channel, deque()).append(result)
+                elif status == 'full':
+                    future.set_exception(ChannelFull())
+                else:
+                    future.set_result(result)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            error = e
+        except asyncio.CancelledError:
+            error = ConnectionError("Broker connection closed.")
+        self.closed = True
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"Lost the channel broker: {error!r}"))
+        self.pending.clear()
+
+    def notify(self, op, *args):
+        """Send a request that gets no reply."""
+        self.writer.write(encode_frame((0, op, args)))
+
+    def request(self, op, *args, channel=None):
+        if self.closed:
+            raise ConnectionError("Lost the channel broker.")
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = (future, channel)
+        self.writer.write(encode_frame((self.next_id, op, args)))
+        return self.next_id, future
+
+    def close(self):
+        self.read_task.cancel()
+        self.writer.close()
+
+    async def aclose(self):
+        self.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+def default_path():
+    """The socket used when CONFIG has no path: in the project directory, not a world-writable /tmp."""
+    return str(Path(settings.BASE_DIR) / 'channels.sock')
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    """
+    Channel layer for the worker processes of one machine, served by a Broker over a Unix socket.
+
+    CONFIG: path (the socket, default_path() if unset), autostart (start a
+    broker in this process when none answers), plus the usual expiry,
+    group_expiry, capacity and channel_capacity.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=None, autostart=True, expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.path = str(path or default_path())
+        self.autostart = autostart
+        self.broker_config = {
+            'expiry': expiry, 'group_expiry': group_expiry,
+            'capacity': capacity, 'channel_capacity': channel_capacity,
+        }
+        self.connections = weakref.WeakKeyDictionary()
+        self.memberships = set()  # (group, channel) joined through this layer, re-joined after a broker restart
+
+    async def connection(self):
+        loop = asyncio.get_running_loop()
+        connection = self.connections.get(loop)
+        if connection is not None and not connection.closed:
+            return connection
+        if connection is None:
+            self.close_with_loop(loop)
+        else:
+            connection.close()
+        connection = self.connections[loop] = await self.connect()
+        for group, channel in self.memberships:
+            await connection.request('group_add', group, channel)[1]
+        return connection
+
+    def close_with_loop(self, loop):
+        """
+        Close this loop's connection when the loop is closed, as channels_redis
+        does. async_to_sync runs every sync call (publish_tallies after each
+        ballot) on a new loop, so without this each call would leave a socket
+        open here and another in the broker.
+        """
+        close = loop.close
+
+        def close_connection_first():
+            connection = self.connections.pop(loop, None)
+            if connection is not None and not loop.is_closed():
+                loop.run_until_complete(connection.aclose())
+            loop.close = close
+            close()
+
+        loop.close = close_connection_first
+
+    async def connect(self):
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+                return BrokerConnection(reader, writer)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                if not (self.autostart and start_broker_thread(self.path, **self.broker_config)):
+                    await asyncio.sleep(0.05)  # Another process is bringing its broker up
+
+    async def call(self, op, *args):
+        try:
+            connection = await self.connection()
+            return await connection.request(op, *args)[1]
+        except ConnectionError:
+            # The broker went away; one retry lets a new broker take over
+            connection = await self.connection()
+            return await connection.request(op, *args)[1]
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+        await self.call('send', channel, message)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        while True:
+            connection = await self.connection()
+            buffered = connection.buffered.get(channel)
+            if buffered:
+                message = buffered.popleft()
+                if not buffered:
+                    del connection.buffered[channel]
+                return message
+            request_id, future = connection.request('receive', channel, channel=channel)
+            try:
+                return await future
+            except ConnectionError:
+                continue  # Wait on the broker that takes over
+            except asyncio.CancelledError:
+                if not connection.closed:
+                    connection.notify('cancel', channel, request_id)
+                raise
+
+    async def new_channel(self, prefix='specific.'):
+        # The prefix brings its own dot, as with the Redis layer: 'specific.unix!<id>'
+        return f'{prefix}unix!{uuid.uuid4().hex}'
+
+    async def flush(self):
+        await self.call('flush')
+
+    async def close(self):
+        connection = self.connections.pop(asyncio.get_running_loop(), None)
+        if connection is not None:
+            connection.close()
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        self.memberships.add((group, channel))
+        await self.call('group_add', group, channel)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), "Invalid channel name"
+        assert self.valid_group_name(group), "Invalid group name"
+        self.memberships.discard((group, channel))
+        await self.call('group_discard', group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+        await self.call('group_send', group, message)
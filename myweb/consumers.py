@@ -1,46 +1,239 @@
 # myweb/consumers.py
 
+import asyncio
+import functools
 import json
+import logging
 import socket
 import uuid
+import weakref
+from collections import deque
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from . import results
+from .broadcast import NOTIFICATIONS_GROUP, RESULTS_GROUP
+
+logger = logging.getLogger(__name__)
+
+HUB_RESTART_DELAY = 1.0  # Seconds before a failed notification hub reader subscribes again
+
+def _format_mac_address():
+    try:
+        return ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff) for elements in range(0,2*6,2)][::-1])
+    except Exception:
+        return "00:00:00:00:00:00"
+
+
+@functools.cache
+def server_mac_address():
+    """MAC address of this server, reported with every notification; computed once per process."""
+    return _format_mac_address()
+
+
+class NotificationHub:
+    """
+    Delivers the notifications group to every NotificationConsumer on this event loop.
+
+    The hub is the only member of NOTIFICATIONS_GROUP for the whole worker, so
+    a group_send costs the channel layer one message instead of one per open
+    socket. Each notification is JSON-encoded once here and handed to the
+    local consumers, which queue and batch it themselves.
+
+    The layer forgets group members after its group_expiry, so the hub joins
+    again every half of that. If the layer fails, the error is logged and the
+    hub subscribes again on a new channel.
+    """
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.rejoin_interval = getattr(channel_layer, 'group_expiry', 86400) / 2
+        self.consumers = set()
+        self.reader = None
+        self.delivered = 0
+
+    def subscribe(self, consumer):
+        self.consumers.add(consumer)
+        if self.reader is None:
+            self.reader = asyncio.ensure_future(self.read())
+
+    def unsubscribe(self, consumer):
+        self.consumers.discard(consumer)
+        if not self.consumers and self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+
+    async def read(self):
+        while True:
+            try:
+                await self.listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification hub lost its channel layer subscription; subscribing again.")
+                await asyncio.sleep(HUB_RESTART_DELAY)
+
+    async def listen(self):
+        loop = asyncio.get_running_loop()
+        channel_name = await self.channel_layer.new_channel()
+        try:
+            rejoin_at = loop.time()
+            while True:
+                if loop.time() >= rejoin_at:
+                    await self.channel_layer.group_add(NOTIFICATIONS_GROUP, channel_name)
+                    rejoin_at = loop.time() + self.rejoin_interval
+                try:
+                    event = await asyncio.wait_for(self.channel_layer.receive(channel_name), rejoin_at - loop.time())
+                except asyncio.TimeoutError:
+                    continue
+                if event.get('type') != 'send.notification':
+                    continue
+                encoded = json.dumps(event['message'])
+                for consumer in list(self.consumers):
+                    consumer.enqueue(encoded)
+                self.delivered += len(self.consumers)
+        finally:
+            await self.channel_layer.group_discard(NOTIFICATIONS_GROUP, channel_name)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_notification_hub(channel_layer):
+    """The notification hub of the running event loop."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = NotificationHub(channel_layer)
+    return hub
+
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Admin notifications socket.
+
+    Notifications are queued per connection and flushed every
+    NOTIFICATION_BATCH_INTERVAL seconds as one frame:
+    {"ip_address", "mac_address", "messages": [...], "dropped": n}. The queue
+    holds at most NOTIFICATION_QUEUE_SIZE messages; when a slow client falls
+    further behind, the oldest are dropped and counted in "dropped".
+    """
+
     async def connect(self):
-        await self.channel_layer.group_add(
-            "notifications",
-            self.channel_name
+        self.interval = getattr(settings, 'NOTIFICATION_BATCH_INTERVAL', 0.05)
+        self.queue = deque(maxlen=getattr(settings, 'NOTIFICATION_QUEUE_SIZE', 100))
+        self.dropped = 0
+        self.flush_task = None
+        # The connection's address and the server MAC never change, so the frame header is encoded once
+        ip_address = (self.scope.get('client') or ('', 0))[0]
+        self.frame_prefix = '{{"ip_address": {}, "mac_address": {}, "messages": ['.format(
+            json.dumps(ip_address), json.dumps(server_mac_address())
         )
+
+        self.hub = get_notification_hub(self.channel_layer)
+        self.hub.subscribe(self)
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            "notifications",
-            self.channel_name
-        )
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        self.hub.unsubscribe(self)
 
     async def receive(self, text_data):
-        ip_address = self.scope['client'][0]
-        mac_address = self.get_mac_address(ip_address)
-        message_data = {
-            'message': text_data,
-            'ip_address': ip_address,
-            'mac_address': mac_address
-        }
-        await self.send(text_data=json.dumps(message_data))
+        self.enqueue(json.dumps(text_data))
 
     async def send_notification(self, event):
-        message = event['message']
-        ip_address = self.scope['client'][0]
-        mac_address = self.get_mac_address(ip_address)
-        await self.send(text_data=json.dumps({
-            'message': message,
-            'ip_address': ip_address,
-            'mac_address': mac_address
-        }))
+        # Direct sends to this socket's channel; group notifications arrive through the hub
+        self.enqueue(json.dumps(event['message']))
 
     def get_mac_address(self, ip):
+        return server_mac_address()
+
+    def enqueue(self, encoded):
+        """Queue one JSON-encoded message for the next frame."""
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(encoded)
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
         try:
-            return ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff) for elements in range(0,2*6,2)][::-1])
-        except Exception as e:
-            return "00:00:00:00:00:00"
+            while self.queue:
+                await asyncio.sleep(self.interval)
+                batch = list(self.queue)
+                self.queue.clear()
+                dropped, self.dropped = self.dropped, 0
+                # Messages queued while this frame is being sent go out in the next one
+                await self.send(text_data=f'{self.frame_prefix}{", ".join(batch)}], "dropped": {dropped}}}')
+        finally:
+            self.flush_task = None
+
+
+class ResultsConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes live vote counts to the results pages.
+
+    Tally events from myweb.broadcast are merged per connection and flushed
+    at most once every RESULTS_BROADCAST_INTERVAL seconds, carrying only the
+    candidates whose counts changed since the last message.
+    """
+
+    async def connect(self):
+        self.interval = getattr(settings, 'RESULTS_BROADCAST_INTERVAL', 1.0)
+        self.sent = {}
+        self.pending = {}
+        self.pending_total = None
+        self.last_flush = 0.0
+        self.flush_task = None
+
+        await self.channel_layer.group_add(RESULTS_GROUP, self.channel_name)
+        await self.accept()
+
+        snapshot = await database_sync_to_async(results.get_snapshot)()
+        for data in snapshot['positions_with_candidates'].values():
+            for candidate in data['candidates']:
+                self.sent[candidate['id']] = candidate['votes']
+        await self.send(text_data=json.dumps({
+            'type': 'snapshot',
+            'positions': snapshot['positions_with_candidates'],
+            'total_votes': snapshot['total_votes'],
+            'total_students': snapshot['total_students'],
+        }))
+
+    async def disconnect(self, close_code):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.channel_layer.group_discard(RESULTS_GROUP, self.channel_name)
+
+    async def results_tally(self, event):
+        for candidate_id, votes in event['tallies']:
+            self.pending[candidate_id] = votes
+        self.pending_total = event.get('total_votes', self.pending_total)
+
+        if self.flush_task is None:
+            loop = asyncio.get_running_loop()
+            delay = max(0.0, self.last_flush + self.interval - loop.time())
+            self.flush_task = asyncio.ensure_future(self.flush(delay))
+
+    async def flush(self, delay):
+        await asyncio.sleep(delay)
+        self.flush_task = None
+        self.last_flush = asyncio.get_running_loop().time()
+
+        changed = [
+            {'id': candidate_id, 'votes': votes}
+            for candidate_id, votes in self.pending.items()
+            if self.sent.get(candidate_id) != votes
+        ]
+        self.pending = {}
+        if not changed:
+            return
+        for candidate in changed:
+            self.sent[candidate['id']] = candidate['votes']
+        await self.send(text_data=json.dumps({
+            'type': 'delta',
+            'candidates': changed,
+            'total_votes': self.pending_total,
+        }))
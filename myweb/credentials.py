@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, make_password
+from django.utils.crypto import get_random_string
+
+PASSWORD_LENGTH = 6
+CHUNK_SIZE = 8  # Passwords per task: enough to amortize the round trip, small enough to spread evenly
+
+
+def _init_worker(settings_module):
+    # Forked workers inherit a configured Django; spawned ones have to set it up
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash_chunk(plain_passwords, algorithm):
+    return [make_password(password, hasher=algorithm) for password in plain_passwords]
+
+
+@contextmanager
+def hashing_pool(workers=None):
+    """
+    Process pool for password hashing, or None when hashing should stay inline.
+
+    `workers` defaults to every core; 1 disables the pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        yield None
+        return
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'web.settings'),),
+    )
+    try:
+        yield executor
+    finally:
+        executor.shutdown()
+
+
+def hash_passwords(plain_passwords, executor=None):
+    """Hash `plain_passwords` with the default hasher, in order, spreading the work over `executor`."""
+    algorithm = get_hasher('default').algorithm
+    if executor is None or len(plain_passwords) <= CHUNK_SIZE:
+        return _hash_chunk(plain_passwords, algorithm)
+    chunks = [plain_passwords[i:i + CHUNK_SIZE] for i in range(0, len(plain_passwords), CHUNK_SIZE)]
+    hashes = []
+    for chunk_hashes in executor.map(_hash_chunk, chunks, repeat(algorithm)):
+        hashes.extend(chunk_hashes)
+    return hashes
+
+
+def generate_credentials(students, executor=None):
+    """
+    Give each unsaved student a random password and its hash.
+
+    Returns (student, plain_password, password_hash) tuples with
+    `student.password` already set, ready for bulk_create and the outbox.
+    """
+    plain_passwords = [get_random_string(length=PASSWORD_LENGTH) for _ in students]
+    hashes = hash_passwords(plain_passwords, executor)
+    for student, password_hash in zip(students, hashes):
+        student.password = password_hash
+    return list(zip(students, plain_passwords, hashes))
+
+
+_check_executor = None
+_check_executor_lock = threading.Lock()
+
+
+def get_check_executor():
+    """
+    Thread pool for password checks made by the async login path.
+
+    PBKDF2 releases the GIL, so a few threads keep logins off the event loop;
+    the bound (PASSWORD_CHECK_WORKERS) stops a login burst from starving the
+    threads Django uses for sync code.
+    """
+    global _check_executor
+    with _check_executor_lock:
+        if _check_executor is None:
+            _check_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PASSWORD_CHECK_WORKERS', os.cpu_count() or 1),
+                thread_name_prefix='password-check',
+            )
+    return _check_executor
+
+
+async def acheck_password(password, encoded):
+    """check_password without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_check_executor(), check_password, password, encoded)
@@ -44,6 +44,14 @@ class LoginForm(forms.Form):
 
 
 
+class VoterImportForm(forms.Form):
+    csv_file = forms.FileField(
+        label='Voter roll (CSV)',
+        help_text='Columns: name, email, reg_no and optionally phone_number, graduation_year.',
+    )
+
+
+
 class VoteForm(forms.ModelForm):
     class Meta:
         model = Vote
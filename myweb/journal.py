@@ -0,0 +1,495 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .middleware import record_task
+from .models import Student, Candidate, Vote
+from .voting import BallotError, check_ballot
+from . import broadcast, results, tallies
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATTERN = 'votes-*.jsonl'
+ARCHIVE_DIR = 'applied'  # Fully applied journals are moved here, kept for verify()
+APPEND_BATCH = 256  # Records written per fsync at most
+FLUSH_BATCH = 1000  # Records applied to the database per transaction
+FLUSH_INTERVAL = 1.0  # Seconds between flusher passes
+ROTATE_BYTES = 64 * 1024 * 1024  # Size at which the appender moves on to a new journal file
+FLUSH_TASK = 'vote_journal.flush'  # Name of the flusher's entry in the request stats
+
+_STOP = object()
+
+
+def journal_dir():
+    return Path(settings.VOTE_JOURNAL_DIR)
+
+
+def journal_files(directory=None):
+    return sorted((directory or journal_dir()).glob(JOURNAL_PATTERN))
+
+
+def archived_files(directory=None):
+    return sorted(((directory or journal_dir()) / ARCHIVE_DIR).glob(JOURNAL_PATTERN))
+
+
+def checkpoint_path(path):
+    return path.with_name(path.name + '.checkpoint')
+
+
+def read_checkpoint(path):
+    """Byte offset up to which `path` has been applied to the database."""
+    try:
+        with open(checkpoint_path(path)) as f:
+            return json.load(f)['offset']
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, offset):
+    # Written after the database commit. If it is lost, the replayed records
+    # are recognised by their keys and skipped, so it only needs to be atomic.
+    target = checkpoint_path(path)
+    temp = target.with_name(target.name + '.tmp')
+    with open(temp, 'w') as f:
+        json.dump({'offset': offset}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, target)
+
+
+def archive(path):
+    """Move a fully applied journal and its checkpoint out of the way of replay()."""
+    target = path.parent / ARCHIVE_DIR / path.name
+    target.parent.mkdir(exist_ok=True)
+    # Checkpoint first: a journal left behind without one is replayed, and its records skipped by key
+    try:
+        os.replace(checkpoint_path(path), checkpoint_path(target))
+    except FileNotFoundError:
+        pass
+    os.replace(path, target)
+
+
+def read_records(path, offset=0, limit=None, end=None):
+    """
+    Return (records, offset) for the complete records after `offset`, stopping
+    at `limit` records or at byte `end`.
+    """
+    records = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while limit is None or len(records) < limit:
+            if end is not None and offset >= end:
+                break
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                break  # End of file, or a torn final write that was never acknowledged
+            offset += len(line)
+            records.append(json.loads(line))
+    return records, offset
+
+
+def iter_records(path):
+    """Yield (offset, record) for every complete record in `path`."""
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            yield offset, json.loads(line)
+            offset += len(line)
+
+
+def make_record(student, choices):
+    return {
+        'key': uuid.uuid4().hex,
+        'student': student.pk,
+        'choices': {str(position_id): candidate_id for position_id, candidate_id in choices.items()},
+        'at': timezone.now().isoformat(),
+    }
+
+
+def apply_records(records):
+    """
+    Write journal records to the Vote table in one transaction.
+
+    Records whose key is already in the table were applied before a crash and
+    are skipped. Each vote is checked on its own, so a ballot that overlaps an
+    earlier one only loses the overlapping positions; those votes (and those
+    for a deleted candidate or student) are rejected and logged, since the
+    ballot was already acknowledged. Returns (applied, skipped, rejected),
+    counting a record as rejected when any of its votes was.
+    """
+    keys = [record['key'] for record in records]
+    done = set(Vote.objects.filter(ballot_key__in=keys).values_list('ballot_key', flat=True).distinct())
+    todo = [record for record in records if record['key'] not in done]
+    if not todo:
+        return 0, len(records), 0
+
+    student_ids = {record['student'] for record in todo}
+    students = set(Student.objects.filter(pk__in=student_ids).values_list('pk', flat=True))
+    candidates = dict(Candidate.objects.filter(
+        pk__in={candidate_id for record in todo for candidate_id in record['choices'].values()}
+    ).values_list('pk', 'position_id'))
+    taken = set(Vote.objects.filter(student_id__in=student_ids).values_list('student_id', 'position_id'))
+
+    votes = []
+    voters = set()
+    rejected = 0
+    for record in todo:
+        student_id = record['student']
+        choices = {int(position_id): candidate_id for position_id, candidate_id in record['choices'].items()}
+        valid = {
+            position_id: candidate_id for position_id, candidate_id in choices.items()
+            if student_id in students
+            and candidates.get(candidate_id) == position_id
+            and (student_id, position_id) not in taken
+        }
+        if len(valid) < len(choices):
+            rejected += 1
+            logger.error("Journal record %s: %d of %d acknowledged vote(s) rejected as no longer valid.",
+                         record['key'], len(choices) - len(valid), len(choices))
+        if not valid:
+            continue
+        taken |= {(student_id, position_id) for position_id in valid}
+        voters.add(student_id)
+        # The acknowledgement time, not the flush time, for the vote and its turnout bucket
+        timestamp = parse_datetime(record['at'])
+        votes.extend(
+            Vote(student_id=student_id, candidate_id=candidate_id, position_id=position_id,
+                 timestamp=timestamp, ballot_key=record['key'])
+            for position_id, candidate_id in valid.items()
+        )
+
+    with transaction.atomic():
+        Vote.objects.bulk_create(votes, batch_size=500)
+        tallies.record_votes(votes)
+        Student.objects.filter(pk__in=voters, has_voted=False).update(has_voted=True)
+        results.invalidate()
+        broadcast.publish_on_commit({vote.candidate_id for vote in votes})
+    return len(todo) - rejected, len(done), rejected
+
+
+def apply_file(path, batch_size=FLUSH_BATCH, end=None, on_applied=None):
+    """
+    Apply everything in `path` past its checkpoint (up to byte `end`), calling
+    `on_applied` with each batch of records once it is committed.
+    Returns (applied, skipped, rejected).
+    """
+    totals = [0, 0, 0]
+    offset = read_checkpoint(path)
+    while True:
+        records, new_offset = read_records(path, offset, batch_size, end)
+        if not records:
+            return tuple(totals)
+        for i, count in enumerate(apply_records(records)):
+            totals[i] += count
+        write_checkpoint(path, new_offset)
+        offset = new_offset
+        if on_applied is not None:
+            on_applied(records)
+
+
+def replay(directory=None, batch_size=FLUSH_BATCH):
+    """
+    Apply the journals left behind by processes that are no longer running.
+
+    A live process holds an exclusive lock on its journals, so only orphaned
+    files are touched; once applied they are archived. Returns (applied,
+    skipped, rejected).
+    """
+    totals = [0, 0, 0]
+    for path in journal_files(directory):
+        with open(path, 'rb') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            counts = apply_file(path, batch_size)
+            archive(path)
+            if any(counts):
+                logger.info("Replayed vote journal %s: %d applied, %d skipped, %d rejected.", path.name, *counts)
+            for i, count in enumerate(counts):
+                totals[i] += count
+    return tuple(totals)
+
+
+class VoteJournal:
+    """
+    Write-behind vote journal for this process.
+
+    append() returns a future that resolves once the ballot's record is
+    fsynced to this process's journal file; records that arrive together share
+    one fsync. A flusher thread first replays orphaned journals, then
+    applies this journal's durable records to the database in large batches.
+
+    Until its record is applied, a ballot reserves its (student, position)
+    pairs, so a second ballot for the same position is refused before it is
+    acknowledged rather than dropped by the flusher. Files are rotated at
+    `rotate_bytes` and archived once fully applied.
+    """
+
+    def __init__(self, directory=None, append_batch=APPEND_BATCH, flush_batch=FLUSH_BATCH,
+                 flush_interval=FLUSH_INTERVAL, rotate_bytes=ROTATE_BYTES):
+        self.directory = Path(directory or journal_dir())
+        self.append_batch = append_batch
+        self.flush_batch = flush_batch
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        # Guards the state shared between the request, appender and flusher threads below
+        self.state_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.file = None
+        self.path = None
+        self.durable_offset = 0
+        self.retired = []  # (path, file) of rotated journals not yet fully applied
+        self.reserved = {}  # (student_id, position_id) -> key of the unapplied record holding it
+        self.failure = None
+        self.threads = []
+
+    def start(self):
+        with self.lock:
+            if self.file is not None:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.open_file()
+            self.failure = None
+            self.stopping.clear()
+            self.threads = [
+                threading.Thread(target=self.append_loop, name='vote-journal-append', daemon=True),
+                threading.Thread(target=self.flush_loop, name='vote-journal-flush', daemon=True),
+            ]
+            for thread in self.threads:
+                thread.start()
+
+    def open_file(self):
+        path = self.directory / f"votes-{timezone.now():%Y%m%d%H%M%S%f}-{os.getpid()}.jsonl"
+        # Unbuffered: append_loop needs to know exactly which bytes reached the file
+        file = open(path, 'ab', buffering=0)
+        # Held until the file is archived so replay() leaves it alone
+        fcntl.flock(file, fcntl.LOCK_EX)
+        with self.state_lock:
+            self.path, self.file, self.durable_offset = path, file, file.tell()
+
+    def stop(self):
+        """Finish pending appends, apply everything durable, then close the journal."""
+        with self.lock:
+            if self.file is None:
+                return
+            self.queue.put(_STOP)
+            self.threads[0].join()
+            self.stopping.set()
+            self.threads[1].join()
+            self.file.close()
+            self.file = None
+
+    def append(self, student, choices):
+        """
+        Validate a ballot and queue its record. Raises BallotError like
+        cast_ballot, or if an unapplied ballot already holds one of its positions.
+        """
+        record = make_record(student, choices)
+        future = Future()
+        self.start()
+        pairs = [(student.pk, position_id) for position_id in choices]
+        with self.state_lock:
+            if self.failure is not None:
+                raise BallotError("Your vote could not be recorded. Please try again.")
+            if any(pair in self.reserved for pair in pairs):
+                raise BallotError("Your earlier ballot for one of these positions is still being recorded.")
+            self.reserved.update(dict.fromkeys(pairs, record['key']))
+        # Checked only once the positions are reserved: an overlapping ballot has by now
+        # either committed its votes, which the check sees, or still holds its reservation
+        try:
+            check_ballot(student, choices)
+        except Exception:
+            self.release([record])
+            raise
+        self.queue.put((json.dumps(record, separators=(',', ':')).encode() + b'\n', record, future))
+        return future
+
+    def release(self, records):
+        """Drop the reservations of records that are now applied (or were never acknowledged)."""
+        with self.state_lock:
+            for record in records:
+                for position_id in record['choices']:
+                    pair = (record['student'], int(position_id))
+                    if self.reserved.get(pair) == record['key']:
+                        del self.reserved[pair]
+
+    def append_loop(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            while len(batch) < self.append_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self.write(b''.join(line for line, _, _ in batch))
+            except Exception as e:
+                logger.exception("Vote journal append failed for %d record(s).", len(batch))
+                self.release(record for _, record, _ in batch)
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for _, record, future in batch:
+                future.set_result(record['key'])
+            if self.durable_offset >= self.rotate_bytes:
+                self.rotate()
+
+    def write(self, data):
+        """Append and fsync `data`; durable_offset only moves past bytes that are known to be on disk."""
+        if self.failure is not None:
+            raise self.failure
+        fd = self.file.fileno()
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]  # os.write may write less than asked
+            os.fsync(fd)
+        except Exception as e:
+            # Cut the unacknowledged tail off, so the next records do not follow a torn one
+            try:
+                os.ftruncate(fd, self.durable_offset)
+            except OSError:
+                logger.critical("Vote journal %s could not be truncated; refusing further ballots.", self.path)
+                with self.state_lock:
+                    self.failure = e
+            raise
+        with self.state_lock:
+            self.durable_offset += len(data)
+
+    def rotate(self):
+        try:
+            old = (self.path, self.file)
+            self.open_file()
+        except OSError:
+            logger.exception("Vote journal rotation failed; still appending to %s.", self.path)
+            return
+        with self.state_lock:
+            self.retired.append(old)
+
+    def flush(self, final=False):
+        """Apply the rotated journals and archive them, then this journal's durable records."""
+        with self.state_lock:
+            retired = list(self.retired)
+            path, end = self.path, self.durable_offset
+        for old_path, old_file in retired:
+            apply_file(old_path, self.flush_batch, on_applied=self.release)
+            archive(old_path)
+            old_file.close()
+            with self.state_lock:
+                self.retired.remove((old_path, old_file))
+        apply_file(path, self.flush_batch, end, on_applied=self.release)
+        if final and self.failure is None:
+            archive(path)
+
+    def flush_loop(self):
+        try:
+            self.run_safely(replay, self.directory, self.flush_batch)
+            while not self.stopping.wait(self.flush_interval):
+                self.run_safely(self.flush)
+            # Final pass after the appender has drained
+            self.run_safely(self.flush, True)
+        finally:
+            connection.close()
+
+    def run_safely(self, func, *args):
+        close_old_connections()
+        try:
+            # Not part of any request, so reported separately in the request stats
+            with record_task(FLUSH_TASK):
+                func(*args)
+        except Exception:
+            # Nothing is lost: the records stay in the journal past the checkpoint
+            logger.exception("Vote journal flush failed; it will be retried.")
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = VoteJournal(
+                flush_batch=getattr(settings, 'VOTE_JOURNAL_FLUSH_BATCH', FLUSH_BATCH),
+                flush_interval=getattr(settings, 'VOTE_JOURNAL_FLUSH_INTERVAL', FLUSH_INTERVAL),
+                rotate_bytes=getattr(settings, 'VOTE_JOURNAL_ROTATE_BYTES', ROTATE_BYTES),
+            )
+            atexit.register(_journal.stop)
+    return _journal
+
+
+def start_if_enabled():
+    """Called by the server entry points so orphaned journals are replayed at startup."""
+    if getattr(settings, 'VOTE_JOURNAL', False):
+        get_journal().start()
+
+
+def verify(directory=None):
+    """
+    Cross-check every journal record, live or archived, against the Vote table.
+
+    Returns a dict of counts. 'applied' records have exactly their votes in the
+    table and 'pending' ones are past the checkpoint. Everything else means the
+    journal and the table disagree: 'lost' records were acknowledged but are
+    (partly) missing from the table, whether the flusher rejected them or the
+    votes were deleted since; 'mismatched' ones have different votes under
+    their key; 'duplicate' keys appear twice; 'orphaned' counts keyed votes
+    with no journal record.
+    """
+    counts = dict.fromkeys(('records', 'applied', 'pending', 'mismatched', 'lost', 'duplicate', 'orphaned'), 0)
+
+    keyed = {}
+    for key, student_id, position_id, candidate_id in Vote.objects.filter(ballot_key__isnull=False).values_list(
+            'ballot_key', 'student_id', 'position_id', 'candidate_id').iterator(chunk_size=5000):
+        keyed.setdefault(key, set()).add((student_id, position_id, candidate_id))
+
+    seen = set()
+    for path in archived_files(directory) + journal_files(directory):
+        checkpoint = read_checkpoint(path)
+        for offset, record in iter_records(path):
+            counts['records'] += 1
+            key = record['key']
+            if key in seen:
+                counts['duplicate'] += 1
+                continue
+            seen.add(key)
+
+            student_id = record['student']
+            expected = {(student_id, int(position_id), candidate_id) for position_id, candidate_id in record['choices'].items()}
+            votes = keyed.pop(key, set())
+            if not votes and offset >= checkpoint:
+                counts['pending'] += 1
+            elif votes == expected:
+                counts['applied'] += 1
+            elif votes < expected:
+                counts['lost'] += 1
+            else:
+                counts['mismatched'] += 1
+    counts['orphaned'] = sum(len(votes) for votes in keyed.values())
+    return counts
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myweb import tallies
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-minute, per-position turnout rollups from the Vote table."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            buckets = tallies.rebuild_turnout()
+        self.stdout.write(self.style.SUCCESS(f"Turnout rollups rebuilt: {buckets} bucket(s)."))
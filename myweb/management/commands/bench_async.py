@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from .bench_election import BENCH_PASSWORD, Command as ElectionCommand, percentile
+
+MODES = ('sync', 'async')
+STEPS = ('login', 'vote_form', 'vote', 'success', 'home')
+
+SETTINGS_TEMPLATE = """\
+from web.settings import *
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1']
+DATABASES = {{'default': dict(DATABASES['default'], NAME={database!r})}}
+CACHES = {{'default': {{'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}}}}
+CHANNEL_LAYERS = {{'default': {{'BACKEND': 'channels.layers.InMemoryChannelLayer'}}}}
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+ASYNC_VIEWS = {async_views!r}
+VOTE_JOURNAL = False
+"""
+
+
+class HTTPClient:
+    """Minimal HTTP/1.1 client for one simulated browser: a fresh connection per request, cookies kept."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = {}
+
+    async def request(self, method, path, data=None):
+        body = urlencode(data or {}).encode()
+        headers = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: 127.0.0.1:{self.port}",
+            "Connection: close",
+        ]
+        if self.cookies:
+            headers.append("Cookie: " + '; '.join(f"{name}={value}" for name, value in self.cookies.items()))
+        if method == 'POST':
+            headers.append("Content-Type: application/x-www-form-urlencoded")
+            headers.append(f"Content-Length: {len(body)}")
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        try:
+            writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        head = response.split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')
+        for line in head[1:]:
+            name, _, value = line.partition(':')
+            if name.lower() == 'set-cookie':
+                for morsel in SimpleCookie(value.strip()).values():
+                    self.cookies[morsel.key] = morsel.value
+        return int(head[0].split()[1])
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the election flow (login -> vote form -> vote -> results) plus home page loads "
+        "against the ASGI app under daphne, once with the sync views and once with the "
+        "async views (ASYNC_VIEWS), and report requests/sec and latency side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=300, help="Students seeded per mode; each runs one flow.")
+        parser.add_argument('--positions', type=int, default=5)
+        parser.add_argument('--candidates', type=int, default=3, help="Candidates per position.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Concurrent simulated browsers.")
+        parser.add_argument('--home-loads', type=int, default=2, help="Home page loads per student.")
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help="Use the MD5 password hasher so login cost does not dominate the run.")
+        parser.add_argument('--mode', action='append', choices=MODES, help="Mode(s) to run; default both.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for ballot choices.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_async needs the default database to use the SQLite backend.")
+
+        overrides = {
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}},
+            'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+        }
+        if options['fast_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        old_name = connection.settings_dict['NAME']
+        old_test = dict(connection.settings_dict.get('TEST') or {})
+        report = {'config': {key: options[key] for key in (
+            'students', 'positions', 'candidates', 'concurrency', 'home_loads', 'fast_hasher')}, 'modes': {}}
+        with override_settings(**overrides):
+            for mode in options['mode'] or MODES:
+                workdir = tempfile.mkdtemp(prefix='bench_async_')
+                scratch = os.path.join(workdir, 'bench.sqlite3')
+                connection.settings_dict['TEST'] = dict(old_test, NAME=scratch)
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    ballots = ElectionCommand().seed(options)
+                    connection.close()
+                    report['modes'][mode] = self.run_mode(mode, workdir, scratch, ballots, options)
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+                    connection.settings_dict['TEST'] = old_test
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def run_mode(self, mode, workdir, database, ballots, options):
+        settings_source = SETTINGS_TEMPLATE.format(database=database, async_views=mode == 'async')
+        if options['fast_hasher']:
+            settings_source += "PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']\n"
+        with open(os.path.join(workdir, 'bench_async_settings.py'), 'w') as f:
+            f.write(settings_source)
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE='bench_async_settings',
+            PYTHONPATH=os.pathsep.join([workdir, str(settings.BASE_DIR), os.environ.get('PYTHONPATH', '')]),
+        )
+        log_path = os.path.join(workdir, 'daphne.log')
+        with open(log_path, 'wb') as log:
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'myweb.asgi:application'],
+                env=env, cwd=str(settings.BASE_DIR), stdout=log, stderr=subprocess.STDOUT,
+            )
+        try:
+            self.wait_for_port(server, port, log_path)
+            return asyncio.run(self.drive(port, ballots, options))
+        finally:
+            server.terminate()
+            server.wait()
+
+    def wait_for_port(self, server, port, log_path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                with open(log_path, errors='replace') as log:
+                    raise CommandError(f"daphne exited:\n{log.read()[-2000:]}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError("daphne did not start listening in time.")
+
+    async def drive(self, port, ballots, options):
+        samples = {step: [] for step in STEPS}
+        csrf_token = 'b' * 32  # Unmasked CSRF secrets are accepted when they match the cookie
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def request(client, step, method, path, data=None):
+            started = time.perf_counter()
+            try:
+                status = await client.request(method, path, data)
+            except OSError:
+                status = 599
+            samples[step].append((time.perf_counter() - started, status))
+            return status
+
+        async def flow(ballot):
+            reg_no, choices = ballot
+            async with semaphore:
+                client = HTTPClient(port)
+                client.cookies['csrftoken'] = csrf_token
+                status = await request(client, 'login', 'POST', '/login/', {
+                    'reg_no': reg_no, 'password': BENCH_PASSWORD, 'csrfmiddlewaretoken': csrf_token,
+                })
+                if status != 302:
+                    return
+                await request(client, 'vote_form', 'GET', '/vote/')
+                # Login rotates the CSRF secret; post the new one back
+                await request(client, 'vote', 'POST', '/vote/', dict(choices, csrfmiddlewaretoken=client.cookies['csrftoken']))
+                await request(client, 'success', 'GET', '/success/')
+                for _ in range(options['home_loads']):
+                    await request(client, 'home', 'GET', '/')
+
+        # Warm the caches and the worker's connection before timing
+        await HTTPClient(port).request('GET', '/')
+        started = time.perf_counter()
+        await asyncio.gather(*(flow(ballot) for ballot in ballots))
+        wall = time.perf_counter() - started
+
+        views = {}
+        for step, rows in samples.items():
+            latencies = sorted(row[0] for row in rows)
+            views[step] = {
+                'requests': len(rows),
+                'errors': sum(1 for row in rows if row[1] >= 400),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            }
+        total_requests = sum(view['requests'] for view in views.values())
+        return {
+            'wall_seconds': round(wall, 3),
+            'requests_per_second': round(total_requests / wall, 2) if wall else 0,
+            'views': views,
+        }
+
+    def print_report(self, report):
+        config = report['config']
+        self.stdout.write(
+            f"daphne, {config['students']} students, {config['concurrency']} concurrent browsers, "
+            f"{config['positions']} positions x {config['candidates']} candidates"
+        )
+        for mode, row in report['modes'].items():
+            self.stdout.write(f"{mode}: {row['requests_per_second']} requests/s over {row['wall_seconds']}s")
+        header = f"{'view':<10} " + ' '.join(f"{mode + ' p50':>11} {mode + ' p99':>11} {'err':>4}" for mode in report['modes'])
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for step in STEPS:
+            cells = []
+            for row in report['modes'].values():
+                view = row['views'][step]
+                cells.append(f"{view['p50_ms']:>11} {view['p99_ms']:>11} {view['errors']:>4}")
+            self.stdout.write(f"{step:<10} " + ' '.join(cells))
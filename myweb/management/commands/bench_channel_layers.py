@@ -0,0 +1,146 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from myweb.channel_broker import UnixSocketChannelLayer
+from .bench_election import percentile
+
+PING = 'bench.ping'
+PONG = 'bench.pong'
+
+
+def echo(path, count):
+    """Child process: bounce every message from PING back to PONG."""
+    async def run():
+        layer = UnixSocketChannelLayer(path=path, autostart=False, capacity=count)
+        for _ in range(count):
+            await layer.send(PONG, await layer.receive(PING))
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the Unix socket channel layer (myweb.channel_broker) with the in-memory "
+        "layer: send/receive throughput, round-trip latency, group fan-out, and for the "
+        "Unix layer a round trip between two processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help="Messages for the throughput run.")
+        parser.add_argument('--round-trips', type=int, default=2000)
+        parser.add_argument('--group-size', type=int, default=1000, help="Channels in the fan-out group.")
+        parser.add_argument('--group-sends', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        path = os.path.join(tempfile.mkdtemp(prefix='bench_channels_'), 'channels.sock')
+        capacity = max(options['messages'], options['group_sends'], options['round_trips'])
+        inmemory = InMemoryChannelLayer(capacity=capacity)
+        layers = {
+            # The in-memory layer only works within one instance
+            'inmemory': lambda: inmemory,
+            'unix': lambda: UnixSocketChannelLayer(path=path, capacity=capacity),
+        }
+        report = {'config': {key: options[key] for key in ('messages', 'round_trips', 'group_size', 'group_sends')},
+                  'layers': {}}
+        for name, factory in layers.items():
+            report['layers'][name] = asyncio.run(self.run(factory, options))
+        report['layers']['unix']['cross_process_rtt'] = self.cross_process(path, capacity, options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    async def run(self, factory, options):
+        # For the Unix layer, separate instances stand in for separate processes with their own broker connections
+        sender, receiver = factory(), factory()
+        row = {}
+
+        channel = await receiver.new_channel()
+        count = options['messages']
+
+        async def drain():
+            for _ in range(count):
+                await receiver.receive(channel)
+
+        started = time.perf_counter()
+        draining = asyncio.ensure_future(drain())
+        for i in range(count):
+            await sender.send(channel, {'type': 'bench.message', 'n': i})
+        await draining
+        row['messages_per_second'] = round(count / (time.perf_counter() - started))
+
+        ping, pong = await receiver.new_channel(), await sender.new_channel()
+
+        async def bounce():
+            for _ in range(options['round_trips']):
+                await receiver.send(pong, await receiver.receive(ping))
+
+        bouncing = asyncio.ensure_future(bounce())
+        row['rtt'] = await self.round_trips(sender, ping, pong, options['round_trips'])
+        await bouncing
+
+        members = [await receiver.new_channel() for _ in range(options['group_size'])]
+        for member in members:
+            await receiver.group_add('bench', member)
+        fanouts = []
+        for i in range(options['group_sends']):
+            started = time.perf_counter()
+            await sender.group_send('bench', {'type': 'bench.group', 'n': i})
+            await asyncio.gather(*(receiver.receive(member) for member in members))
+            fanouts.append(time.perf_counter() - started)
+        fanouts.sort()
+        row['group_fanout_p50_ms'] = round(percentile(fanouts, 50) * 1000, 2)
+        row['group_fanout_max_ms'] = round(fanouts[-1] * 1000, 2)
+
+        await sender.close()
+        await receiver.close()
+        return row
+
+    async def round_trips(self, layer, ping, pong, count):
+        samples = []
+        for i in range(count):
+            started = time.perf_counter()
+            await layer.send(ping, {'type': 'bench.ping', 'n': i})
+            await layer.receive(pong)
+            samples.append(time.perf_counter() - started)
+        samples.sort()
+        return {
+            'p50_us': round(percentile(samples, 50) * 1e6),
+            'p99_us': round(percentile(samples, 99) * 1e6),
+        }
+
+    def cross_process(self, path, capacity, options):
+        child = multiprocessing.get_context('fork').Process(target=echo, args=(path, options['round_trips']))
+        child.start()
+        try:
+            layer = UnixSocketChannelLayer(path=path, capacity=capacity)
+            return asyncio.run(self.round_trips(layer, PING, PONG, options['round_trips']))
+        finally:
+            child.join(10)
+            if child.is_alive():
+                child.terminate()
+
+    def print_report(self, report):
+        config = report['config']
+        self.stdout.write(
+            f"{config['messages']} messages, {config['round_trips']} round trips, "
+            f"group of {config['group_size']} x {config['group_sends']} sends"
+        )
+        header = f"{'layer':<10} {'msgs/s':>9} {'rtt p50 us':>11} {'rtt p99 us':>11} {'fanout p50 ms':>14} {'fanout max ms':>14}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, row in report['layers'].items():
+            self.stdout.write(
+                f"{name:<10} {row['messages_per_second']:>9} {row['rtt']['p50_us']:>11} {row['rtt']['p99_us']:>11} "
+                f"{row['group_fanout_p50_ms']:>14} {row['group_fanout_max_ms']:>14}"
+            )
+        rtt = report['layers']['unix']['cross_process_rtt']
+        self.stdout.write(f"unix layer between two processes: rtt p50 {rtt['p50_us']} us, p99 {rtt['p99_us']} us")
@@ -0,0 +1,191 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from myweb import tallies
+from myweb.models import Student, Position, Candidate
+
+BENCH_PASSWORD = 'bench-password'
+STEPS = ('login', 'vote_form', 'vote', 'success')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values))) - 1))
+    return values[index]
+
+
+class QueryCounter:
+    """connection.execute_wrapper hook counting the queries run by the current thread."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch SQLite database and drive concurrent login -> vote -> success "
+        "flows through the real URLconf, reporting throughput, latency percentiles and "
+        "SQL query counts per view."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help="Number of students to seed; each runs one flow.")
+        parser.add_argument('--positions', type=int, default=5)
+        parser.add_argument('--candidates', type=int, default=3, help="Candidates per position.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Number of worker threads.")
+        parser.add_argument('--results-polls', type=int, default=1, help="Times each student loads the results page.")
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help="Use the MD5 password hasher so login cost does not dominate the run.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for ballot choices.")
+        parser.add_argument('--keep-db', metavar='PATH', help="Keep the scratch database at PATH instead of deleting it.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_election needs the default database to use the SQLite backend.")
+
+        overrides = {
+            'DEBUG': False,
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+            'ALLOWED_HOSTS': ['testserver'],
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}},
+            'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+        }
+        if options['fast_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        scratch = options['keep_db'] or os.path.join(tempfile.mkdtemp(prefix='bench_election_'), 'bench.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        old_test = dict(connection.settings_dict.get('TEST') or {})
+        connection.settings_dict['TEST'] = dict(old_test, NAME=scratch)
+
+        with override_settings(**overrides):
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                ballots = self.seed(options)
+                report = self.run(ballots, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=bool(options['keep_db']))
+                connection.settings_dict['TEST'] = old_test
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def seed(self, options):
+        positions = Position.objects.bulk_create(
+            [Position(title=f"Position {i + 1}") for i in range(options['positions'])]
+        )
+        Candidate.objects.bulk_create([
+            Candidate(name=f"Candidate {p + 1}.{c + 1}", email=f"candidate{p}_{c}@bench.invalid", position=position)
+            for p, position in enumerate(positions)
+            for c in range(options['candidates'])
+        ])
+        # One hash shared by every seeded student; bulk_create skips Student.save and its email
+        password = make_password(BENCH_PASSWORD)
+        students = Student.objects.bulk_create([
+            Student(name=f"Student {i}", email=f"student{i}@bench.invalid", reg_no=f"BENCH/{i:06d}", password=password)
+            for i in range(options['students'])
+        ], batch_size=500)
+        tallies.record_voters(len(students))
+
+        rng = random.Random(options['seed'])
+        by_position = {}
+        for candidate_id, position_id in Candidate.objects.values_list('pk', 'position_id'):
+            by_position.setdefault(position_id, []).append(candidate_id)
+        return [
+            (student.reg_no, {f"position_{position_id}": rng.choice(ids) for position_id, ids in by_position.items()})
+            for student in students
+        ]
+
+    def run(self, ballots, options):
+        samples = {step: [] for step in STEPS}
+        lock = threading.Lock()
+        urls = {'login': reverse('login'), 'vote': reverse('vote'), 'success': reverse('success')}
+
+        def request(client, step, method, url, data=None):
+            counter = QueryCounter()
+            started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                response = getattr(client, method)(url, data or {})
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[step].append((elapsed, counter.count, response.status_code >= 400))
+            return response
+
+        def flow(ballot):
+            reg_no, choices = ballot
+            client = Client(raise_request_exception=False)
+            response = request(client, 'login', 'post', urls['login'], {'reg_no': reg_no, 'password': BENCH_PASSWORD})
+            if response.status_code != 302:
+                return
+            request(client, 'vote_form', 'get', urls['vote'])
+            request(client, 'vote', 'post', urls['vote'], choices)
+            for _ in range(options['results_polls']):
+                request(client, 'success', 'get', urls['success'])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(flow, ballots))
+        wall = time.perf_counter() - started
+
+        views = {}
+        for step, rows in samples.items():
+            latencies = sorted(row[0] for row in rows)
+            queries = [row[1] for row in rows]
+            views[step] = {
+                'requests': len(rows),
+                'errors': sum(1 for row in rows if row[2]),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                'queries_avg': round(sum(queries) / len(queries), 2) if queries else 0,
+                'queries_max': max(queries, default=0),
+            }
+        total_requests = sum(view['requests'] for view in views.values())
+        return {
+            'config': {key: options[key] for key in (
+                'students', 'positions', 'candidates', 'concurrency', 'results_polls', 'fast_hasher', 'seed'
+            )},
+            'wall_seconds': round(wall, 3),
+            'flows_per_second': round(len(ballots) / wall, 2) if wall else 0,
+            'requests_per_second': round(total_requests / wall, 2) if wall else 0,
+            'views': views,
+        }
+
+    def print_report(self, report):
+        config = report['config']
+        self.stdout.write(
+            f"{config['students']} students, {config['positions']} positions x {config['candidates']} candidates, "
+            f"{config['concurrency']} threads"
+        )
+        self.stdout.write(
+            f"Wall time {report['wall_seconds']}s: {report['flows_per_second']} flows/s, "
+            f"{report['requests_per_second']} requests/s"
+        )
+        header = f"{'view':<10} {'reqs':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'sql avg':>8} {'sql max':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for step, view in report['views'].items():
+            self.stdout.write(
+                f"{step:<10} {view['requests']:>6} {view['errors']:>6} {view['p50_ms']:>9} {view['p95_ms']:>9} "
+                f"{view['p99_ms']:>9} {view['queries_avg']:>8} {view['queries_max']:>8}"
+            )
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+
+from django.contrib.auth.hashers import check_password, get_hasher
+from django.core.management.base import BaseCommand, CommandError
+
+from myweb.credentials import hashing_pool, hash_passwords
+
+
+class Command(BaseCommand):
+    help = "Measure bulk password hashing throughput across process pool sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help="Passwords hashed per run.")
+        parser.add_argument('--workers', default=None,
+                            help="Comma-separated pool sizes to compare (default: 1, 2, 4 ... up to the core count).")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        if options['workers']:
+            try:
+                sizes = [int(size) for size in options['workers'].split(',')]
+            except ValueError:
+                raise CommandError("--workers must be a comma-separated list of integers.")
+        else:
+            sizes = [1]
+            while sizes[-1] * 2 <= cores:
+                sizes.append(sizes[-1] * 2)
+            if sizes[-1] != cores:
+                sizes.append(cores)
+
+        plain_passwords = [f"password-{i}" for i in range(options['count'])]
+
+        runs = []
+        baseline = None
+        for size in sizes:
+            with hashing_pool(size) as executor:
+                if executor is not None:
+                    # Start the workers before timing so process start-up is not counted
+                    list(executor.map(abs, range(size * 4)))
+                started = time.perf_counter()
+                hashes = hash_passwords(plain_passwords, executor)
+                elapsed = time.perf_counter() - started
+            if not check_password(plain_passwords[-1], hashes[-1]):
+                raise CommandError("Hashes produced by the pool do not verify.")
+            rate = len(hashes) / elapsed
+            baseline = baseline or rate
+            runs.append({
+                'workers': size,
+                'seconds': round(elapsed, 3),
+                'hashes_per_second': round(rate, 1),
+                'speedup': round(rate / baseline, 2),
+            })
+
+        report = {
+            'hasher': get_hasher('default').algorithm,
+            'count': len(plain_passwords),
+            'cores': cores,
+            'runs': runs,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{report['count']} {report['hasher']} hashes on {cores} core(s)")
+        self.stdout.write(f"{'workers':>8} {'seconds':>9} {'hashes/s':>10} {'speedup':>8}")
+        for run in runs:
+            self.stdout.write(
+                f"{run['workers']:>8} {run['seconds']:>9} {run['hashes_per_second']:>10} {run['speedup']:>8}x"
+            )
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import resource
+import time
+import uuid
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from myweb.broadcast import NOTIFICATIONS_GROUP
+from myweb.consumers import NotificationConsumer, get_notification_hub
+from .bench_election import percentile
+
+MODES = ('group', 'hub')
+
+
+class GroupNotificationConsumer(AsyncWebsocketConsumer):
+    """The previous NotificationConsumer: every socket in the group, one frame per notification."""
+
+    async def connect(self):
+        await self.channel_layer.group_add(NOTIFICATIONS_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(NOTIFICATIONS_GROUP, self.channel_name)
+
+    async def send_notification(self, event):
+        ip_address = self.scope['client'][0]
+        await self.send(text_data=json.dumps({
+            'message': event['message'],
+            'ip_address': ip_address,
+            'mac_address': ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff) for elements in range(0,2*6,2)][::-1]),
+        }))
+
+
+class Socket:
+    """A fake ASGI WebSocket connection that records when each notification arrives."""
+
+    def __init__(self, application, number, slow_delay=0.0):
+        self.application = application
+        self.number = number
+        self.slow_delay = slow_delay
+        self.connected = asyncio.get_running_loop().create_future()
+        self.closed = asyncio.Event()
+        self.requested = False
+        self.received = {}
+        self.frames = 0
+        self.dropped = 0
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'websocket.connect'}
+        await self.closed.wait()
+        return {'type': 'websocket.disconnect', 'code': 1000}
+
+    async def send(self, message):
+        if message['type'] == 'websocket.accept':
+            self.connected.set_result(None)
+        elif message['type'] == 'websocket.send':
+            now = time.perf_counter()
+            self.frames += 1
+            frame = json.loads(message['text'])
+            self.dropped += frame.get('dropped', 0)
+            for text in frame.get('messages', [frame.get('message')]):
+                self.received[int(text)] = now
+            if self.slow_delay:
+                # A client on a bad link: the server's send does not return until it drains
+                await asyncio.sleep(self.slow_delay)
+
+    async def run(self):
+        scope = {
+            'type': 'websocket', 'path': '/ws/notifications/', 'raw_path': b'/ws/notifications/',
+            'query_string': b'', 'headers': [(b'host', b'testserver')], 'subprotocols': [],
+            'client': ('127.0.0.1', 10000 + self.number % 50000), 'server': ('testserver', 80),
+        }
+        await self.application(scope, self.receive, self.send)
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many notification sockets inside one worker on the in-memory channel layer, "
+        "send bursts of notifications to the group and compare the previous consumer (every "
+        "socket in the group, one frame per message) with the hub-fed, batched, bounded one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=10000)
+        parser.add_argument('--bursts', type=int, default=5)
+        parser.add_argument('--burst-size', type=int, default=20, help="Notifications sent back to back per burst.")
+        parser.add_argument('--slow', type=float, default=0.01, help="Fraction of sockets that drain slowly.")
+        parser.add_argument('--slow-delay', type=float, default=0.5, help="Seconds a slow socket takes per frame.")
+        parser.add_argument('--mode', action='append', choices=MODES, help="Mode(s) to run; default both.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        report = {'config': {key: options[key] for key in ('sockets', 'bursts', 'burst_size', 'slow', 'slow_delay')},
+                  'modes': {}}
+        for mode in options['mode'] or MODES:
+            # A fresh layer per mode; capacity covers a whole burst so the group mode is not cut short
+            layers = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                                  'CONFIG': {'capacity': options['burst_size'] * 2}}}
+            with override_settings(CHANNEL_LAYERS=layers):
+                report['modes'][mode] = asyncio.run(self.run(mode, options))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    async def run(self, mode, options):
+        consumer = NotificationConsumer if mode == 'hub' else GroupNotificationConsumer
+        application = consumer.as_asgi()
+        slow_every = int(1 / options['slow']) if options['slow'] else 0
+        sockets = [
+            Socket(application, i, options['slow_delay'] if slow_every and i % slow_every == 0 else 0.0)
+            for i in range(options['sockets'])
+        ]
+        fast = [socket for socket in sockets if not socket.slow_delay]
+
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(socket.run()) for socket in sockets]
+        await asyncio.gather(*(socket.connected for socket in sockets))
+        connect_seconds = time.perf_counter() - started
+        await asyncio.sleep(0.1)  # Let the hub join the group
+
+        channel_layer = get_channel_layer()
+        cpu_before = resource.getrusage(resource.RUSAGE_SELF).ru_utime
+        latencies = []
+        missed = 0
+        number = 0
+        for _ in range(options['bursts']):
+            sent = time.perf_counter()
+            for _ in range(options['burst_size']):
+                await channel_layer.group_send(NOTIFICATIONS_GROUP, {'type': 'send.notification', 'message': str(number)})
+                number += 1
+            last = number - 1
+            deadline = sent + 30
+            while time.perf_counter() < deadline and not all(last in socket.received for socket in fast):
+                await asyncio.sleep(0.01)
+            arrivals = [socket.received[last] for socket in fast if last in socket.received]
+            missed += len(fast) - len(arrivals)
+            if arrivals:
+                latencies.append(max(arrivals) - sent)
+        cpu_seconds = resource.getrusage(resource.RUSAGE_SELF).ru_utime - cpu_before
+
+        slow = [socket for socket in sockets if socket.slow_delay]
+        row = {
+            'connect_seconds': round(connect_seconds, 2),
+            'burst_to_last_fast_socket_p50_ms': round(percentile(sorted(latencies), 50) * 1000, 1),
+            'burst_to_last_fast_socket_max_ms': round(max(latencies, default=0) * 1000, 1),
+            'missed_bursts': missed,
+            'frames_sent': sum(socket.frames for socket in sockets),
+            'cpu_seconds': round(cpu_seconds, 2),
+            'slow_sockets': len(slow),
+            'slow_messages_dropped': sum(socket.dropped for socket in slow),
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+        if mode == 'hub':
+            row['hub_deliveries'] = get_notification_hub(channel_layer).delivered
+
+        for socket in sockets:
+            socket.closed.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return row
+
+    def print_report(self, report):
+        config = report['config']
+        self.stdout.write(
+            f"{config['sockets']} sockets ({config['slow']:.0%} slow), {config['bursts']} bursts of "
+            f"{config['burst_size']} notifications, in-memory channel layer"
+        )
+        for mode, row in report['modes'].items():
+            self.stdout.write(
+                f"{mode:<6} connect {row['connect_seconds']}s | burst -> last fast socket "
+                f"p50 {row['burst_to_last_fast_socket_p50_ms']} ms, max {row['burst_to_last_fast_socket_max_ms']} ms, "
+                f"{row['missed_bursts']} missed | {row['frames_sent']} frames, {row['cpu_seconds']} CPU s | "
+                f"{row['slow_messages_dropped']} dropped for {row['slow_sockets']} slow sockets | "
+                f"max RSS {row['max_rss_mb']} MB"
+            )
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+
+from channels.db import database_sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from myweb import results, tallies
+from myweb.models import Student, Position, Candidate
+from myweb.streams import get_feed
+from myweb.voting import cast_ballot
+from .bench_election import percentile
+
+STREAM_PATH = '/results/stream/'
+
+
+class SSEClient:
+    """A fake ASGI HTTP connection that reads the results stream and records when each event id arrives."""
+
+    def __init__(self, application, number):
+        self.application = application
+        self.number = number
+        self.requested = False
+        self.closed = asyncio.Event()
+        self.received = {}
+        self.first = asyncio.get_running_loop().create_future()
+        self.status = None
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            now = time.perf_counter()
+            for line in message.get('body', b'').split(b'\n'):
+                if line.startswith(b'id: '):
+                    self.received.setdefault(int(line[4:]), now)
+            if self.received and not self.first.done():
+                self.first.set_result(now)
+
+    async def run(self):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': STREAM_PATH, 'raw_path': STREAM_PATH.encode(),
+            'query_string': b'', 'root_path': '', 'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 10000 + self.number % 50000), 'server': ('testserver', 80),
+        }
+        await self.application(scope, self.receive, self.send)
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many concurrent Server-Sent Events clients on the results stream inside one "
+        "ASGI worker (this process), cast ballots, and report connect time, fan-out latency, "
+        "memory and how many times the shared feed touched the results cache and database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=5000)
+        parser.add_argument('--updates', type=int, default=10, help="Ballots cast while the clients are connected.")
+        parser.add_argument('--interval', type=float, default=0.25, help="RESULTS_FEED_INTERVAL for the run.")
+        parser.add_argument('--positions', type=int, default=5)
+        parser.add_argument('--candidates', type=int, default=3, help="Candidates per position.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_sse needs the default database to use the SQLite backend.")
+
+        scratch = os.path.join(tempfile.mkdtemp(prefix='bench_sse_'), 'bench.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        old_test = dict(connection.settings_dict.get('TEST') or {})
+        connection.settings_dict['TEST'] = dict(old_test, NAME=scratch)
+        overrides = {
+            'DEBUG': False,
+            'ALLOWED_HOSTS': ['testserver'],
+            'RESULTS_FEED_INTERVAL': options['interval'],
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}},
+            'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+        }
+        with override_settings(**overrides):
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                ballots = self.seed(options)
+                connection.close()
+                report = asyncio.run(self.run(ballots, options))
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                connection.settings_dict['TEST'] = old_test
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def seed(self, options):
+        positions = Position.objects.bulk_create(
+            [Position(title=f"Position {i + 1}") for i in range(options['positions'])]
+        )
+        candidates = Candidate.objects.bulk_create([
+            Candidate(name=f"Candidate {p + 1}.{c + 1}", email=f"candidate{p}_{c}@bench.invalid", position=position)
+            for p, position in enumerate(positions)
+            for c in range(options['candidates'])
+        ])
+        students = Student.objects.bulk_create([
+            Student(name=f"Student {i}", email=f"student{i}@bench.invalid", reg_no=f"BENCH/{i:06d}", password='!')
+            for i in range(options['updates'])
+        ])
+        tallies.record_voters(len(students))
+        return [
+            (student, {position.pk: candidates[p * options['candidates'] + i % options['candidates']].pk
+                       for p, position in enumerate(positions)})
+            for i, student in enumerate(students)
+        ]
+
+    async def run(self, ballots, options):
+        from myweb.asgi import application
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        clients = [SSEClient(application, i) for i in range(options['clients'])]
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(client.run()) for client in clients]
+        await asyncio.gather(*(client.first for client in clients))
+        connect_seconds = time.perf_counter() - started
+        feed = get_feed()
+
+        latencies = []
+        missed = 0
+        for student, choices in ballots:
+            await database_sync_to_async(cast_ballot)(student, choices)
+            committed = time.perf_counter()
+            version = await database_sync_to_async(results.current_version)()
+            deadline = committed + options['interval'] * 4 + 5
+            while time.perf_counter() < deadline and not all(version in client.received for client in clients):
+                await asyncio.sleep(0.01)
+            arrivals = [client.received[version] for client in clients if version in client.received]
+            missed += len(clients) - len(arrivals)
+            if arrivals:
+                latencies.append(max(arrivals) - committed)
+
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        for client in clients:
+            client.closed.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        latencies.sort()
+        return {
+            'config': {key: options[key] for key in ('clients', 'updates', 'interval', 'positions', 'candidates')},
+            'connect_seconds': round(connect_seconds, 2),
+            'non_200': sum(1 for client in clients if client.status != 200),
+            'fanout_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'fanout_max_ms': round(max(latencies, default=0) * 1000, 1),
+            'missed_deliveries': missed,
+            'feed_polls': feed.polls,
+            'feed_snapshot_loads': feed.loads,
+            'max_rss_mb_before': round(rss_before / 1024, 1),
+            'max_rss_mb_after': round(rss_after / 1024, 1),
+        }
+
+    def print_report(self, report):
+        config = report['config']
+        self.stdout.write(
+            f"{config['clients']} SSE clients on one worker, {config['updates']} ballots, "
+            f"feed interval {config['interval']}s"
+        )
+        self.stdout.write(f"All clients had their snapshot after {report['connect_seconds']}s ({report['non_200']} non-200)")
+        self.stdout.write(
+            f"Commit -> last client received the delta: p50 {report['fanout_p50_ms']} ms, "
+            f"max {report['fanout_max_ms']} ms, {report['missed_deliveries']} missed"
+        )
+        self.stdout.write(
+            f"Shared feed: {report['feed_polls']} version polls, {report['feed_snapshot_loads']} snapshot loads "
+            f"for all clients together"
+        )
+        self.stdout.write(f"Max RSS {report['max_rss_mb_before']} MB -> {report['max_rss_mb_after']} MB")
@@ -0,0 +1,172 @@
+import json
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from myweb import tallies
+from myweb.models import Student, Position, Candidate, Vote
+from myweb.vote_writer import VoteWriter
+from myweb.voting import BallotError, cast_ballot
+from .bench_election import percentile
+
+MODES = ('baseline', 'tuned', 'writer')
+
+
+class Command(BaseCommand):
+    help = (
+        "Cast ballots from concurrent threads against a scratch SQLite file and compare "
+        "votes/sec for the old write path (default SQLite settings, one transaction per "
+        "request thread), the production SQLite profile alone, and the profile plus the "
+        "batching vote writer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ballots', type=int, default=2000, help="Ballots cast per mode (one per student).")
+        parser.add_argument('--positions', type=int, default=5)
+        parser.add_argument('--candidates', type=int, default=3, help="Candidates per position.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Number of request threads.")
+        parser.add_argument('--mode', action='append', choices=MODES, help="Mode(s) to run; default all.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_votes needs the default database to use the SQLite backend.")
+
+        production_options = dict(settings.DATABASES['default'].get('OPTIONS') or {})
+        old_name = connection.settings_dict['NAME']
+        old_test = dict(connection.settings_dict.get('TEST') or {})
+        old_options = connection.settings_dict.get('OPTIONS')
+        overrides = {
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}},
+            'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+        }
+
+        report = {'config': {key: options[key] for key in ('ballots', 'positions', 'candidates', 'concurrency')},
+                  'modes': {}}
+        with override_settings(**overrides):
+            for mode in options['mode'] or MODES:
+                # Each mode gets a fresh file, since WAL mode sticks to the file once set
+                scratch = os.path.join(tempfile.mkdtemp(prefix='bench_votes_'), 'bench.sqlite3')
+                connection.settings_dict['TEST'] = dict(old_test, NAME=scratch)
+                connection.settings_dict['OPTIONS'] = {} if mode == 'baseline' else production_options
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    ballots = self.seed(options)
+                    report['modes'][mode] = self.run(mode, ballots, options)
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+                    connection.settings_dict['TEST'] = old_test
+                    connection.settings_dict['OPTIONS'] = old_options
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def seed(self, options):
+        positions = Position.objects.bulk_create(
+            [Position(title=f"Position {i + 1}") for i in range(options['positions'])]
+        )
+        candidates = Candidate.objects.bulk_create([
+            Candidate(name=f"Candidate {p + 1}.{c + 1}", email=f"candidate{p}_{c}@bench.invalid", position=position)
+            for p, position in enumerate(positions)
+            for c in range(options['candidates'])
+        ])
+        students = Student.objects.bulk_create([
+            Student(name=f"Student {i}", email=f"student{i}@bench.invalid", reg_no=f"BENCH/{i:06d}", password='!')
+            for i in range(options['ballots'])
+        ], batch_size=500)
+        tallies.record_voters(len(students))
+
+        rng = random.Random(options['seed'])
+        by_position = {}
+        for candidate in candidates:
+            by_position.setdefault(candidate.position_id, []).append(candidate.pk)
+        return [
+            (student, {position_id: rng.choice(ids) for position_id, ids in by_position.items()})
+            for student in students
+        ]
+
+    def run(self, mode, ballots, options):
+        pending = queue.Queue()
+        for ballot in ballots:
+            pending.put(ballot)
+        samples = []
+        errors = {}
+        lock = threading.Lock()
+        writer = VoteWriter() if mode == 'writer' else None
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        student, choices = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    started = time.perf_counter()
+                    error = None
+                    try:
+                        if writer is not None:
+                            writer.submit(student, choices).result()
+                        else:
+                            cast_ballot(student, choices)
+                    except BallotError as e:
+                        error = f"BallotError: {e}"
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        if error is None:
+                            samples.append(elapsed)
+                        else:
+                            errors[error] = errors.get(error, 0) + 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if writer is not None:
+            writer.stop()
+        wall = time.perf_counter() - started
+
+        latencies = sorted(samples)
+        return {
+            'wall_seconds': round(wall, 3),
+            'ballots_ok': len(samples),
+            'ballots_failed': sum(errors.values()),
+            'votes_recorded': Vote.objects.count(),
+            'votes_per_second': round(len(samples) * options['positions'] / wall, 1) if wall else 0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'errors': errors,
+        }
+
+    def print_report(self, report):
+        config = report['config']
+        self.stdout.write(
+            f"{config['ballots']} ballots x {config['positions']} positions, {config['concurrency']} threads"
+        )
+        header = f"{'mode':<10} {'ok':>6} {'failed':>6} {'votes/s':>9} {'p50 ms':>9} {'p99 ms':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for mode, row in report['modes'].items():
+            self.stdout.write(
+                f"{mode:<10} {row['ballots_ok']:>6} {row['ballots_failed']:>6} {row['votes_per_second']:>9} "
+                f"{row['p50_ms']:>9} {row['p99_ms']:>9}"
+            )
+        for mode, row in report['modes'].items():
+            for error, count in row['errors'].items():
+                self.stdout.write(f"  {mode}: {count} x {error}")
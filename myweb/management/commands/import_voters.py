@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myweb.importers import VoterImportError, import_voters
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a CSV voter roll (columns: name, email, reg_no and optionally "
+        "phone_number, graduation_year). Already registered rows are skipped, "
+        "so the command can simply be rerun after a partial failure."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Students inserted per transaction.")
+        parser.add_argument('--user-id', type=int, default=1, help="Admin user recorded in the audit log.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processes used to hash passwords (default: every core, 1 for inline).")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as csv_file:
+                report = import_voters(
+                    csv_file, chunk_size=options['chunk_size'], user_id=options['user_id'], workers=options['workers']
+                )
+        except (OSError, VoterImportError) as e:
+            raise CommandError(str(e))
+
+        for error in report.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(str(report)))
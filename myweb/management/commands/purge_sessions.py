@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myweb.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in small chunks so the purge never holds the "
+        "database writer for long (an incremental alternative to clearsessions)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help="Sessions deleted per statement.")
+        parser.add_argument('--pause', type=float, default=0.05, help="Seconds to sleep between chunks.")
+        parser.add_argument('--max-chunks', type=int, default=None, help="Stop after this many chunks.")
+
+    def handle(self, *args, **options):
+        model = SessionStore.get_model_class()
+        now = timezone.now()
+        deleted = chunks = 0
+        while options['max_chunks'] is None or chunks < options['max_chunks']:
+            keys = list(
+                model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:options['chunk_size']]
+            )
+            if not keys:
+                break
+            deleted += model.objects.filter(session_key__in=keys).delete()[0]
+            chunks += 1
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired session(s) in {chunks} chunk(s)."))
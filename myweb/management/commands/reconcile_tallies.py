@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myweb import tallies
+
+
+class Command(BaseCommand):
+    help = "Rebuild the vote tallies and the registered voter count from the Vote and Student tables."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = tallies.reconcile()
+        if drifted:
+            self.stdout.write(self.style.WARNING(f"Corrected {drifted} drifted candidate tally(ies)."))
+        self.stdout.write(self.style.SUCCESS("Vote counters reconciled."))
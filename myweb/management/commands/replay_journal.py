@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from myweb import journal
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply vote journals left behind by server processes that are no longer running. "
+        "Safe to run at any time: live journals are skipped and applied records are not written twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=journal.FLUSH_BATCH,
+                            help="Records applied per transaction.")
+
+    def handle(self, *args, **options):
+        applied, skipped, rejected = journal.replay(batch_size=options['batch_size'])
+        if rejected:
+            self.stdout.write(self.style.WARNING(
+                f"Rejected votes from {rejected} acknowledged ballot(s) that are no longer valid; see the log."
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed vote journals: {applied} ballot(s) applied, {skipped} already in the database."
+        ))
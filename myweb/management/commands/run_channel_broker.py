@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myweb import channel_broker
+
+LAYER_BACKEND = 'myweb.channel_broker.UnixSocketChannelLayer'
+CONFIG_KEYS = ('expiry', 'group_expiry', 'capacity', 'channel_capacity')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the Unix socket channel broker in the foreground, for deployments that "
+        "supervise it separately instead of letting the first worker start it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default', help="CHANNEL_LAYERS entry to serve.")
+
+    def handle(self, *args, **options):
+        layer = settings.CHANNEL_LAYERS.get(options['alias'], {})
+        if layer.get('BACKEND') != LAYER_BACKEND:
+            raise CommandError(f"CHANNEL_LAYERS[{options['alias']!r}] does not use {LAYER_BACKEND}.")
+        config = dict(layer.get('CONFIG') or {})
+        path = config.get('path') or channel_broker.default_path()
+        self.stdout.write(f"Channel broker listening on {path}")
+        if not channel_broker.serve_forever(path, **{key: config[key] for key in CONFIG_KEYS if key in config}):
+            raise CommandError(f"Another broker already serves {path}.")
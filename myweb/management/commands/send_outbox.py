@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myweb import outbox
+
+MAX_RETRY_DELAY = 300  # Seconds between attempts at most while the mail server is down
+
+
+class Command(BaseCommand):
+    help = "Send queued outbox emails in batches over one reused mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Emails claimed per batch.")
+        parser.add_argument('--rate', type=float, default=5.0, help="Maximum emails per second (0 for no limit).")
+        parser.add_argument('--max-attempts', type=int, default=5, help="Give up on an email after this many failures.")
+        parser.add_argument('--backoff', type=int, default=30, help="Base retry delay in seconds; doubles per failure.")
+        parser.add_argument('--loop', action='store_true', help="Keep running and poll for new emails.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to wait between polls with --loop.")
+
+    def handle(self, *args, **options):
+        delay = options['interval']
+        while True:
+            try:
+                sent, failed = outbox.drain(
+                    batch_size=options['batch_size'],
+                    max_attempts=options['max_attempts'],
+                    rate=options['rate'] or None,
+                    backoff=options['backoff'],
+                )
+            except OSError as e:  # smtplib's errors included
+                if not options['loop']:
+                    raise
+                # The mail server is unreachable: keep the worker alive and back off
+                self.stderr.write(f"Mail server unavailable ({e}); retrying in {delay:.0f}s.")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            delay = options['interval']
+            if sent or failed or options['verbosity'] > 1:
+                self.stdout.write(f"Sent {sent} email(s), {failed} failed.")
+            if not options['loop']:
+                break
+            if not (sent or failed):
+                time.sleep(options['interval'])
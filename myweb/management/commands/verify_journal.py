@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myweb import journal
+
+
+class Command(BaseCommand):
+    help = "Check that every vote journal record is reflected in the Vote table, and vice versa."
+
+    def handle(self, *args, **options):
+        counts = journal.verify()
+        self.stdout.write(
+            f"{counts['records']} journal record(s): {counts['applied']} applied, {counts['pending']} pending."
+        )
+        problems = {name: counts[name] for name in ('mismatched', 'lost', 'duplicate', 'orphaned') if counts[name]}
+        if problems:
+            raise CommandError(
+                "Journal and vote table disagree: " + ', '.join(f"{count} {name}" for name, count in problems.items())
+            )
+        self.stdout.write(self.style.SUCCESS("Journal and vote table agree."))
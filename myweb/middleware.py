@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+
+import django
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+DJANGO_DIR = os.path.dirname(django.__file__)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _call_site():
+    """Innermost stack frame that belongs to project code rather than Django or a library."""
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        filename = frame.filename
+        if filename == __file__ or filename.startswith(DJANGO_DIR) or 'site-packages' in filename:
+            continue
+        return f"{filename}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class QueryRecorder:
+    """connection.execute_wrapper hook timing every query of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if self.slowest is None or duration > self.slowest['duration']:
+                # Only the slowest query so far pays for the stack walk
+                self.slowest = {'sql': sql, 'duration': duration, 'call_site': _call_site()}
+
+
+def _record(name, total, recorder):
+    with _stats_lock:
+        entry = _stats.setdefault(name, {
+            'requests': 0, 'total_ms': 0.0, 'db_ms': 0.0, 'queries': 0,
+            'max_ms': 0.0, 'max_queries': 0, 'slowest_query': None,
+        })
+        entry['requests'] += 1
+        entry['total_ms'] += total * 1000
+        entry['db_ms'] += recorder.duration * 1000
+        entry['queries'] += recorder.count
+        entry['max_ms'] = max(entry['max_ms'], total * 1000)
+        entry['max_queries'] = max(entry['max_queries'], recorder.count)
+        slowest = recorder.slowest
+        if slowest and (entry['slowest_query'] is None or slowest['duration'] * 1000 > entry['slowest_query']['ms']):
+            entry['slowest_query'] = {
+                'sql': slowest['sql'],
+                'ms': round(slowest['duration'] * 1000, 3),
+                'call_site': slowest['call_site'],
+            }
+
+
+@contextmanager
+def record_task(name):
+    """
+    Add the queries of background work done for many requests at once (the
+    vote journal flusher) to the stats under `name`, when instrumentation is on.
+    """
+    if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+        yield
+        return
+    recorder = QueryRecorder()
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+    if recorder.count:
+        _record(name, time.perf_counter() - started, recorder)
+
+
+def get_request_stats():
+    """Per-URL-name aggregates collected so far in this process."""
+    with _stats_lock:
+        report = {}
+        for name, entry in _stats.items():
+            requests = entry['requests']
+            report[name] = {
+                'requests': requests,
+                'avg_ms': round(entry['total_ms'] / requests, 3),
+                'avg_db_ms': round(entry['db_ms'] / requests, 3),
+                'avg_view_ms': round((entry['total_ms'] - entry['db_ms']) / requests, 3),
+                'avg_queries': round(entry['queries'] / requests, 2),
+                'max_ms': round(entry['max_ms'], 3),
+                'max_queries': entry['max_queries'],
+                'slowest_query': entry['slowest_query'],
+            }
+        return report
+
+
+def reset_request_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Opt-in per-request SQL and timing instrumentation.
+
+    Enabled with REQUEST_INSTRUMENTATION = True. Each response gets
+    Server-Timing headers for database, view and total time, and the figures
+    are aggregated per URL name (see get_request_stats). Works without
+    DEBUG because queries are timed through connection.execute_wrapper.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        match = request.resolver_match
+        name = match.view_name if match else 'unresolved'
+        _record(name, total, recorder)
+
+        db_ms = recorder.duration * 1000
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.3f};desc="{recorder.count} queries"',
+            f'view;dur={total * 1000 - db_ms:.3f}',
+            f'total;dur={total * 1000:.3f}',
+        ])
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-18 03:31
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Student = apps.get_model('myweb', 'Student')
+    Candidate = apps.get_model('myweb', 'Candidate')
+    Vote = apps.get_model('myweb', 'Vote')
+    ElectionStats = apps.get_model('myweb', 'ElectionStats')
+
+    counts = Vote.objects.filter(candidate=OuterRef('pk')).values('candidate').annotate(
+        count=Count('pk')
+    ).values('count')
+    Candidate.objects.update(votes=Coalesce(Subquery(counts), 0))
+    ElectionStats.objects.update_or_create(pk=1, defaults={
+        'registered_voters': Student.objects.count(),
+        'total_votes': Vote.objects.count(),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0017_candidate_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ElectionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registered_voters', models.PositiveIntegerField(default=0)),
+                ('total_votes', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'election stats',
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
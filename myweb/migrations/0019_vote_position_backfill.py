@@ -0,0 +1,59 @@
+import logging
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+# Copies of the votes dropped as duplicates. Reversing the migration leaves the table for an operator to drop.
+BACKUP_TABLE = 'myweb_vote_duplicates_0019'
+
+
+def backfill_vote_position(apps, schema_editor):
+    Candidate = apps.get_model('myweb', 'Candidate')
+    Vote = apps.get_model('myweb', 'Vote')
+    ElectionStats = apps.get_model('myweb', 'ElectionStats')
+
+    Vote.objects.update(
+        position=Subquery(Candidate.objects.filter(pk=OuterRef('candidate_id')).values('position_id')[:1])
+    )
+
+    # Keep only the earliest vote per (student, position) so the unique constraint can be added.
+    # The others are copied to a backup table first, for an operator to review.
+    later = 'EXISTS (SELECT 1 FROM myweb_vote e WHERE e.student_id = v.student_id AND e.position_id = v.position_id AND e.id < v.id)'
+    duplicates = Vote.objects.values('student_id', 'position_id').annotate(count=Count('pk')).filter(count__gt=1)
+    if duplicates.exists():
+        before = Vote.objects.count()
+        if BACKUP_TABLE in schema_editor.connection.introspection.table_names():
+            schema_editor.execute(f'INSERT INTO {BACKUP_TABLE} SELECT * FROM myweb_vote v WHERE {later}')
+        else:
+            schema_editor.execute(f'CREATE TABLE {BACKUP_TABLE} AS SELECT * FROM myweb_vote v WHERE {later}')
+        schema_editor.execute(f'DELETE FROM myweb_vote WHERE id IN (SELECT id FROM {BACKUP_TABLE})')
+        logger.warning(
+            "Removed %d duplicate vote(s) for the one-vote-per-position constraint; they are kept in %s.",
+            before - Vote.objects.count(), BACKUP_TABLE,
+        )
+
+    counts = Vote.objects.filter(candidate=OuterRef('pk')).values('candidate').annotate(
+        count=Count('pk')
+    ).values('count')
+    Candidate.objects.update(votes=Coalesce(Subquery(counts), 0))
+    ElectionStats.objects.update(total_votes=Vote.objects.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0018_electionstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='position',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='myweb.position'),
+        ),
+        migrations.RunPython(backfill_vote_position, migrations.RunPython.noop),
+    ]
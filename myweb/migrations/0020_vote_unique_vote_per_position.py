@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0019_vote_position_backfill'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='position',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='myweb.position'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='vote',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('student', 'position'), name='unique_vote_per_position'),
+        ),
+    ]
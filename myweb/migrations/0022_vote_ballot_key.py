@@ -0,0 +1,22 @@
+# Generated by Django 5.1 on 2026-10-18 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0021_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='ballot_key',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(condition=models.Q(('ballot_key__isnull', False)), fields=['ballot_key'], name='vote_ballot_key_idx'),
+        ),
+    ]
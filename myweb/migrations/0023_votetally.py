@@ -0,0 +1,132 @@
+# Generated by Django 5.1 on 2026-10-18 03:53
+
+import django.db.models.deletion
+from django.db import NotSupportedError, migrations, models
+
+# Rebuilds the tally from the votes already cast; every candidate gets a row.
+BACKFILL = """
+    INSERT INTO myweb_votetally (candidate_id, position_id, votes)
+    SELECT c.id, c.position_id, COUNT(v.id)
+    FROM myweb_candidate c LEFT JOIN myweb_vote v ON v.candidate_id = c.id
+    GROUP BY c.id, c.position_id
+"""
+
+SQLITE_FORWARD = [
+    """
+    CREATE TABLE myweb_votetally (
+        candidate_id bigint NOT NULL PRIMARY KEY REFERENCES myweb_candidate (id) ON DELETE CASCADE,
+        position_id bigint NOT NULL,
+        votes integer NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX myweb_votetally_position_idx ON myweb_votetally (position_id)",
+    BACKFILL,
+    """
+    CREATE TRIGGER myweb_vote_tally_insert AFTER INSERT ON myweb_vote
+    BEGIN
+        INSERT INTO myweb_votetally (candidate_id, position_id, votes) VALUES (NEW.candidate_id, NEW.position_id, 1)
+        ON CONFLICT (candidate_id) DO UPDATE SET votes = votes + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER myweb_vote_tally_delete AFTER DELETE ON myweb_vote
+    BEGIN
+        UPDATE myweb_votetally SET votes = votes - 1 WHERE candidate_id = OLD.candidate_id;
+    END
+    """,
+    """
+    CREATE TRIGGER myweb_vote_tally_update AFTER UPDATE OF candidate_id ON myweb_vote
+    WHEN OLD.candidate_id <> NEW.candidate_id
+    BEGIN
+        UPDATE myweb_votetally SET votes = votes - 1 WHERE candidate_id = OLD.candidate_id;
+        INSERT INTO myweb_votetally (candidate_id, position_id, votes) VALUES (NEW.candidate_id, NEW.position_id, 1)
+        ON CONFLICT (candidate_id) DO UPDATE SET votes = votes + 1;
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS myweb_vote_tally_update",
+    "DROP TRIGGER IF EXISTS myweb_vote_tally_delete",
+    "DROP TRIGGER IF EXISTS myweb_vote_tally_insert",
+    "DROP TABLE IF EXISTS myweb_votetally",
+]
+
+POSTGRESQL_FORWARD = [
+    """
+    CREATE TABLE myweb_votetally (
+        candidate_id bigint NOT NULL PRIMARY KEY REFERENCES myweb_candidate (id) ON DELETE CASCADE,
+        position_id bigint NOT NULL,
+        votes integer NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX myweb_votetally_position_idx ON myweb_votetally (position_id)",
+    BACKFILL,
+    """
+    CREATE FUNCTION myweb_vote_tally() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE myweb_votetally SET votes = votes - 1 WHERE candidate_id = OLD.candidate_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO myweb_votetally (candidate_id, position_id, votes) VALUES (NEW.candidate_id, NEW.position_id, 1)
+            ON CONFLICT (candidate_id) DO UPDATE SET votes = myweb_votetally.votes + 1;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER myweb_vote_tally_insert_delete AFTER INSERT OR DELETE ON myweb_vote
+    FOR EACH ROW EXECUTE FUNCTION myweb_vote_tally()
+    """,
+    """
+    CREATE TRIGGER myweb_vote_tally_update AFTER UPDATE OF candidate_id ON myweb_vote
+    FOR EACH ROW WHEN (OLD.candidate_id IS DISTINCT FROM NEW.candidate_id) EXECUTE FUNCTION myweb_vote_tally()
+    """,
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP TRIGGER IF EXISTS myweb_vote_tally_update ON myweb_vote",
+    "DROP TRIGGER IF EXISTS myweb_vote_tally_insert_delete ON myweb_vote",
+    "DROP FUNCTION IF EXISTS myweb_vote_tally()",
+    "DROP TABLE IF EXISTS myweb_votetally",
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_FORWARD, SQLITE_REVERSE),
+    'postgresql': (POSTGRESQL_FORWARD, POSTGRESQL_REVERSE),
+}
+
+
+def run_statements(index):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor not in STATEMENTS:
+            raise NotSupportedError(f"The trigger-maintained vote tally has no {vendor} variant.")
+        for statement in STATEMENTS[vendor][index]:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0022_vote_ballot_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteTally',
+            fields=[
+                ('candidate', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='tally', serialize=False, to='myweb.candidate')),
+                ('position', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='myweb.position')),
+                ('votes', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'myweb_votetally',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(run_statements(0), run_statements(1)),
+    ]
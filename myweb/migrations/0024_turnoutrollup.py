@@ -0,0 +1,42 @@
+# Generated by Django 5.1 on 2026-10-18 03:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMinute
+
+
+def backfill_rollups(apps, schema_editor):
+    Vote = apps.get_model('myweb', 'Vote')
+    TurnoutRollup = apps.get_model('myweb', 'TurnoutRollup')
+
+    buckets = Vote.objects.annotate(minute=TruncMinute('timestamp')).values('minute', 'position_id').annotate(
+        count=Count('pk')
+    ).order_by()
+    TurnoutRollup.objects.bulk_create(
+        [TurnoutRollup(minute=row['minute'], position_id=row['position_id'], votes=row['count']) for row in buckets],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0023_votetally'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoutRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('votes', models.IntegerField(default=0)),
+                ('position', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myweb.position')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('minute', 'position'), name='unique_turnout_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Case-insensitive prefix indexes for the admin searches ('^field' lookups), in the
+# form each backend's istartswith can use: LIKE against a NOCASE index on SQLite,
+# UPPER(column) LIKE UPPER(%s) with pattern ops on PostgreSQL.
+COLUMNS = [
+    ('myweb_student', 'reg_no'),
+    ('myweb_student', 'email'),
+    ('myweb_student', 'name'),
+]
+
+INDEX_SQL = {
+    'sqlite': 'CREATE INDEX {table}_{column}_ci ON {table} ({column} COLLATE NOCASE)',
+    'postgresql': 'CREATE INDEX {table}_{column}_ci ON {table} (UPPER({column}::text) text_pattern_ops)',
+}
+
+
+def create_indexes(apps, schema_editor):
+    sql = INDEX_SQL.get(schema_editor.connection.vendor)
+    if sql is None:
+        return  # Only a speed-up; other backends search without it
+    for table, column in COLUMNS:
+        schema_editor.execute(sql.format(table=table, column=column))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in INDEX_SQL:
+        return
+    for table, column in COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_ci')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0024_turnoutrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
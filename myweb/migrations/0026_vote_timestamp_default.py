@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-18 05:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0025_search_indexes'),
+    ]
+
+    # The column is unchanged (both defaults live in Python), and altering it on
+    # SQLite would rebuild myweb_vote without the tally triggers from 0023.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='vote',
+                    name='timestamp',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1 on 2026-10-18 05:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0026_vote_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='candidate',
+            name='votes',
+        ),
+        migrations.RemoveField(
+            model_name='electionstats',
+            name='total_votes',
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# The admin searches are substring (icontains) lookups again, which no B-tree index
+# serves. PostgreSQL gets trigram indexes in the UPPER(column) LIKE UPPER(%s) form
+# Django generates; SQLite has no equivalent, so there the searched student, candidate
+# and position tables are scanned (see QueryPlanTests) and 0025's prefix indexes,
+# which nothing uses any more, are dropped.
+COLUMNS = [
+    ('myweb_student', 'reg_no'),
+    ('myweb_student', 'email'),
+    ('myweb_student', 'name'),
+    ('myweb_candidate', 'name'),
+    ('myweb_position', 'title'),
+]
+PREFIX_COLUMNS = COLUMNS[:3]
+
+PREFIX_INDEX_SQL = {
+    'sqlite': 'CREATE INDEX {table}_{column}_ci ON {table} ({column} COLLATE NOCASE)',
+    'postgresql': 'CREATE INDEX {table}_{column}_ci ON {table} (UPPER({column}::text) text_pattern_ops)',
+}
+TRIGRAM_INDEX_SQL = 'CREATE INDEX {table}_{column}_trgm ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+
+
+def replace_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in PREFIX_INDEX_SQL:
+        return
+    for table, column in PREFIX_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_ci')
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, column in COLUMNS:
+            schema_editor.execute(TRIGRAM_INDEX_SQL.format(table=table, column=column))
+
+
+def restore_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in PREFIX_INDEX_SQL:
+        return
+    if vendor == 'postgresql':
+        for table, column in COLUMNS:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+    for table, column in PREFIX_COLUMNS:
+        schema_editor.execute(PREFIX_INDEX_SQL[vendor].format(table=table, column=column))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0027_remove_duplicate_vote_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_indexes, restore_indexes),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+import myweb.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myweb', '0028_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electionstats',
+            name='results_version',
+            field=models.PositiveBigIntegerField(default=myweb.models.results_version_seed),
+        ),
+    ]
@@ -1,6 +1,10 @@
 # models.py
-from django.db import models
-from django.core.mail import send_mail
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils.crypto import get_random_string
@@ -8,7 +12,16 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
 
-class CustomUserManager(BaseUserManager):
+class StudentQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Bulk updates skip post_save, so drop the cached request users they change here
+        from .auth_backends import CACHED_USER_FIELDS, invalidate_cached_users
+        if getattr(settings, 'STUDENT_USER_CACHE', False) and set(kwargs) & set(CACHED_USER_FIELDS):
+            invalidate_cached_users(list(self.values_list('pk', flat=True)))
+        return super().update(**kwargs)
+
+
+class CustomUserManager(BaseUserManager.from_queryset(StudentQuerySet)):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError('The Email field must be set')
@@ -59,13 +72,21 @@ class Student(AbstractBaseUser, PermissionsMixin):
         return f"{self.name} - {self.reg_no}"
 
     def save(self, *args, **kwargs):
+        plain_password = None
         if not self.password:
             plain_password = get_random_string(length=6)
             self.password = make_password(plain_password)
-            self.send_password_email(plain_password)
-        super(Student, self).save(*args, **kwargs)
+        # The account row and its outbox email commit together or not at all
+        with transaction.atomic():
+            super(Student, self).save(*args, **kwargs)
+            if plain_password:
+                self.send_password_email(plain_password)
 
     def send_password_email(self, plain_password):
+        self.password_email(plain_password).save()
+
+    def password_email(self, plain_password):
+        """Build, without saving, the outbox email carrying the account's login details."""
         subject = "Your Voting Account Details"
         message = f"""
         Dear {self.name},
@@ -78,12 +99,30 @@ class Student(AbstractBaseUser, PermissionsMixin):
         Best regards,
         Research Coordination Office
         """
-        send_mail(
-            subject,
-            message,
-            'smwondha@miu.ac.ug',
-            [self.email],
-            fail_silently=False,
+        return OutboxEmail(
+            subject=subject,
+            body=message,
+            from_email='smwondha@miu.ac.ug',
+            recipients=[self.email],
+        )
+
+    def status_email(self):
+        """Build, without saving, the outbox email telling the student they can vote."""
+        subject = "Your Voting Status Update"
+        message = f"""
+        Dear {self.name},
+
+        Your registration as a voter has been approved successfully. You can now log in to vote.
+        Check your email for login details.
+
+        Best regards,
+        Research Coordination Office
+        """
+        return OutboxEmail(
+            subject=subject,
+            body=message,
+            from_email='smwondha@miu.ac.ug',
+            recipients=[self.email],
         )
 
 
@@ -99,47 +138,151 @@ class Candidate(models.Model):
     email = models.EmailField(max_length=100, unique=True)
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     position = models.ForeignKey(Position, on_delete=models.CASCADE)
-    votes = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='candidate_images/', blank=True, null=True)
 
     def __str__(self):
         return f"{self.name} - {self.position.title}"
 
+    def clean(self):
+        # Votes carry the position they were cast for; moving the candidate would leave them behind
+        if self.pk is not None and self.vote_set.exclude(position_id=self.position_id).exists():
+            raise ValidationError({'position': "This candidate already has votes and cannot move to another position."})
+
     def get_vote_count(self):
         """Returns the count of votes for this candidate."""
-        return Vote.objects.filter(candidate=self).count()
+        tally = VoteTally.objects.filter(candidate=self).values_list('votes', flat=True).first()
+        return tally or 0  # No row until the candidate's first vote
 
 
 class Vote(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Denormalized from candidate.position so the database can enforce one vote per position
+    position = models.ForeignKey(Position, on_delete=models.CASCADE, editable=False)
+    # A default rather than auto_now_add so journal replays keep the time the ballot was acknowledged
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    # Idempotency key of the journal record this vote came from (see myweb.journal)
+    ballot_key = models.CharField(max_length=32, null=True, blank=True, editable=False)
 
     class Meta:
-        unique_together = ('student', 'candidate')
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'position'], name='unique_vote_per_position'),
+        ]
+        indexes = [
+            models.Index(fields=['ballot_key'], name='vote_ballot_key_idx', condition=models.Q(ballot_key__isnull=False)),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.candidate_id is not None:
+            # Follow the candidate, also when an admin edit points the vote at another one
+            self.position_id = self.candidate.position_id
+        super(Vote, self).save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.student.name} voted for {self.candidate.name} in {self.candidate.position.title}"
 
 
-@receiver(post_save, sender=Student)
-def send_voter_update_email(sender, instance, **kwargs):
-    if instance.is_active and not instance.has_voted:
-        subject = "Your Voting Status Update"
-        message = f"""
-        Dear {instance.name},
+class VoteTally(models.Model):
+    """
+    Per-candidate vote count kept exact by AFTER INSERT/UPDATE/DELETE triggers on
+    myweb_vote (migration 0023), so raw SQL, admin deletes and bulk imports are
+    counted too. Candidates without votes may not have a row yet.
+    """
+    candidate = models.OneToOneField(Candidate, on_delete=models.DO_NOTHING, primary_key=True, related_name='tally')
+    position = models.ForeignKey(Position, on_delete=models.DO_NOTHING, related_name='+')
+    votes = models.IntegerField(default=0)
 
-        Your registration as a voter has been approved successfully. You can now log in to vote.
-        Check your email for login details.
+    class Meta:
+        managed = False
+        db_table = 'myweb_votetally'
 
-        Best regards,
-        Research Coordination Office
+    def __str__(self):
+        return f"{self.candidate_id}: {self.votes} votes"
+
+
+class TurnoutRollup(models.Model):
+    """Votes cast per minute and position, kept up to date by myweb.tallies for the turnout chart."""
+    minute = models.DateTimeField()
+    position = models.ForeignKey(Position, on_delete=models.CASCADE)
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index behind time-range queries, which filter on the leading column
+            models.UniqueConstraint(fields=['minute', 'position'], name='unique_turnout_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.minute:%Y-%m-%d %H:%M}: {self.votes} votes"
+
+
+def results_version_seed():
+    # Seeded from the clock so a recreated stats row never reuses a version still in a shared cache
+    return int(time.time() * 1000)
+
+
+class ElectionStats(models.Model):
+    """
+    Single-row table holding the registered voter counter maintained by
+    myweb.tallies and the results version bumped by myweb.results.
+    """
+    registered_voters = models.PositiveIntegerField(default=0)
+    results_version = models.PositiveBigIntegerField(default=results_version_seed)
+
+    class Meta:
+        verbose_name_plural = 'election stats'
+
+    def __str__(self):
+        return f"{self.registered_voters} registered voters"
+
+    @classmethod
+    def load(cls):
+        stats, _ = cls.objects.get_or_create(pk=1)
+        return stats
+
+
+class OutboxEmailManager(models.Manager):
+    def queue(self, subject, message, from_email, recipient_list):
         """
+        Store an email for the send_outbox worker instead of sending it inline.
 
-        send_mail(
-            subject,
-            message,
-            'smwondha@miu.ac.ug',
-            [instance.email],
-            fail_silently=False,
+        The row is written in the caller's transaction, so the email is only
+        sent if that transaction commits.
+        """
+        return self.create(
+            subject=subject,
+            body=message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=list(recipient_list),
         )
+
+
+class OutboxEmail(models.Model):
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    objects = OutboxEmailManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sent_at', 'next_attempt_at'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)}"
+
+
+@receiver(post_save, sender=Student)
+def send_voter_update_email(sender, instance, update_fields=None, **kwargs):
+    # login() saves last_login on every sign-in; that is not a status change
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    if instance.is_active and not instance.has_voted:
+        instance.status_email().save()
@@ -0,0 +1,94 @@
+import time
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+CLAIM_LEASE = timedelta(minutes=5)  # How long a claimed batch is hidden from other workers
+
+
+def _backoff(attempts, base, maximum):
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), maximum))
+
+
+def claim_batch(batch_size, max_attempts):
+    """Reserve up to `batch_size` due emails so concurrent workers do not send them twice."""
+    now = timezone.now()
+    with transaction.atomic():
+        pending = OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+            sent_at__isnull=True, next_attempt_at__lte=now, attempts__lt=max_attempts,
+        ).order_by('next_attempt_at', 'pk')
+        batch = list(pending[:batch_size])
+        if batch:
+            OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt_at=now + CLAIM_LEASE
+            )
+    return batch
+
+
+def drain(batch_size=50, max_attempts=5, rate=None, backoff=30, max_backoff=3600, connection=None, limit=None):
+    """
+    Send due outbox emails over one reused mail connection.
+
+    `rate` caps messages per second. A failed message is retried with
+    exponential backoff until it has been attempted `max_attempts` times.
+    Returns a (sent, failed) tuple. Connection errors that cannot be retried
+    within the run (the mail server is down) are raised, after recording
+    what was already sent.
+    """
+    connection = connection or get_connection(fail_silently=False)
+    interval = 1.0 / rate if rate else 0.0
+    sent = failed = 0
+    last_send = 0.0
+
+    connection.open()
+    try:
+        while limit is None or sent + failed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - sent - failed)
+            batch = claim_batch(size, max_attempts)
+            if not batch:
+                break
+
+            delivered = []
+            unsent = {email.pk for email in batch}
+            try:
+                for email in batch:
+                    if interval:
+                        wait = last_send + interval - time.monotonic()
+                        if wait > 0:
+                            time.sleep(wait)
+                        last_send = time.monotonic()
+                    message = EmailMessage(email.subject, email.body, email.from_email, email.recipients,
+                                           connection=connection)
+                    try:
+                        connection.send_messages([message])
+                    except Exception as e:
+                        unsent.discard(email.pk)
+                        email.attempts += 1
+                        email.last_error = str(e)
+                        email.next_attempt_at = timezone.now() + _backoff(email.attempts, backoff, max_backoff)
+                        email.save(update_fields=['attempts', 'last_error', 'next_attempt_at'])
+                        failed += 1
+                        # The server may have dropped us; start the rest of the run on a fresh connection
+                        connection.close()
+                        connection.open()
+                    else:
+                        unsent.discard(email.pk)
+                        delivered.append(email.pk)
+            finally:
+                # Record what went out even if the reconnect failed, so it is never sent twice,
+                # and hand the rest of the batch back instead of leaving it leased
+                if delivered:
+                    OutboxEmail.objects.filter(pk__in=delivered).update(
+                        sent_at=timezone.now(), attempts=F('attempts') + 1, last_error=''
+                    )
+                    sent += len(delivered)
+                if unsent:
+                    OutboxEmail.objects.filter(pk__in=unsent).update(next_attempt_at=timezone.now())
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,23 @@
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+
+class TableCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over large tables, without a COUNT(*) of the whole table.
+
+    The unfiltered list is counted by `table_count`, a cheap exact counter
+    kept by the application (see myweb.tallies). Filtered lists are counted
+    exactly, so every page of a large filter result can be reached; the
+    filters and searches narrow the count through their indexes.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, table_count=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.table_count = table_count
+
+    @cached_property
+    def count(self):
+        if self.table_count is not None and not self.object_list.query.where:
+            return self.table_count()
+        return super().count
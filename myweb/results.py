@@ -0,0 +1,203 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Candidate, ElectionStats
+
+SNAPSHOT_KEY = 'results:snapshot'
+LOCK_KEY = 'results:lock:{}'
+TALLIES_KEY = 'results:tallies:{}'
+
+SNAPSHOT_TIMEOUT = 60 * 60 * 24  # Staleness is decided by the version in the database, not by expiry
+LOCK_TIMEOUT = 10  # Seconds a recompute may hold the lock before another worker takes over
+LOCK_POLL_INTERVAL = 0.05
+TALLIES_TIMEOUT = 60 * 15  # How far back ?since= deltas can reach
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESULTS_CACHE_ALIAS', 'default')]
+
+
+def _stats():
+    # Always the primary: a lagging replica would hand out an old version for new results
+    return ElectionStats.objects.using(DEFAULT_DB_ALIAS).filter(pk=1)
+
+
+def current_version():
+    """
+    The results version, kept in ElectionStats so that every worker agrees on
+    it whatever the cache backend. One primary key read.
+    """
+    version = _stats().values_list('results_version', flat=True).first()
+    return version if version is not None else ElectionStats.load().results_version
+
+
+def invalidate():
+    """
+    Mark every cached results snapshot as stale. Call inside the transaction
+    that changes the results: the version is bumped with an F() increment, so
+    it commits or rolls back together with the change.
+    """
+    if not _stats().update(results_version=F('results_version') + 1):
+        ElectionStats.load()
+        _stats().update(results_version=F('results_version') + 1)
+
+
+def _snapshot_candidates():
+    # Always read the primary: a snapshot built from a lagging replica would be
+    # cached under the new version and stay stale until the next vote.
+    # Counts come from the trigger-maintained tally table, exact however the votes were written.
+    # The version and voter counter ride along in the same statement, so they match the counts.
+    return Candidate.objects.using(DEFAULT_DB_ALIAS).select_related('position').annotate(
+        tally_votes=Coalesce('tally__votes', 0),
+        results_version=Subquery(_stats().values('results_version')),
+        registered_voters=Subquery(_stats().values('registered_voters')),
+    ).order_by('position_id', 'pk')
+
+
+def build_snapshot():
+    """
+    Compute the grouped results structure rendered by `home` and `success`,
+    labelled with the results version its counts were read at.
+    """
+    candidates = list(_snapshot_candidates())
+    if candidates and candidates[0].results_version is not None:
+        version, registered_voters = candidates[0].results_version, candidates[0].registered_voters
+    else:
+        stats = ElectionStats.load()
+        version, registered_voters = stats.results_version, stats.registered_voters
+
+    positions_with_candidates = {}
+    total_votes = 0
+    for candidate in candidates:
+        position_title = candidate.position.title
+        if position_title not in positions_with_candidates:
+            positions_with_candidates[position_title] = {'candidates': [], 'total_votes': 0}
+        positions_with_candidates[position_title]['candidates'].append({
+            'id': candidate.pk,
+            'name': candidate.name,
+            'votes': candidate.tally_votes,
+        })
+        positions_with_candidates[position_title]['total_votes'] += candidate.tally_votes
+        total_votes += candidate.tally_votes
+
+    return {
+        'version': version,
+        'positions_with_candidates': positions_with_candidates,
+        'total_students': registered_voters,
+        'total_votes': total_votes,
+    }
+
+
+# get_snapshot and aget_snapshot share everything past the version read:
+# they differ only in how they call these helpers and how they sleep.
+
+def _is_current(snapshot, version):
+    # A snapshot built after a later commit is newer than the version read, not stale
+    return snapshot is not None and snapshot['version'] >= version
+
+
+def _store(cache, version):
+    """Build and cache a snapshot of at least `version`, then release its recompute lock."""
+    try:
+        snapshot = build_snapshot()
+        cache.set(SNAPSHOT_KEY, snapshot, timeout=SNAPSHOT_TIMEOUT)
+        # Kept per version so API clients can ask for what changed since theirs
+        cache.set(TALLIES_KEY.format(snapshot['version']), candidate_votes(snapshot), timeout=TALLIES_TIMEOUT)
+    finally:
+        cache.delete(LOCK_KEY.format(version))
+    return snapshot
+
+
+def _refresh(cache, version, stale):
+    """
+    Rebuild the snapshot if this worker wins the recompute lock, otherwise
+    keep serving the stale one. None means there is nothing to serve yet and
+    the caller has to wait for the lock holder with _poll.
+
+    The lock only saves duplicate work: on a cache whose add() is not atomic
+    two workers may both rebuild, which costs a query but serves nothing stale.
+    """
+    if cache.add(LOCK_KEY.format(version), 1, timeout=LOCK_TIMEOUT):
+        return _store(cache, version)
+    return stale
+
+
+def _poll(cache, version):
+    snapshot = cache.get(SNAPSHOT_KEY)
+    return snapshot if _is_current(snapshot, version) else None
+
+
+def get_snapshot():
+    """
+    Return the results snapshot for the current version.
+
+    The common case is one primary key read of the version and one cache
+    read. After an invalidation only the worker holding the recompute lock
+    builds the snapshot; the others keep serving the previous one until the
+    new one is stored.
+    """
+    cache = get_cache()
+    version = current_version()
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if _is_current(snapshot, version):
+        return snapshot
+
+    snapshot = _refresh(cache, version, snapshot)
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while snapshot is None and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        snapshot = _poll(cache, version)
+    # A lock holder that never finished leaves it to us
+    return snapshot if snapshot is not None else _store(cache, version)
+
+
+async def aget_snapshot():
+    """
+    get_snapshot for the async views. The cache hit stays on the event loop;
+    the version read and the rare refresh run the same sync helpers in a
+    thread, and waiting for another worker's rebuild does not block the loop.
+    """
+    cache = get_cache()
+    version = await sync_to_async(current_version)()
+    snapshot = await cache.aget(SNAPSHOT_KEY)
+    if _is_current(snapshot, version):
+        return snapshot
+
+    snapshot = await sync_to_async(_refresh)(cache, version, snapshot)
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while snapshot is None and time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        snapshot = await sync_to_async(_poll)(cache, version)
+    return snapshot if snapshot is not None else await sync_to_async(_store)(cache, version)
+
+
+def candidate_votes(snapshot):
+    return {
+        candidate['id']: candidate['votes']
+        for data in snapshot['positions_with_candidates'].values()
+        for candidate in data['candidates']
+    }
+
+
+def changed_since(snapshot, version):
+    """
+    Candidates whose count differs between `snapshot` and the snapshot of
+    `version`, as [{'id', 'votes'}]. None when that version is unknown or
+    expired, or candidates were added or removed since, so a full copy is needed.
+    """
+    previous = get_cache().get(TALLIES_KEY.format(version))
+    current = candidate_votes(snapshot)
+    if previous is None or previous.keys() != current.keys():
+        return None
+    return [
+        {'id': candidate_id, 'votes': votes}
+        for candidate_id, votes in current.items()
+        if previous[candidate_id] != votes
+    ]
@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'results'
+RECENT_WRITE_COOKIE = 'recent_write'
+
+# Only election data is read from the replica; sessions, auth (students are the
+# users) and the admin log must see writes made moments ago (e.g. a login
+# followed by a redirect).
+REPLICA_MODELS = {
+    'myweb.position', 'myweb.candidate', 'myweb.vote', 'myweb.electionstats', 'myweb.turnoutrollup',
+}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.settings
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route ORM reads made inside the block to the results replica (when one is configured)."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_results_replica(view):
+    """
+    View decorator: read from the results replica for GET/HEAD requests.
+
+    Requests from a browser that has just written (see mark_recent_write)
+    stay on the primary so they see their own vote. Works on sync and async
+    views; the async ORM carries the setting into its worker threads.
+    """
+    if iscoroutinefunction(view):
+        async def wrapper(request, *args, **kwargs):
+            enabled = request.method in ('GET', 'HEAD') and RECENT_WRITE_COOKIE not in request.COOKIES
+            with replica_reads(enabled):
+                return await view(request, *args, **kwargs)
+        return markcoroutinefunction(wraps(view)(wrapper))
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        enabled = request.method in ('GET', 'HEAD') and RECENT_WRITE_COOKIE not in request.COOKIES
+        with replica_reads(enabled):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def mark_recent_write(response):
+    """Keep this browser's reads on the primary for the read-your-own-writes window."""
+    response.set_cookie(
+        RECENT_WRITE_COOKIE, '1',
+        max_age=getattr(settings, 'RESULTS_REPLICA_RYOW_SECONDS', 10),
+        httponly=True, samesite='Lax',
+    )
+    return response
+
+
+class ReplicaChangeListMixin:
+    """
+    ModelAdmin mixin: serve changelist GETs from the results replica.
+
+    Admin writes (forms, deletes, bulk actions) set the read-your-own-writes
+    cookie, so the changelist the admin is redirected to reads the primary.
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        enabled = request.method == 'GET' and RECENT_WRITE_COOKIE not in request.COOKIES
+        with replica_reads(enabled):
+            response = super().changelist_view(request, extra_context)
+        return self._mark_write(request, response)
+
+    def changeform_view(self, request, *args, **kwargs):
+        return self._mark_write(request, super().changeform_view(request, *args, **kwargs))
+
+    def delete_view(self, request, *args, **kwargs):
+        return self._mark_write(request, super().delete_view(request, *args, **kwargs))
+
+    def _mark_write(self, request, response):
+        if request.method == 'POST':
+            mark_recent_write(response)
+        return response
+
+
+class ResultsReplicaRouter:
+    """
+    Sends reads made under use_results_replica / replica_reads to the
+    'results' database and everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and model._meta.label_lower in REPLICA_MODELS and replica_configured():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data, so objects from either side may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is kept in sync by replication, never migrated directly
+        return db != REPLICA_ALIAS
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .consumers import NotificationConsumer, ResultsConsumer
+
+websocket_urlpatterns = [
+    path('ws/notifications/', NotificationConsumer.as_asgi()),
+    path('ws/results/', ResultsConsumer.as_asgi()),
+]
@@ -0,0 +1,82 @@
+import hashlib
+from datetime import timedelta
+
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.utils import timezone
+
+
+class SessionStore(DBStore):
+    """
+    Database sessions that skip writes when nothing changed.
+
+    On save, the session data is compared with what was loaded and the write
+    is skipped when they match, so requests that merely touch the session
+    (e.g. re-setting the same value) do not take the database writer lock.
+    A skipped write would also skip extending the expiry, so once less than
+    half of the session's lifetime is left the write goes ahead anyway.
+
+    There is deliberately no cache in front: a per-process cache would keep
+    serving a session in the other workers after a logout deleted the row.
+    """
+
+    _loaded_digest = None
+    _loaded_expiry = None
+
+    def _digest(self, data):
+        return hashlib.sha1(self.serializer().dumps(data)).digest()
+
+    def _get_session_from_db(self):
+        s = super()._get_session_from_db()
+        self._loaded_expiry = s.expire_date if s else None
+        return s
+
+    async def _aget_session_from_db(self):
+        s = await super()._aget_session_from_db()
+        self._loaded_expiry = s.expire_date if s else None
+        return s
+
+    def load(self):
+        data = super().load()
+        if self.session_key is not None:
+            self._loaded_digest = self._digest(data)
+        return data
+
+    async def aload(self):
+        data = await super().aload()
+        if self.session_key is not None:
+            self._loaded_digest = self._digest(data)
+        return data
+
+    def _unchanged(self, must_create, expiry_age):
+        return (
+            not must_create
+            and self.session_key is not None
+            and self._loaded_digest is not None
+            and self._loaded_expiry is not None
+            and self._loaded_expiry - timezone.now() > timedelta(seconds=expiry_age / 2)
+            and self._digest(self._get_session(no_load=True)) == self._loaded_digest
+        )
+
+    def _saved(self, expiry):
+        self._loaded_digest = self._digest(self._get_session(no_load=True))
+        self._loaded_expiry = expiry
+
+    def save(self, must_create=False):
+        if self._unchanged(must_create, self.get_expiry_age()):
+            return
+        super().save(must_create=must_create)
+        self._saved(self.get_expiry_date())
+
+    async def asave(self, must_create=False):
+        if self._unchanged(must_create, await self.aget_expiry_age()):
+            return
+        await super().asave(must_create=must_create)
+        self._saved(await self.aget_expiry_date())
+
+    def create(self):
+        self._loaded_digest = self._loaded_expiry = None
+        super().create()
+
+    async def acreate(self):
+        self._loaded_digest = self._loaded_expiry = None
+        await super().acreate()
@@ -1,9 +1,10 @@
-# signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.admin.models import LogEntry, ADDITION
 from django.contrib.contenttypes.models import ContentType
-from .models import Student
+from .models import Student, Position, Candidate, Vote
+from . import broadcast, results, tallies, voting
+from .auth_backends import invalidate_cached_user
 
 @receiver(post_save, sender=Student)
 def notify_admin_new_student(sender, instance, created, **kwargs):
@@ -17,3 +18,58 @@ def notify_admin_new_student(sender, instance, created, **kwargs):
             change_message=f'A new student "{instance.name}" with registration number "{instance.reg_no}" has been added.'
         )
 
+@receiver(post_save, sender=Student)
+def count_new_student(sender, instance, created, **kwargs):
+    if created:
+        tallies.record_voters(1)
+        results.invalidate()
+
+@receiver(post_delete, sender=Student)
+def count_deleted_student(sender, instance, **kwargs):
+    tallies.record_voters(-1)
+    results.invalidate()
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def drop_cached_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+# Votes written with bulk_create (the vote view) update the turnout rollups themselves;
+# these keep them right for votes added, edited or deleted one at a time, e.g. from the admin.
+# The per-candidate counts need neither: the VoteTally triggers see every write.
+@receiver(pre_save, sender=Vote)
+def remember_vote_placement(sender, instance, using, **kwargs):
+    # An admin edit may point the vote at another candidate, even one in another position
+    instance._placement = None if instance._state.adding else (
+        Vote.objects.using(using).filter(pk=instance.pk).values_list('candidate_id', 'position_id').first()
+    )
+
+@receiver(post_save, sender=Vote)
+def count_new_vote(sender, instance, created, **kwargs):
+    if created:
+        tallies.record_votes([instance])
+        results.invalidate()
+        broadcast.publish_on_commit([instance.candidate_id])
+        return
+    placement = getattr(instance, '_placement', None)
+    if placement is not None and placement != (instance.candidate_id, instance.position_id):
+        candidate_id, position_id = placement
+        if position_id != instance.position_id:
+            tallies.move_vote(instance, position_id)
+        results.invalidate()
+        broadcast.publish_on_commit([candidate_id, instance.candidate_id])
+
+@receiver(post_delete, sender=Vote)
+def count_deleted_vote(sender, instance, **kwargs):
+    tallies.discard_votes([instance])
+    results.invalidate()
+    broadcast.publish_on_commit([instance.candidate_id])
+
+# Candidate and position edits change what the results pages and the ballot show
+@receiver(post_save, sender=Position)
+@receiver(post_delete, sender=Position)
+@receiver(post_save, sender=Candidate)
+@receiver(post_delete, sender=Candidate)
+def invalidate_results(sender, **kwargs):
+    results.invalidate()
+    voting.invalidate_ballot()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from . import results
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_INTERVAL = 15  # Seconds between comment lines that keep idle proxies from closing the stream
+
+
+def sse_event(event, data, event_id=None):
+    """Encode one Server-Sent Events message."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def _load_if_changed(version):
+    # One version read per poll; the snapshot is only fetched (usually from the cache) on a change
+    if results.current_version() == version:
+        return None
+    return results.get_snapshot()
+
+
+class ResultsFeed:
+    """
+    One results change feed shared by every SSE client on this event loop.
+
+    A single poller checks the results version every RESULTS_FEED_INTERVAL
+    seconds while anyone is listening. On a change it encodes the snapshot
+    and the delta against the previous snapshot once, and wakes all clients,
+    so N clients cost one poll and one json.dumps per update, not N.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.listeners = 0
+        self.poller = None
+        self.version = None
+        self.previous_version = None
+        self.votes = None
+        self.snapshot_message = None
+        self.delta_message = None
+        self.polls = 0
+        self.loads = 0
+        self.ready = asyncio.Event()
+        self.updated = asyncio.get_running_loop().create_future()
+
+    def publish(self, snapshot):
+        self.loads += 1
+        previous = self.votes
+        self.votes = results.candidate_votes(snapshot)
+        self.previous_version, self.version = self.version, snapshot['version']
+        self.snapshot_message = sse_event('snapshot', {
+            'positions': snapshot['positions_with_candidates'],
+            'total_votes': snapshot['total_votes'],
+            'total_students': snapshot['total_students'],
+        }, self.version)
+        if previous and previous.keys() == self.votes.keys():
+            self.delta_message = sse_event('delta', {
+                'candidates': [
+                    {'id': candidate_id, 'votes': votes}
+                    for candidate_id, votes in self.votes.items()
+                    if previous[candidate_id] != votes
+                ],
+                'total_votes': snapshot['total_votes'],
+            }, self.version)
+        else:
+            # Candidates were added or removed: everyone needs the full snapshot
+            self.delta_message = None
+        self.ready.set()
+        updated, self.updated = self.updated, asyncio.get_running_loop().create_future()
+        updated.set_result(None)
+
+    async def poll(self):
+        while True:
+            self.polls += 1
+            try:
+                snapshot = await database_sync_to_async(_load_if_changed)(self.version)
+            except Exception:
+                logger.exception("Results feed poll failed.")
+            else:
+                if snapshot is not None and snapshot['version'] != self.version:
+                    self.publish(snapshot)
+            await asyncio.sleep(self.interval)
+
+    async def stream(self):
+        """Async iterator of SSE messages for one client: a snapshot, then deltas."""
+        self.listeners += 1
+        if self.poller is None:
+            self.poller = asyncio.ensure_future(self.poll())
+        try:
+            await self.ready.wait()
+            version = self.version
+            yield self.snapshot_message
+            while True:
+                if self.version == version:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(self.updated), KEEPALIVE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        yield b': keepalive\n\n'
+                        continue
+                if self.previous_version == version and self.delta_message is not None:
+                    yield self.delta_message
+                else:
+                    # Missed an update while busy: resync with the full snapshot
+                    yield self.snapshot_message
+                version = self.version
+        finally:
+            self.listeners -= 1
+            if not self.listeners and self.poller is not None:
+                self.poller.cancel()
+                self.poller = None
+                self.ready.clear()
+                self.version = self.votes = None
+
+
+_feeds = weakref.WeakKeyDictionary()
+
+
+def get_feed():
+    """The results feed of the running event loop."""
+    loop = asyncio.get_running_loop()
+    feed = _feeds.get(loop)
+    if feed is None:
+        feed = _feeds[loop] = ResultsFeed(getattr(settings, 'RESULTS_FEED_INTERVAL', 1.0))
+    return feed
@@ -0,0 +1,111 @@
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncMinute
+
+from .models import Student, Candidate, Vote, VoteTally, ElectionStats, TurnoutRollup
+from . import results
+
+
+def _adjust_stats(**deltas):
+    ElectionStats.objects.update(**{
+        field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items()
+    })
+
+
+def _turnout_buckets(votes):
+    return Counter((vote.timestamp.replace(second=0, microsecond=0), vote.position_id) for vote in votes)
+
+
+def _adjust_turnout(deltas):
+    # Upsert so the first vote of a minute creates its bucket; one statement per (minute, position)
+    table = TurnoutRollup._meta.db_table
+    rows = [
+        (connection.ops.adapt_datetimefield_value(minute), position_id, delta)
+        for (minute, position_id), delta in deltas.items() if delta
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (minute, position_id, votes) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (minute, position_id) DO UPDATE SET votes = {table}.votes + excluded.votes",
+            rows,
+        )
+
+
+def record_votes(votes):
+    """
+    Add newly inserted votes to the turnout rollups. Call inside the insert's
+    transaction. Vote counts need no call: the VoteTally triggers keep them.
+    """
+    if votes:
+        _adjust_turnout(_turnout_buckets(votes))
+
+
+def discard_votes(votes):
+    """Remove deleted votes from the turnout rollups."""
+    if votes:
+        _adjust_turnout({bucket: -count for bucket, count in _turnout_buckets(votes).items()})
+
+
+def move_vote(vote, previous_position_id):
+    """Move an edited vote's turnout bucket from the position it was in to its current one."""
+    minute = vote.timestamp.replace(second=0, microsecond=0)
+    _adjust_turnout({(minute, previous_position_id): -1, (minute, vote.position_id): 1})
+
+
+def record_voters(count):
+    """Adjust the registered voter counter by `count` (negative for removals)."""
+    if count:
+        _adjust_stats(registered_voters=count)
+
+
+def registered_voters():
+    """Number of students, read from the election stats counter instead of counting the Student table."""
+    return ElectionStats.objects.values_list('registered_voters', flat=True).first() or 0
+
+
+def total_votes():
+    """Number of votes cast, read from the trigger-maintained tally table instead of counting the Vote table."""
+    return VoteTally.objects.aggregate(total=Coalesce(Sum('votes'), 0))['total']
+
+
+def reconcile():
+    """
+    Rebuild the vote tallies and the registered voter counter from the Vote
+    and Student tables.
+
+    Returns the number of candidates whose tally had drifted.
+    """
+    actual = Vote.objects.filter(candidate=OuterRef('pk')).values('candidate').annotate(
+        count=Count('pk')
+    ).values('count')
+    candidates = Candidate.objects.annotate(
+        actual=Coalesce(Subquery(actual), 0), tallied=Coalesce('tally__votes', 0)
+    )
+    drifted = candidates.exclude(actual=F('tallied')).count()
+    VoteTally.objects.all().delete()
+    VoteTally.objects.bulk_create(
+        VoteTally(candidate_id=candidate_id, position_id=position_id, votes=votes)
+        for candidate_id, position_id, votes in candidates.values_list('pk', 'position_id', 'actual')
+    )
+
+    stats = ElectionStats.load()
+    stats.registered_voters = Student.objects.count()
+    stats.save(update_fields=['registered_voters'])
+    results.invalidate()
+    return drifted
+
+
+def rebuild_turnout(batch_size=1000):
+    """Recompute the per-minute turnout rollups from the Vote table. Returns the number of buckets."""
+    buckets = Vote.objects.annotate(minute=TruncMinute('timestamp')).values('minute', 'position_id').annotate(
+        count=Count('pk')
+    ).order_by()
+    TurnoutRollup.objects.all().delete()
+    rollups = TurnoutRollup.objects.bulk_create(
+        (TurnoutRollup(minute=row['minute'], position_id=row['position_id'], votes=row['count'])
+         for row in buckets.iterator()),
+        batch_size=batch_size,
+    )
+    return len(rollups)
@@ -1,3 +1,1487 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from io import StringIO
+from smtplib import SMTPException, SMTPServerDisconnected
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+
+from . import async_views
+from .asgi import application
+from .broadcast import NOTIFICATIONS_GROUP, RESULTS_GROUP
+from .auth_backends import StudentBackend
+from .channel_broker import UnixSocketChannelLayer
+from .credentials import hashing_pool
+from .importers import VoterImportError, import_voters
+from .middleware import get_request_stats, reset_request_stats
+from .models import Student, Position, Candidate, Vote, VoteTally, ElectionStats, OutboxEmail, TurnoutRollup
+from . import broadcast, journal, outbox, results, tallies, vote_writer
+from .sessions import SessionStore
+from .streams import get_feed
+from .routers import REPLICA_ALIAS, RECENT_WRITE_COOKIE, mark_recent_write, replica_reads, use_results_replica
+from .voting import BALLOT_TIMEOUT, BallotError, cast_ballot, get_ballot
+
+
+def create_student(**kwargs):
+    # bulk_create skips Student.save, so no password email is sent
+    defaults = {'name': 'Student', 'email': 'student@example.com', 'reg_no': 'REG/001', 'password': '!'}
+    defaults.update(kwargs)
+    return Student.objects.bulk_create([Student(**defaults)])[0]
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    RESULTS_BROADCAST_INTERVAL=0.2,
+)
+class ResultsConsumerTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create(pk=1, username='admin')
+        self.student = create_student()
+        self.position = Position.objects.create(title='Chairperson')
+        self.candidates = [
+            Candidate.objects.create(name=f'Candidate {i}', email=f'c{i}@example.com', position=self.position)
+            for i in range(3)
+        ]
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(application, '/ws/results/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        snapshot = json.loads(await communicator.receive_from())
+        self.assertEqual(snapshot['type'], 'snapshot')
+        return communicator
+
+    async def test_burst_is_coalesced_into_one_delta(self):
+        communicator = await self.connect()
+        channel_layer = get_channel_layer()
+        first, second, third = (candidate.pk for candidate in self.candidates)
+
+        await channel_layer.group_send(RESULTS_GROUP, {'type': 'results.tally', 'tallies': [[first, 1]], 'total_votes': 1})
+        delta = json.loads(await communicator.receive_from())
+        self.assertEqual(delta['candidates'], [{'id': first, 'votes': 1}])
+
+        # Everything arriving within the interval goes out as one message
+        await channel_layer.group_send(RESULTS_GROUP, {'type': 'results.tally', 'tallies': [[first, 2]], 'total_votes': 2})
+        await channel_layer.group_send(RESULTS_GROUP, {'type': 'results.tally', 'tallies': [[first, 3], [second, 1]], 'total_votes': 4})
+        # Unchanged from the snapshot, so it must not be sent
+        await channel_layer.group_send(RESULTS_GROUP, {'type': 'results.tally', 'tallies': [[third, 0]], 'total_votes': 4})
+
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        delta = json.loads(await communicator.receive_from())
+        self.assertEqual(delta['type'], 'delta')
+        self.assertEqual(delta['total_votes'], 4)
+        self.assertEqual(
+            sorted((c['id'], c['votes']) for c in delta['candidates']),
+            [(first, 3), (second, 1)],
+        )
+        self.assertTrue(await communicator.receive_nothing(0.3))
+        await communicator.disconnect()
+
+    async def test_committed_ballot_is_broadcast(self):
+        communicator = await self.connect()
+        candidate = self.candidates[1]
+
+        await communicator.receive_nothing(0.05)
+        await database_sync_to_async(cast_ballot)(self.student, {self.position.pk: candidate.pk})
+
+        delta = json.loads(await communicator.receive_from())
+        self.assertEqual(delta['candidates'], [{'id': candidate.pk, 'votes': 1}])
+        self.assertEqual(delta['total_votes'], 1)
+        await communicator.disconnect()
+
+
+def parse_sse(message):
+    fields = dict(line.split(': ', 1) for line in message.decode().strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    RESULTS_FEED_INTERVAL=0.05,
+)
+class ResultsStreamTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = create_student()
+        self.position = Position.objects.create(title='Chairperson')
+        self.candidates = [
+            Candidate.objects.create(name=f'Candidate {i}', email=f'c{i}@example.com', position=self.position)
+            for i in range(2)
+        ]
+
+    async def test_clients_share_one_feed(self):
+        feed = get_feed()
+        streams = [feed.stream(), feed.stream()]
+        for stream in streams:
+            event, data = parse_sse(await anext(stream))
+            self.assertEqual(event, 'snapshot')
+            self.assertEqual(data['total_votes'], 0)
+
+        candidate = self.candidates[1]
+        await database_sync_to_async(cast_ballot)(self.student, {self.position.pk: candidate.pk})
+        for stream in streams:
+            event, data = parse_sse(await asyncio.wait_for(anext(stream), 5))
+            self.assertEqual(event, 'delta')
+            self.assertEqual(data, {'candidates': [{'id': candidate.pk, 'votes': 1}], 'total_votes': 1})
+        # One snapshot load per change, however many clients are listening
+        self.assertEqual(feed.loads, 2)
+
+        for stream in streams:
+            await stream.aclose()
+        self.assertIsNone(feed.poller)
+
+    async def test_stream_view(self):
+        response = await self.async_client.get('/results/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        content = aiter(response.streaming_content)
+        event, data = parse_sse(await anext(content))
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual(list(data['positions']), ['Chairperson'])
+        await content.aclose()
+
+    def test_stream_view_refuses_wsgi_requests(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            response = self.client.get('/results/stream/')
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ResultsApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student()
+        cls.position = Position.objects.create(title='Chairperson')
+        cls.candidates = [
+            Candidate.objects.create(name=f'Candidate {i}', email=f'c{i}@example.com', position=cls.position)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def vote(self, candidate):
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_ballot(self.student, {self.position.pk: candidate.pk})
+
+    def test_unchanged_results_answer_304_from_the_version(self):
+        response = self.client.get('/api/results/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(etag, f'"results-{response.json()["version"]}"')
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/results/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.vote(self.candidates[0])
+        response = self.client.get('/api/results/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total_votes'], 1)
+
+    def test_since_returns_only_the_changed_candidates(self):
+        version = self.client.get('/api/results/').json()['version']
+        self.vote(self.candidates[1])
+
+        data = self.client.get('/api/results/', {'since': version}).json()
+        self.assertEqual(data['since'], version)
+        self.assertEqual(data['candidates'], [{'id': self.candidates[1].pk, 'votes': 1}])
+        self.assertNotIn('positions', data)
+
+        # An unknown (or expired) version gets the full results
+        data = self.client.get('/api/results/', {'since': 1}).json()
+        self.assertNotIn('since', data)
+        self.assertEqual(len(data['positions']['Chairperson']['candidates']), 3)
+
+    @override_settings(CACHES={
+        name: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': name}
+        for name in ('default', 'worker-2', 'worker-3')
+    })
+    def test_workers_with_their_own_caches_never_answer_stale(self):
+        def get(worker, **kwargs):
+            with override_settings(RESULTS_CACHE_ALIAS=worker):
+                return self.client.get('/api/results/', **kwargs)
+
+        for worker in ('worker-2', 'worker-3'):
+            caches[worker].clear()
+        first = get('default')
+        etag, version = first['ETag'], first.json()['version']
+        self.assertEqual(get('worker-2')['ETag'], etag)
+        # The vote goes through worker 2; worker 1's cache never hears of it
+        with override_settings(RESULTS_CACHE_ALIAS='worker-2'):
+            self.vote(self.candidates[2])
+
+        for worker in ('default', 'worker-2', 'worker-3'):
+            with self.subTest(worker=worker):
+                response = get(worker, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['total_votes'], 1)
+                data = get(worker, data={'since': version}).json()
+                if 'candidates' in data:
+                    self.assertEqual(data['candidates'], [{'id': self.candidates[2].pk, 'votes': 1}])
+                else:
+                    # A worker that never served that version sends everything rather than an empty delta
+                    self.assertEqual(worker, 'worker-3')
+                    self.assertEqual(data['total_votes'], 1)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    NOTIFICATION_BATCH_INTERVAL=0.1,
+    NOTIFICATION_QUEUE_SIZE=3,
+)
+class NotificationConsumerTests(TransactionTestCase):
+    async def connect(self):
+        communicator = WebsocketCommunicator(application, '/ws/notifications/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def notify(self, message):
+        await get_channel_layer().group_send(NOTIFICATIONS_GROUP, {'type': 'send.notification', 'message': message})
+
+    async def test_notifications_are_batched_for_every_socket(self):
+        first, second = await self.connect(), await self.connect()
+        # Let the worker's hub join the group
+        await first.receive_nothing(0.05)
+
+        await self.notify('one')
+        await self.notify('two')
+        for communicator in (first, second):
+            frame = json.loads(await communicator.receive_from())
+            self.assertEqual(frame['messages'], ['one', 'two'])
+            self.assertEqual(frame['dropped'], 0)
+            self.assertIn('mac_address', frame)
+            await communicator.disconnect()
+
+    async def test_slow_client_keeps_only_the_newest_messages(self):
+        communicator = await self.connect()
+        await communicator.receive_nothing(0.05)
+
+        for i in range(5):
+            await self.notify(f'message {i}')
+        frame = json.loads(await communicator.receive_from())
+        self.assertEqual(frame['messages'], ['message 2', 'message 3', 'message 4'])
+        self.assertEqual(frame['dropped'], 2)
+        await communicator.disconnect()
+
+    @override_settings(CHANNEL_LAYERS={
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'group_expiry': 1}},
+    })
+    async def test_hub_stays_in_the_group_past_group_expiry(self):
+        communicator = await self.connect()
+        # The layer drops members after 1-2 seconds; the hub rejoins every half second
+        self.assertTrue(await communicator.receive_nothing(2.5))
+        await self.notify('still here')
+        frame = json.loads(await communicator.receive_from())
+        self.assertEqual(frame['messages'], ['still here'])
+        await communicator.disconnect()
+
+    async def test_hub_subscribes_again_after_a_layer_failure(self):
+        layer = get_channel_layer()
+        group_add = layer.group_add
+        failures = [ConnectionError("Channel layer unavailable")]
+
+        async def flaky_group_add(group, channel):
+            if failures:
+                raise failures.pop()
+            await group_add(group, channel)
+
+        with mock.patch.object(layer, 'group_add', flaky_group_add), \
+                mock.patch('myweb.consumers.HUB_RESTART_DELAY', 0), \
+                self.assertLogs('myweb.consumers', 'ERROR'):
+            communicator = await self.connect()
+            await communicator.receive_nothing(0.1)
+        await self.notify('recovered')
+        frame = json.loads(await communicator.receive_from())
+        self.assertEqual(frame['messages'], ['recovered'])
+        await communicator.disconnect()
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'channels.sock')
+
+    def layer(self, **config):
+        # Every layer instance has its own broker connection, like separate worker processes
+        return UnixSocketChannelLayer(path=self.path, **config)
+
+    async def test_messages_and_groups_cross_connections(self):
+        sender, receiver = self.layer(), self.layer()
+        first, second = await receiver.new_channel(), await receiver.new_channel()
+
+        await sender.send(first, {'type': 'direct'})
+        self.assertEqual(await receiver.receive(first), {'type': 'direct'})
+
+        await receiver.group_add('election', first)
+        await receiver.group_add('election', second)
+        await sender.group_send('election', {'type': 'results.tally', 'tallies': [[1, 2]]})
+        self.assertEqual((await receiver.receive(first))['tallies'], [[1, 2]])
+        self.assertEqual((await receiver.receive(second))['tallies'], [[1, 2]])
+
+        await receiver.group_discard('election', second)
+        await sender.group_send('election', {'type': 'again'})
+        self.assertEqual(await receiver.receive(first), {'type': 'again'})
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(receiver.receive(second), 0.1)
+
+    async def test_channel_names(self):
+        channel = await self.layer().new_channel()
+        self.assertRegex(channel, r'^specific\.unix![0-9a-f]{32}$')
+        self.assertTrue(self.layer().valid_channel_name(channel))
+
+    def test_default_path_is_shared_with_the_broker_command(self):
+        self.assertEqual(UnixSocketChannelLayer().path, os.path.join(settings.BASE_DIR, 'channels.sock'))
+        layers = {'default': {'BACKEND': 'myweb.channel_broker.UnixSocketChannelLayer', 'CONFIG': {'path': None}}}
+        with override_settings(CHANNEL_LAYERS=layers), \
+                mock.patch('myweb.channel_broker.serve_forever', return_value=True) as serve:
+            call_command('run_channel_broker', stdout=StringIO())
+        serve.assert_called_once_with(os.path.join(settings.BASE_DIR, 'channels.sock'))
+
+    async def test_message_for_a_cancelled_receive_is_kept(self):
+        sender, receiver = self.layer(), self.layer()
+        channel = await receiver.new_channel()
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(receiver.receive(channel), 0.05)
+        await sender.send(channel, {'type': 'late'})
+        self.assertEqual(await asyncio.wait_for(receiver.receive(channel), 1), {'type': 'late'})
+
+    @skipUnless(os.path.isdir('/proc/self/fd'), "Counts open files through /proc")
+    def test_sync_calls_do_not_leak_connections(self):
+        # Every async_to_sync call runs on a new event loop, as publish_tallies does per ballot
+        layer = self.layer()
+        async_to_sync(layer.group_send)('results', {'type': 'results.tally'})
+        before = len(os.listdir('/proc/self/fd'))
+        for _ in range(50):
+            async_to_sync(layer.group_send)('results', {'type': 'results.tally'})
+        # The broker runs in this process too, so both ends of each connection are counted
+        deadline = time.monotonic() + 1
+        while len(os.listdir('/proc/self/fd')) > before + 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertLessEqual(len(os.listdir('/proc/self/fd')), before + 2)
+
+    async def test_capacity_and_expiry(self):
+        layer = self.layer(capacity=2, expiry=0.2)
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'one'})
+        await layer.send(channel, {'type': 'two'})
+        with self.assertRaises(ChannelFull):
+            await layer.send(channel, {'type': 'three'})
+
+        await asyncio.sleep(0.3)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.1)
+
+
+class BallotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student()
+        cls.chair, cls.treasurer = Position.objects.bulk_create([Position(title='Chairperson'), Position(title='Treasurer')])
+        cls.first, cls.second, cls.third = Candidate.objects.bulk_create([
+            Candidate(name='First', email='first@example.com', position=cls.chair),
+            Candidate(name='Second', email='second@example.com', position=cls.chair),
+            Candidate(name='Third', email='third@example.com', position=cls.treasurer),
+        ])
+
+    def test_one_vote_per_position_is_enforced_by_the_database(self):
+        Vote.objects.create(student=self.student, candidate=self.first)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(student=self.student, candidate=self.second)
+
+    def test_second_ballot_for_a_position_is_rejected(self):
+        cast_ballot(self.student, {self.chair.pk: self.first.pk})
+        with self.assertRaisesMessage(BallotError, "You have already voted for the position: Chairperson."):
+            cast_ballot(self.student, {self.chair.pk: self.second.pk, self.treasurer.pk: self.third.pk})
+        # The whole second ballot is rolled back, including the open position
+        self.assertEqual(list(Vote.objects.values_list('candidate_id', flat=True)), [self.first.pk])
+
+    def test_ballot_with_a_candidate_from_another_position_is_rejected(self):
+        with self.assertRaisesMessage(BallotError, "Invalid candidate selected."):
+            cast_ballot(self.student, {self.chair.pk: self.third.pk})
+        self.assertFalse(Vote.objects.exists())
+
+    def test_vote_position_follows_its_candidate(self):
+        vote = Vote.objects.create(student=self.student, candidate=self.first)
+        self.assertEqual(vote.position_id, self.chair.pk)
+        vote.candidate = self.third
+        vote.save()
+        self.assertEqual(Vote.objects.get(pk=vote.pk).position_id, self.treasurer.pk)
+
+    def test_cached_ballot_is_dropped_when_candidates_change(self):
+        cache.clear()
+        self.assertEqual([c['name'] for c in get_ballot()[0]['candidates']], ['First', 'Second'])
+        with self.assertNumQueries(0):
+            get_ballot()
+        with self.captureOnCommitCallbacks(execute=True):
+            Candidate.objects.create(name='Fourth', email='fourth@example.com', position=self.chair)
+        self.assertEqual([c['name'] for c in get_ballot()[0]['candidates']], ['First', 'Second', 'Fourth'])
+
+    def test_cached_ballot_expires(self):
+        # Other workers with a per-process cache never see the invalidation
+        cache.clear()
+        with mock.patch.object(results.get_cache(), 'set', wraps=results.get_cache().set) as cache_set:
+            get_ballot()
+        self.assertEqual(cache_set.call_args.kwargs['timeout'], BALLOT_TIMEOUT)
+
+    def test_candidate_with_votes_cannot_move(self):
+        Vote.objects.create(student=self.student, candidate=self.first)
+        self.first.position = self.treasurer
+        with self.assertRaises(ValidationError):
+            self.first.clean()
+        self.second.position = self.treasurer
+        self.second.clean()
+
+
+class ResultsSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        position = Position.objects.create(title='Chairperson')
+        cls.candidate = Candidate.objects.create(name='Candidate', email='c@example.com', position=position)
+        ElectionStats.load()
+
+    def setUp(self):
+        cache.clear()
+
+    def bump_version(self):
+        results.invalidate()
+        return results.current_version()
+
+    def test_current_snapshot_is_served_from_the_cache(self):
+        snapshot = results.get_snapshot()
+        # Just the version read
+        with self.assertNumQueries(1):
+            self.assertEqual(results.get_snapshot(), snapshot)
+        self.assertIsNone(cache.get(results.LOCK_KEY.format(snapshot['version'])))
+
+    def test_stale_snapshot_is_served_while_another_worker_rebuilds(self):
+        stale = results.get_snapshot()
+        version = self.bump_version()
+        # Another worker holds the recompute lock for the new version
+        cache.add(results.LOCK_KEY.format(version), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(results.get_snapshot()['version'], stale['version'])
+
+        cache.delete(results.LOCK_KEY.format(version))
+        self.assertEqual(results.get_snapshot()['version'], version)
+
+    def test_without_a_snapshot_waiters_wait_for_the_lock_holder(self):
+        version = results.current_version()
+        cache.add(results.LOCK_KEY.format(version), 1)
+        built = results.build_snapshot()
+        timer = threading.Timer(0.2, cache.set, (results.SNAPSHOT_KEY, built))
+        timer.start()
+        self.addCleanup(timer.join)
+        with self.assertNumQueries(1):
+            self.assertEqual(results.get_snapshot(), built)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-1'},
+        'worker-2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-2'},
+    })
+    def test_workers_with_their_own_caches_agree_on_the_version(self):
+        caches['worker-2'].clear()
+        student = create_student()
+        first = results.get_snapshot()
+        with override_settings(RESULTS_CACHE_ALIAS='worker-2'):
+            self.assertEqual(results.get_snapshot(), first)
+            # The vote lands in another worker, which only touches its own cache
+            cast_ballot(student, {self.candidate.position_id: self.candidate.pk})
+        snapshot = results.get_snapshot()
+        self.assertGreater(snapshot['version'], first['version'])
+        self.assertEqual(snapshot['total_votes'], 1)
+
+    async def test_async_snapshot_shares_the_cache_protocol(self):
+        snapshot = await results.aget_snapshot()
+        self.assertEqual(await results.aget_snapshot(), snapshot)
+        self.assertEqual(await database_sync_to_async(results.get_snapshot)(), snapshot)
+
+        version = await database_sync_to_async(self.bump_version)()
+        cache.add(results.LOCK_KEY.format(version), 1)
+        with mock.patch.object(results, 'build_snapshot') as build:
+            self.assertEqual((await results.aget_snapshot())['version'], snapshot['version'])
+        build.assert_not_called()
+
+        cache.delete(results.LOCK_KEY.format(version))
+        self.assertEqual((await results.aget_snapshot())['version'], version)
+        self.assertEqual((await database_sync_to_async(results.get_snapshot)())['version'], version)
+
+
+class AsyncViewUrls:
+    # The site's URLs with the async views in front, as urls.py serves them when ASYNC_VIEWS is on
+    urlpatterns = [
+        path('', async_views.home, name='home'),
+        path('login/', async_views.login_view, name='login'),
+        path('vote/', async_views.vote, name='vote'),
+        path('success/', async_views.success, name='success'),
+        path('', include('web.urls')),
+    ]
+
+
+@override_settings(
+    ROOT_URLCONF=AsyncViewUrls,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student(password=make_password('secret'))
+        cls.position = Position.objects.create(title='Chairperson')
+        cls.candidate = Candidate.objects.create(name='Amina Odhiambo', email='c@example.com', position=cls.position)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_results_pages(self):
+        for url, view in (('/', async_views.home), ('/success/', async_views.success)):
+            response = await self.async_client.get(url)
+            self.assertIs(response.resolver_match.func, view)
+            self.assertContains(response, 'Amina Odhiambo')
+
+    async def test_login_and_vote(self):
+        response = await self.async_client.post('/login/', {'reg_no': self.student.reg_no, 'password': 'wrong'})
+        self.assertContains(response, "Invalid registration number or password.")
+        response = await self.async_client.post('/login/', {'reg_no': self.student.reg_no, 'password': 'secret'})
+        self.assertRedirects(response, '/vote/', fetch_redirect_response=False)
+
+        response = await self.async_client.get('/vote/')
+        self.assertIs(response.resolver_match.func, async_views.vote)
+        self.assertContains(response, f'name="position_{self.position.pk}"')
+
+        response = await self.async_client.post('/vote/', {f'position_{self.position.pk}': self.candidate.pk})
+        self.assertRedirects(response, '/success/', fetch_redirect_response=False)
+        self.assertEqual(await Vote.objects.filter(student=self.student, candidate=self.candidate).acount(), 1)
+
+        # A second ballot for the position is refused with a message
+        response = await self.async_client.post('/vote/', {f'position_{self.position.pk}': self.candidate.pk})
+        self.assertRedirects(response, '/vote/', fetch_redirect_response=False)
+        self.assertEqual(await Vote.objects.acount(), 1)
+
+
+@override_settings(STUDENT_USER_CACHE=True, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CachedUserTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student(password=make_password('secret'))
+
+    def setUp(self):
+        cache.clear()
+        self.backend = StudentBackend()
+
+    def test_snapshot_serves_the_request_user(self):
+        self.backend.get_user(self.student.pk)
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.student.pk)
+        self.assertEqual((user.reg_no, user.password), (self.student.reg_no, self.student.password))
+
+    def test_bulk_password_change_drops_the_snapshot(self):
+        self.backend.get_user(self.student.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.filter(pk=self.student.pk).update(password=make_password('changed'))
+        self.assertTrue(self.backend.get_user(self.student.pk).check_password('changed'))
+
+    def test_updates_of_other_columns_keep_the_snapshot(self):
+        self.backend.get_user(self.student.pk)
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            Student.objects.filter(pk=self.student.pk).update(has_voted=True)
+        with self.assertNumQueries(0):
+            self.backend.get_user(self.student.pk)
+
+    def test_password_change_logs_the_session_out(self):
+        self.client.force_login(self.student, backend='myweb.auth_backends.StudentBackend')
+        self.assertEqual(self.client.get('/vote/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.filter(pk=self.student.pk).update(password=make_password('changed'))
+        self.assertRedirects(self.client.get('/vote/'), '/login/?next=/vote/', fetch_redirect_response=False)
+
+
+class SessionStoreTests(TestCase):
+    def saved_session(self, **data):
+        session = SessionStore()
+        session.update(data)
+        session.create()
+        return SessionStore(session.session_key)
+
+    def test_unchanged_session_is_not_written(self):
+        session = self.saved_session(ballot='open')
+        with self.assertNumQueries(1):
+            session['ballot'] = 'open'
+            session.save()
+
+    def test_changed_session_is_written(self):
+        session = self.saved_session(ballot='open')
+        session['ballot'] = 'cast'
+        session.save()
+        self.assertEqual(SessionStore(session.session_key)['ballot'], 'cast')
+
+    def test_skipped_write_still_refreshes_an_ageing_expiry(self):
+        session = self.saved_session(ballot='open')
+        # Less than half the lifetime left
+        Session.objects.filter(pk=session.session_key).update(
+            expire_date=timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE / 3)
+        )
+        session['ballot'] = 'open'
+        session.save()
+        expire_date = Session.objects.get(pk=session.session_key).expire_date
+        self.assertGreater(expire_date, timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE * 0.9))
+
+    def test_logout_ends_the_session_for_every_worker(self):
+        student = create_student()
+        self.client.force_login(student, backend='myweb.auth_backends.StudentBackend')
+        session_key = self.client.session.session_key
+        # Another worker has this session loaded
+        self.assertEqual(SessionStore(session_key)[SESSION_KEY], str(student.pk))
+
+        self.client.post('/logout/')
+        # There is no per-process copy left to serve it from
+        self.assertNotIn(SESSION_KEY, SessionStore(session_key).load())
+        self.assertFalse(Session.objects.filter(pk=session_key).exists())
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True)
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        reset_request_stats()
+        self.addCleanup(reset_request_stats)
+
+    def test_queries_are_timed_and_aggregated_per_url_name(self):
+        for _ in range(2):
+            response = self.client.get('/api/turnout/')
+            self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries"', timing)
+        self.assertIn('total;dur=', timing)
+
+        stats = get_request_stats()['turnout']
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['avg_queries'], 1)
+        self.assertIn('myweb_turnoutrollup', stats['slowest_query']['sql'])
+        self.assertIn('views.py', stats['slowest_query']['call_site'])
+
+    def test_stats_are_for_staff_only(self):
+        self.assertEqual(self.client.get('/request-stats/').status_code, 302)
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_login(staff, backend='django.contrib.auth.backends.ModelBackend')
+        self.client.get('/api/turnout/')
+        self.assertIn('turnout', self.client.get('/request-stats/').json())
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    VOTE_WRITER=True,
+    VOTE_JOURNAL=False,
+)
+class VoteWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.student = create_student()
+        self.position = Position.objects.create(title='Chairperson')
+        self.first, self.second = (
+            Candidate.objects.create(name=f'Candidate {i}', email=f'c{i}@example.com', position=self.position)
+            for i in range(2)
+        )
+        self.addCleanup(vote_writer.get_writer().stop)
+
+    def test_ballot_is_committed_by_the_writer_thread(self):
+        counter = mock.Mock(side_effect=lambda execute, *args: execute(*args))
+        with connection.execute_wrapper(counter):
+            vote_writer.submit_ballot(self.student, {self.position.pk: self.first.pk})
+        # Visible to this thread's connection, so committed
+        self.assertEqual(list(Vote.objects.values_list('candidate_id', flat=True)), [self.first.pk])
+        self.assertTrue(Student.objects.get(pk=self.student.pk).has_voted)
+        # The writer ran the ballot's queries through the caller's wrappers
+        self.assertGreater(counter.call_count, 3)
+
+    def test_ballot_errors_reach_the_caller(self):
+        vote_writer.submit_ballot(self.student, {self.position.pk: self.first.pk})
+        with self.assertRaisesMessage(BallotError, "You have already voted for the position: Chairperson."):
+            vote_writer.submit_ballot(self.student, {self.position.pk: self.second.pk})
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_caller_gives_up_after_the_timeout(self):
+        stuck = mock.Mock()
+        stuck.submit.return_value = Future()
+        with mock.patch.object(vote_writer, 'get_writer', return_value=stuck), \
+                mock.patch.object(vote_writer, 'SUBMIT_TIMEOUT', 0.05):
+            with self.assertRaisesMessage(BallotError, "The server is busy."):
+                vote_writer.submit_ballot(self.student, {self.position.pk: self.first.pk})
+
+    def test_batch_is_broadcast_once_after_the_submitters_are_answered(self):
+        students = [self.student] + [create_student(reg_no=f'REG/20{i}', email=f's{i}@example.com') for i in range(3)]
+        batch = [
+            (student, {self.position.pk: candidate.pk}, [], Future())
+            for student, candidate in zip(students, [self.first, self.second] * 2)
+        ]
+        futures = [future for *_, future in batch]
+
+        def publish(candidate_ids):
+            self.assertTrue(all(future.done() for future in futures))
+        with mock.patch.object(broadcast, 'publish_tallies', side_effect=publish) as publish_tallies:
+            vote_writer.VoteWriter().write(batch)
+
+        publish_tallies.assert_called_once_with({self.first.pk, self.second.pk})
+        self.assertEqual(Vote.objects.count(), 4)
+
+    @override_settings(REQUEST_INSTRUMENTATION=True)
+    def test_vote_request_stats_include_the_writers_queries(self):
+        reset_request_stats()
+        self.addCleanup(reset_request_stats)
+        self.client.force_login(self.student, backend='myweb.auth_backends.StudentBackend')
+        response = self.client.post('/vote/', {f'position_{self.position.pk}': self.first.pk})
+        self.assertRedirects(response, '/success/', fetch_redirect_response=False)
+        # Session and user reads, plus the ballot's candidate read, insert and counter updates
+        self.assertGreaterEqual(get_request_stats()['vote']['max_queries'], 6)
+
+
+class VoteTallyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.position = Position.objects.create(title='Chairperson')
+        cls.first, cls.second = (
+            Candidate.objects.create(name=f'Candidate {i}', email=f'c{i}@example.com', position=cls.position)
+            for i in range(2)
+        )
+        cls.students = Student.objects.bulk_create(
+            Student(name=f'Student {i}', email=f's{i}@example.com', reg_no=f'REG/{i:03}', password='!')
+            for i in range(4)
+        )
+
+    def assertTalliesMatchVotes(self):
+        tallied = dict(VoteTally.objects.filter(votes__gt=0).values_list('candidate_id', 'votes'))
+        counted = dict(Vote.objects.values('candidate').annotate(count=Count('pk')).values_list('candidate', 'count'))
+        self.assertEqual(tallied, counted)
+
+    def test_triggers_follow_inserts_updates_and_deletes(self):
+        # bulk_create (the vote view), save() (the admin) and raw SQL all go through the triggers
+        Vote.objects.bulk_create(
+            Vote(student=student, candidate=self.first, position=self.position) for student in self.students[:2]
+        )
+        vote = Vote.objects.create(student=self.students[2], candidate=self.second)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO myweb_vote (student_id, candidate_id, position_id, timestamp) VALUES (%s, %s, %s, %s)",
+                [self.students[3].pk, self.second.pk, self.position.pk, timezone.now()],
+            )
+        self.assertTalliesMatchVotes()
+        self.assertEqual((self.first.get_vote_count(), self.second.get_vote_count()), (2, 2))
+
+        vote.candidate = self.first
+        vote.save()
+        self.assertTalliesMatchVotes()
+        self.assertEqual(self.first.get_vote_count(), 3)
+
+        vote.delete()
+        Vote.objects.filter(student=self.students[3]).delete()
+        self.assertTalliesMatchVotes()
+        self.assertEqual((self.first.get_vote_count(), self.second.get_vote_count()), (2, 0))
+
+    def test_reconcile_repairs_a_drifted_tally(self):
+        Vote.objects.bulk_create(Vote(student=student, candidate=self.first, position=self.position) for student in self.students)
+        self.assertEqual(tallies.reconcile(), 0)
+        VoteTally.objects.filter(candidate=self.first).update(votes=1)
+        self.assertEqual(tallies.reconcile(), 1)
+        self.assertTalliesMatchVotes()
+        self.assertEqual(tallies.total_votes(), 4)
+
+
+class TurnoutRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chair, cls.secretary = Position.objects.create(title='Chairperson'), Position.objects.create(title='Secretary')
+        cls.chair_candidate = Candidate.objects.create(name='Chair', email='chair@example.com', position=cls.chair)
+        cls.scribe = Candidate.objects.create(name='Scribe', email='scribe@example.com', position=cls.secretary)
+        cls.students = Student.objects.bulk_create(
+            Student(name=f'Student {i}', email=f's{i}@example.com', reg_no=f'REG/{i:03}', password='!')
+            for i in range(3)
+        )
+
+    def at(self, minute, second):
+        return datetime(2026, 10, 18, 9, minute, second, tzinfo=dt_timezone.utc)
+
+    def rollups(self):
+        return set(TurnoutRollup.objects.filter(votes__gt=0).values_list('minute', 'position_id', 'votes'))
+
+    def cast(self):
+        return [
+            Vote.objects.create(student=self.students[0], candidate=self.chair_candidate, timestamp=self.at(30, 10)),
+            Vote.objects.create(student=self.students[1], candidate=self.chair_candidate, timestamp=self.at(30, 50)),
+            Vote.objects.create(student=self.students[2], candidate=self.chair_candidate, timestamp=self.at(31, 5)),
+            Vote.objects.create(student=self.students[0], candidate=self.scribe, timestamp=self.at(30, 20)),
+        ]
+
+    def test_votes_are_rolled_up_per_minute_and_position(self):
+        votes = self.cast()
+        self.assertEqual(self.rollups(), {
+            (self.at(30, 0), self.chair.pk, 2),
+            (self.at(31, 0), self.chair.pk, 1),
+            (self.at(30, 0), self.secretary.pk, 1),
+        })
+
+        votes[1].delete()
+        self.assertEqual(self.rollups(), {
+            (self.at(30, 0), self.chair.pk, 1),
+            (self.at(31, 0), self.chair.pk, 1),
+            (self.at(30, 0), self.secretary.pk, 1),
+        })
+        # Rebuilding from the Vote table gives the same buckets
+        expected = self.rollups()
+        self.assertEqual(tallies.rebuild_turnout(), 3)
+        self.assertEqual(self.rollups(), expected)
+
+    def test_edit_to_another_position_moves_the_bucket(self):
+        vote = self.cast()[2]
+        version = results.current_version()
+        # The admin points the 09:31 vote at the other position's candidate
+        vote.candidate = self.scribe
+        vote.save()
+        self.assertGreater(results.current_version(), version)
+        self.assertEqual(self.rollups(), {
+            (self.at(30, 0), self.chair.pk, 2),
+            (self.at(30, 0), self.secretary.pk, 1),
+            (self.at(31, 0), self.secretary.pk, 1),
+        })
+        expected = self.rollups()
+        tallies.rebuild_turnout()
+        self.assertEqual(self.rollups(), expected)
+
+    def test_turnout_endpoint(self):
+        self.cast()
+        response = self.client.get('/api/turnout/', {'start': '2026-10-18T09:30:00Z', 'end': '2026-10-18T09:31:00Z'})
+        self.assertEqual(response.json()['buckets'], [{'minute': '2026-10-18T09:30:00+00:00', 'votes': 3}])
+
+        response = self.client.get('/api/turnout/', {'position': self.chair.pk})
+        self.assertEqual([bucket['votes'] for bucket in response.json()['buckets']], [2, 1])
+
+        response = self.client.get('/api/turnout/', {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+def journal_record(key, student, choices, at='2026-10-18T09:30:15+00:00'):
+    return {'key': key, 'student': student.pk, 'choices': {str(p): c for p, c in choices.items()}, 'at': at}
+
+
+def write_journal(directory, *records, tail=b''):
+    """A journal as a crashed process leaves it: no checkpoint, perhaps a torn final record."""
+    path = directory / f'votes-20261018093000000000-{len(records)}.jsonl'
+    path.write_bytes(b''.join(json.dumps(record).encode() + b'\n' for record in records) + tail)
+    return path
+
+
+class VoteJournalReplayTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student()
+        cls.chair, cls.secretary = Position.objects.create(title='Chairperson'), Position.objects.create(title='Secretary')
+        cls.first, cls.second = (
+            Candidate.objects.create(name=f'Chair {i}', email=f'chair{i}@example.com', position=cls.chair)
+            for i in range(2)
+        )
+        cls.scribe = Candidate.objects.create(name='Scribe', email='scribe@example.com', position=cls.secretary)
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_replay_after_a_crash_applies_acknowledged_records_once(self):
+        path = write_journal(
+            self.directory,
+            journal_record('a' * 32, self.student, {self.chair.pk: self.first.pk, self.secretary.pk: self.scribe.pk}),
+            tail=b'{"key": "torn',
+        )
+        self.assertEqual(journal.replay(self.directory), (1, 0, 0))
+        votes = Vote.objects.filter(ballot_key='a' * 32)
+        self.assertEqual(votes.count(), 2)
+        # Stamped with the acknowledgement time, not the replay time
+        acknowledged = datetime(2026, 10, 18, 9, 30, 15, tzinfo=dt_timezone.utc)
+        self.assertEqual(set(votes.values_list('timestamp', flat=True)), {acknowledged})
+        self.assertEqual(
+            TurnoutRollup.objects.get(position=self.chair).minute, acknowledged.replace(second=0)
+        )
+        self.assertTrue(Student.objects.get(pk=self.student.pk).has_voted)
+        # Archived, so the next replay has nothing to do
+        self.assertFalse(path.exists())
+        self.assertEqual(len(journal.archived_files(self.directory)), 1)
+        self.assertEqual(journal.replay(self.directory), (0, 0, 0))
+
+    def test_records_are_skipped_by_key_when_the_checkpoint_is_lost(self):
+        path = write_journal(self.directory, journal_record('a' * 32, self.student, {self.chair.pk: self.first.pk}))
+        self.assertEqual(journal.apply_file(path), (1, 0, 0))
+        journal.checkpoint_path(path).unlink()
+        self.assertEqual(journal.apply_file(path), (0, 1, 0))
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_overlapping_ballot_keeps_its_other_positions(self):
+        write_journal(
+            self.directory,
+            journal_record('a' * 32, self.student, {self.chair.pk: self.first.pk}),
+            journal_record('b' * 32, self.student, {self.chair.pk: self.second.pk, self.secretary.pk: self.scribe.pk}),
+        )
+        with self.assertLogs('myweb.journal', 'ERROR'):
+            self.assertEqual(journal.replay(self.directory), (1, 0, 1))
+        self.assertEqual(
+            set(Vote.objects.values_list('ballot_key', 'candidate_id')),
+            {('a' * 32, self.first.pk), ('b' * 32, self.scribe.pk)},
+        )
+        # The second ballot was acknowledged, so its rejected chair vote is a loss
+        counts = journal.verify(self.directory)
+        self.assertEqual((counts['applied'], counts['lost']), (1, 1))
+
+    def test_verify(self):
+        other = create_student(reg_no='REG/002', email='other@example.com')
+        path = write_journal(
+            self.directory,
+            journal_record('a' * 32, self.student, {self.chair.pk: self.first.pk}),
+            journal_record('b' * 32, other, {self.chair.pk: self.second.pk}),
+        )
+        journal.apply_file(path)
+        journal.write_checkpoint(path, 0)  # Both records look pending again
+        counts = journal.verify(self.directory)
+        self.assertEqual((counts['records'], counts['applied'], counts['pending']), (2, 2, 0))
+
+        Vote.objects.filter(ballot_key='b' * 32).delete()
+        Vote.objects.create(student=other, candidate=self.first, ballot_key='c' * 32)
+        counts = journal.verify(self.directory)
+        self.assertEqual((counts['applied'], counts['pending'], counts['orphaned']), (1, 1, 1))
+
+        journal.write_checkpoint(path, path.stat().st_size)
+        counts = journal.verify(self.directory)
+        self.assertEqual((counts['applied'], counts['lost'], counts['orphaned']), (1, 1, 1))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class VoteJournalTests(TransactionTestCase):
+    def setUp(self):
+        self.student = create_student()
+        self.position = Position.objects.create(title='Chairperson')
+        self.first, self.second = (
+            Candidate.objects.create(name=f'Candidate {i}', email=f'c{i}@example.com', position=self.position)
+            for i in range(2)
+        )
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def make_journal(self, **kwargs):
+        # Long interval: records are only applied by stop()'s final pass
+        vote_journal = journal.VoteJournal(self.directory, flush_interval=60, **kwargs)
+        self.addCleanup(vote_journal.stop)
+        return vote_journal
+
+    def test_overlapping_ballot_is_refused_until_the_first_is_applied(self):
+        vote_journal = self.make_journal()
+        vote_journal.append(self.student, {self.position.pk: self.first.pk}).result(timeout=5)
+        with self.assertRaisesMessage(BallotError, "still being recorded"):
+            vote_journal.append(self.student, {self.position.pk: self.second.pk})
+        vote_journal.stop()
+        self.assertEqual(list(Vote.objects.values_list('candidate_id', flat=True)), [self.first.pk])
+        self.assertEqual(vote_journal.reserved, {})
+        self.assertEqual(journal.journal_files(self.directory), [])
+        self.assertEqual(journal.verify(self.directory)['applied'], 1)
+
+    def test_ballot_is_checked_after_its_positions_are_reserved(self):
+        vote_journal = self.make_journal()
+        # An overlapping ballot that was applied and released just before this one reserved
+        Vote.objects.create(student=self.student, candidate=self.first, position=self.position)
+        with self.assertRaisesMessage(BallotError, "You have already voted for the position: Chairperson."):
+            vote_journal.append(self.student, {self.position.pk: self.second.pk})
+        self.assertEqual(vote_journal.reserved, {})
+        vote_journal.stop()
+        self.assertEqual(journal.verify(self.directory)['records'], 0)
+
+    def test_failed_write_is_cut_off_and_not_acknowledged(self):
+        vote_journal = self.make_journal()
+        with mock.patch.object(journal.os, 'fsync', side_effect=OSError("I/O error")), \
+                self.assertLogs('myweb.journal', 'ERROR'):
+            with self.assertRaisesMessage(OSError, "I/O error"):
+                vote_journal.append(self.student, {self.position.pk: self.first.pk}).result(timeout=5)
+        self.assertEqual(vote_journal.durable_offset, 0)
+        self.assertEqual(vote_journal.path.stat().st_size, 0)
+        # The reservation was released, so the voter can try again
+        vote_journal.append(self.student, {self.position.pk: self.second.pk}).result(timeout=5)
+        vote_journal.stop()
+        self.assertEqual(list(Vote.objects.values_list('candidate_id', flat=True)), [self.second.pk])
+
+    def test_full_files_are_rotated_and_archived_once_applied(self):
+        vote_journal = self.make_journal(rotate_bytes=1)
+        for i in range(3):
+            student = create_student(reg_no=f'REG/1{i}', email=f's{i}@example.com')
+            vote_journal.append(student, {self.position.pk: self.first.pk}).result(timeout=5)
+        vote_journal.stop()
+        self.assertEqual(Vote.objects.count(), 3)
+        self.assertEqual(journal.journal_files(self.directory), [])
+        # Three full files plus the empty one opened after the last rotation
+        self.assertEqual(len(journal.archived_files(self.directory)), 4)
+        counts = journal.verify(self.directory)
+        self.assertEqual((counts['records'], counts['applied']), (3, 3))
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException("Connection unexpectedly closed")
+
+
+class DroppingEmailBackend(BaseEmailBackend):
+    # Delivers `allowed` messages, then the server goes away for good
+    def __init__(self, allowed, **kwargs):
+        super().__init__(**kwargs)
+        self.allowed = allowed
+        self.delivered = []
+
+    def open(self):
+        if len(self.delivered) >= self.allowed:
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+
+    def send_messages(self, email_messages):
+        if len(self.delivered) >= self.allowed:
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+        self.delivered.extend(email_messages)
+        return len(email_messages)
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(pk=1, username='admin')
+
+    def test_new_student_emails_are_queued_not_sent(self):
+        Student.objects.create(name='Amina', email='amina@example.com', reg_no='REG/100')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.filter(recipients=['amina@example.com']).count(), 2)
+
+    def test_worker_sends_batches_over_one_connection(self):
+        for i in range(5):
+            OutboxEmail.objects.queue(f'Subject {i}', 'Body', None, [f'voter{i}@example.com'])
+
+        call_command('send_outbox', batch_size=2, rate=0, stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboxEmail.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(OutboxEmail.objects.filter(attempts=1).count(), 5)
+
+    @override_settings(EMAIL_BACKEND='myweb.tests.FailingEmailBackend')
+    def test_failed_email_is_retried_with_backoff(self):
+        email = OutboxEmail.objects.queue('Subject', 'Body', None, ['voter@example.com'])
+
+        sent, failed = outbox.drain(rate=None, backoff=60)
+
+        self.assertEqual((sent, failed), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+        self.assertIsNone(email.sent_at)
+        self.assertIn('Connection unexpectedly closed', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        # Not due yet, so a second run leaves it alone
+        self.assertEqual(outbox.drain(rate=None), (0, 0))
+
+    def test_delivered_emails_are_recorded_when_the_server_goes_away(self):
+        emails = [OutboxEmail.objects.queue(f'Subject {i}', 'Body', None, [f'voter{i}@example.com']) for i in range(5)]
+        connection = DroppingEmailBackend(allowed=2)
+
+        with self.assertRaises(SMTPServerDisconnected):
+            outbox.drain(rate=None, connection=connection)
+
+        self.assertEqual(len(connection.delivered), 2)
+        sent = OutboxEmail.objects.filter(sent_at__isnull=False)
+        self.assertEqual(sorted(sent.values_list('pk', flat=True)), [email.pk for email in emails[:2]])
+        self.assertEqual(OutboxEmail.objects.get(pk=emails[2].pk).attempts, 1)
+        # The untried rest is released at once rather than left under the claim lease
+        self.assertEqual(len(outbox.claim_batch(10, max_attempts=5)), 2)
+
+    def test_loop_backs_off_while_the_mail_server_is_down(self):
+        class Stop(Exception):
+            pass
+
+        down = SMTPServerDisconnected("Connection unexpectedly closed")
+        stderr = StringIO()
+        with mock.patch.object(outbox, 'drain', side_effect=[down, down, (1, 0), (0, 0), Stop]), \
+                mock.patch('myweb.management.commands.send_outbox.time.sleep') as sleep:
+            with self.assertRaises(Stop):
+                call_command('send_outbox', loop=True, interval=5, stdout=StringIO(), stderr=stderr)
+
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [5, 10, 5])
+        self.assertIn('Mail server unavailable', stderr.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class VoterImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(pk=1, username='admin')
+        ElectionStats.load()
+        create_student(name='Existing', email='existing@example.com', reg_no='REG/900')
+
+    def test_import(self):
+        roll = StringIO(
+            "name,email,reg_no,phone_number\n"
+            "Amina,Amina@Example.com,REG/001,0700000001\n"
+            "Brian,brian@example.com,REG/002,\n"
+            "Brian again,brian@example.com,REG/003,\n"  # Duplicate email within the file
+            "Existing,other@example.com,REG/900,\n"  # Already registered
+            "Carol,not-an-email,REG/004,\n"
+            "Dan,dan@example.com,,\n"
+        )
+        report = import_voters(roll, chunk_size=1, workers=1)
+
+        self.assertEqual((report.rows, report.imported, report.existing, report.invalid), (6, 2, 2, 2))
+        self.assertEqual(len(report.errors), 2)
+        self.assertIn('Line 6', report.errors[0])
+        self.assertIn('Line 7: reg_no is required.', report.errors[1])
+        amina = Student.objects.get(reg_no='REG/001')
+        self.assertEqual(amina.email, 'Amina@example.com')
+        account_email = OutboxEmail.objects.get(recipients=['Amina@example.com'], subject='Your Voting Account Details')
+        self.assertTrue(check_password(re.search(r'Password: (\S+)', account_email.body).group(1), amina.password))
+        self.assertEqual(ElectionStats.load().registered_voters, 2)
+        # Each new voter gets the account email and the status email, like a single registration
+        for email in ('Amina@example.com', 'brian@example.com'):
+            subjects = sorted(OutboxEmail.objects.filter(recipients=[email]).values_list('subject', flat=True))
+            self.assertEqual(subjects, ['Your Voting Account Details', 'Your Voting Status Update'])
+        self.assertEqual(OutboxEmail.objects.count(), 4)
+
+        # Rerunning the same roll imports nothing twice
+        roll.seek(0)
+        self.assertEqual(import_voters(roll, workers=1).imported, 0)
+        self.assertEqual(OutboxEmail.objects.count(), 4)
+
+    def test_admin_upload_hashes_inline(self):
+        admin_user = User.objects.get(pk=1)
+        admin_user.is_staff = admin_user.is_superuser = True
+        admin_user.save()
+        self.client.force_login(admin_user, backend='django.contrib.auth.backends.ModelBackend')
+        roll = SimpleUploadedFile('roll.csv', b"name,email,reg_no\nAmina,amina@example.com,REG/001\n")
+        with mock.patch('myweb.importers.hashing_pool', wraps=hashing_pool) as pool:
+            response = self.client.post('/admin/myweb/student/import-csv/', {'csv_file': roll})
+        self.assertRedirects(response, '/admin/myweb/student/', fetch_redirect_response=False)
+        pool.assert_called_once_with(1)
+        self.assertTrue(Student.objects.filter(reg_no='REG/001').exists())
+
+    def test_missing_columns(self):
+        with self.assertRaisesMessage(VoterImportError, 'reg_no'):
+            import_voters(StringIO("name,email\nAmina,amina@example.com\n"), workers=1)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ResultsReplicaTests(TransactionTestCase):
+    """Runs against a real second SQLite file standing in for a lagging replica."""
+    # Resolved in setUpClass, after the replica alias below has been registered
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        fd, cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connections.settings[REPLICA_ALIAS] = {**connection.settings_dict, 'NAME': cls.replica_path}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+        os.remove(cls.replica_path)
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create(pk=1, username='admin')
+        ElectionStats.load()
+        self.position = Position.objects.create(title='Chairperson')
+        self.candidate = Candidate.objects.create(name='Candidate', email='c@example.com', position=self.position)
+        self.student = create_student()
+        self.sync_replica()
+
+    def sync_replica(self):
+        connections[REPLICA_ALIAS].close()
+        connection.ensure_connection()
+        replica = sqlite3.connect(self.replica_path)
+        try:
+            connection.connection.backup(replica)
+        finally:
+            replica.close()
+
+    def test_reads_go_to_replica_only_when_asked(self):
+        cast_ballot(self.student, {self.position.pk: self.candidate.pk})
+
+        with replica_reads():
+            self.assertEqual(Vote.objects.filter(candidate=self.candidate).count(), 0)
+            # Sessions and auth are never read from the replica
+            self.assertEqual(User.objects.db_manager().db, 'default')
+        self.assertEqual(Vote.objects.filter(candidate=self.candidate).count(), 1)
+
+    def test_recent_writer_reads_the_primary(self):
+        cast_ballot(self.student, {self.position.pk: self.candidate.pk})
+
+        @use_results_replica
+        def view(request):
+            return HttpResponse(str(Vote.objects.filter(candidate=self.candidate).count()))
+
+        factory = RequestFactory()
+        self.assertEqual(view(factory.get('/')).content, b'0')
+
+        response = mark_recent_write(HttpResponse())
+        self.assertIn(RECENT_WRITE_COOKIE, response.cookies)
+        request = factory.get('/')
+        request.COOKIES[RECENT_WRITE_COOKIE] = response.cookies[RECENT_WRITE_COOKIE].value
+        self.assertEqual(view(request).content, b'1')
+
+        self.sync_replica()
+        self.assertEqual(view(factory.get('/')).content, b'1')
+
+    def test_students_are_never_read_from_the_replica(self):
+        # They are request.user; a lagging copy would undo logins and admin edits
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Student), 'default')
+            self.assertEqual(router.db_for_read(Vote), REPLICA_ALIAS)
+
+    def test_admin_writes_set_the_recent_write_cookie(self):
+        User.objects.filter(pk=1).update(is_staff=True, is_superuser=True)
+        self.client.force_login(User.objects.get(pk=1), backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.post(f'/admin/myweb/position/{self.position.pk}/change/', {'title': 'Chair'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(RECENT_WRITE_COOKIE, response.cookies)
+        # The changelist the admin lands on reads the primary, where the edit already is
+        response = self.client.get('/admin/myweb/position/')
+        self.assertContains(response, 'Chair</a>')
+
+    def test_results_snapshot_is_built_from_the_primary(self):
+        cast_ballot(self.student, {self.position.pk: self.candidate.pk})
+
+        with replica_reads():
+            snapshot = results.get_snapshot()
+        self.assertEqual(snapshot['total_votes'], 1)
+        self.assertEqual(snapshot['positions_with_candidates']['Chairperson']['candidates'][0]['votes'], 1)
+
+    def test_views_query_the_aliases_they_need(self):
+        cast_ballot(self.student, {self.position.pk: self.candidate.pk})
+        # The results pages come from the snapshot, built on the primary; turnout reads the replica
+        expected = {'/': 'default', '/success/': 'default', '/api/turnout/': REPLICA_ALIAS}
+        for url, alias in expected.items():
+            cache.clear()
+            with self.subTest(url=url), CaptureQueriesContext(connection) as primary, \
+                    CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            used = {name for name, queries in (('default', primary), (REPLICA_ALIAS, replica)) if len(queries)}
+            self.assertEqual(used, {alias})
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LargeElectionTestCase(TestCase):
+    """An election with 20k students, 5 positions of 4 candidates each, and ~100k votes."""
+    STUDENTS = 20000
+    POSITIONS = 5
+    CANDIDATES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(pk=1, username='admin', is_staff=True, is_superuser=True)
+        positions = Position.objects.bulk_create(
+            [Position(title=f'Position {i}') for i in range(cls.POSITIONS)]
+        )
+        candidates = Candidate.objects.bulk_create([
+            Candidate(name=f'Candidate {p}.{c}', email=f'c{p}_{c}@example.com', position=position)
+            for p, position in enumerate(positions) for c in range(cls.CANDIDATES)
+        ])
+        password = make_password('secret', hasher='md5')
+        students = Student.objects.bulk_create([
+            Student(name=f'Student {i}', email=f'student{i}@example.com', reg_no=f'REG/{i:06d}', password=password)
+            for i in range(cls.STUDENTS)
+        ], batch_size=2000)
+        # Every student but the last has voted for every position
+        Vote.objects.bulk_create([
+            Vote(student=student, candidate=candidates[p * cls.CANDIDATES + i % cls.CANDIDATES], position=position)
+            for i, student in enumerate(students[:-1])
+            for p, position in enumerate(positions)
+        ], batch_size=5000)
+        cls.student = students[-1]
+        cls.positions = positions
+        cls.candidates = candidates
+        # bulk_create skips the signals, so count them in as the voter import does
+        tallies.record_voters(cls.STUDENTS)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+
+
+class QueryPlanTests(LargeElectionTestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on the SQL of the hot paths against 100k votes and
+    fails if any of it scans a whole table, other than the ballot tables that
+    are read in full by design.
+    """
+    FULL_SCAN_ALLOWED = {'myweb_position', 'myweb_candidate'}
+    # The admin searches are substring matches, which no SQLite index can serve, so
+    # the searched student roll is scanned (PostgreSQL has trigram indexes, migration
+    # 0028). Vote searches still have to reach the votes through indexes.
+    SEARCH_SCAN_ALLOWED = FULL_SCAN_ALLOWED | {'myweb_student'}
+    SCAN = re.compile(r'^SCAN (\w+)')
+    ALIAS = re.compile(r'"(\w+)" (U\d+)\b')  # Subquery tables appear in the plan by their alias
+
+    def capture(self, func):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            func()
+        self.assertTrue(queries)
+        return queries
+
+    def assertNoFullScans(self, queries, allowed=FULL_SCAN_ALLOWED):
+        for sql, params in queries:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = [row[3] for row in cursor.fetchall()]
+            aliases = {}
+            for table, alias in self.ALIAS.findall(sql):
+                aliases.setdefault(alias, set()).add(table)
+            for step in plan:
+                match = self.SCAN.match(step)
+                if match and not aliases.get(match.group(1), {match.group(1)}) <= allowed:
+                    self.fail(f"Full table scan ({step}) in:\n{sql}\nPlan: {plan}")
+
+    def test_login_and_vote_form(self):
+        def login_and_open_ballot():
+            response = self.client.post('/login/', {'reg_no': self.student.reg_no, 'password': 'secret'})
+            self.assertRedirects(response, '/vote/', fetch_redirect_response=False)
+            self.assertEqual(self.client.get('/vote/').status_code, 200)
+
+        self.assertNoFullScans(self.capture(login_and_open_ballot))
+
+    def test_results_pages(self):
+        def load_results():
+            self.assertEqual(self.client.get('/').status_code, 200)
+            cache.clear()
+            self.assertEqual(self.client.get('/success/').status_code, 200)
+
+        self.assertNoFullScans(self.capture(load_results))
+
+    def test_admin_searches(self):
+        request = RequestFactory().get('/admin/')
+        searches = [
+            (Student, 'reg/0001'), (Student, 'student12@'), (Student, 'student 7'),
+            # One voter, one candidate, one position: a term matching every row is rightly a scan
+            (Vote, '19999'), (Vote, '2.3'), (Vote, '"position 1"'),
+        ]
+        for model, term in searches:
+            model_admin = admin.site._registry[model]
+            queryset, _ = model_admin.get_search_results(request, model_admin.get_queryset(request), term)
+            with self.subTest(model=model.__name__, term=term):
+                self.assertNoFullScans(
+                    self.capture(lambda: (list(queryset[:100]), queryset.count())), self.SEARCH_SCAN_ALLOWED
+                )
+
+
+
+class AdminQueryBudgetTests(LargeElectionTestCase):
+    """
+    Loads the admin changelists and forms over 20k students and 100k votes and
+    fails on a query count over budget, or a COUNT(*) of a whole large table.
+    """
+    # Filtered lists are counted exactly (through their indexes); the whole table never is
+    FULL_TABLE_COUNT = re.compile(r'COUNT\(\*\) AS "__count" FROM "myweb_(vote|student)"$')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin, backend='django.contrib.auth.backends.ModelBackend')
+
+    def assertWithinBudget(self, url, budget):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sqls = [query['sql'] for query in queries.captured_queries]
+        self.assertLessEqual(len(sqls), budget, '\n'.join(sqls))
+        for sql in sqls:
+            self.assertIsNone(self.FULL_TABLE_COUNT.search(sql), f"Full table count:\n{sql}")
+        return response
+
+    def test_vote_changelist(self):
+        position, candidate = self.positions[0], self.candidates[0]
+        response = self.assertWithinBudget('/admin/myweb/vote/', 5)
+        self.assertEqual(response.context['cl'].result_count, Vote.objects.count())
+        self.assertWithinBudget('/admin/myweb/vote/?p=50', 5)
+        # Filtered lists are counted exactly, past any cap, and every page can be reached
+        response = self.assertWithinBudget(f'/admin/myweb/vote/?position__id__exact={position.pk}', 6)
+        self.assertEqual(response.context['cl'].result_count, Vote.objects.filter(position=position).count())
+        response = self.assertWithinBudget(f'/admin/myweb/vote/?position__id__exact={position.pk}&p=150', 6)
+        self.assertEqual(response.context['cl'].page_num, 150)
+        response = self.assertWithinBudget(
+            f'/admin/myweb/vote/?position__id__exact={position.pk}&candidate__id__exact={candidate.pk}', 6)
+        self.assertEqual(response.context['cl'].result_count, Vote.objects.filter(candidate=candidate).count())
+        response = self.assertWithinBudget('/admin/myweb/vote/?q=19999', 5)
+        self.assertEqual(response.context['cl'].result_count, Vote.objects.filter(student=self.student).count())
+        response = self.assertWithinBudget('/admin/myweb/vote/?q=2.3', 5)
+        self.assertEqual(response.context['cl'].result_count, Vote.objects.filter(candidate__name__icontains='2.3').count())
+
+    def test_candidate_filter_follows_position(self):
+        response = self.assertWithinBudget('/admin/myweb/vote/', 5)
+        self.assertNotContains(response, f'candidate__id__exact={self.candidates[0].pk}')
+        position = self.positions[0]
+        response = self.assertWithinBudget(f'/admin/myweb/vote/?position__id__exact={position.pk}', 6)
+        for candidate in self.candidates:
+            if candidate.position_id == position.pk:
+                self.assertContains(response, f'candidate__id__exact={candidate.pk}')
+            else:
+                self.assertNotContains(response, f'candidate__id__exact={candidate.pk}')
+
+    def test_student_changelist(self):
+        response = self.assertWithinBudget('/admin/myweb/student/', 5)
+        # The unfiltered roll is counted by the registered voter counter
+        self.assertEqual(response.context['cl'].result_count, Student.objects.count())
+        self.assertWithinBudget('/admin/myweb/student/?p=150', 5)
+        response = self.assertWithinBudget('/admin/myweb/student/?has_voted__exact=0&p=150', 5)
+        self.assertEqual(response.context['cl'].result_count, Student.objects.filter(has_voted=False).count())
+        response = self.assertWithinBudget('/admin/myweb/student/?q=REG/0001', 5)
+        self.assertEqual(response.context['cl'].result_count, Student.objects.filter(reg_no__icontains='REG/0001').count())
+
+    def test_candidate_changelist(self):
+        self.assertWithinBudget('/admin/myweb/candidate/', 6)
+        self.assertWithinBudget('/admin/myweb/candidate/?o=4', 6)
+
+    def test_vote_form_uses_autocomplete(self):
+        response = self.assertWithinBudget('/admin/myweb/vote/add/', 5)
+        self.assertNotContains(response, self.student.reg_no)
+        response = self.assertWithinBudget(
+            f'/admin/autocomplete/?app_label=myweb&model_name=vote&field_name=student&term={self.student.reg_no}', 4)
+        self.assertEqual([result['id'] for result in response.json()['results']], [str(self.student.pk)])
@@ -1,5 +1,10 @@
+from django.conf import settings
 from django.urls import path
-from .views import register, login_view, logout_view, vote, success, home
+from .views import register, login_view, logout_view, vote, success, home, request_stats, turnout, results_api, results_stream
+
+if settings.ASYNC_VIEWS:
+    # Same pages without a thread per request under the ASGI server
+    from .async_views import home, login_view, vote, success
 
 urlpatterns = [
     path('', home, name='home'),
@@ -8,4 +13,8 @@ urlpatterns = [
     path('logout/', logout_view, name='logout'),
     path('vote/', vote, name='vote'),
     path('success/', success, name='success'),
+    path('request-stats/', request_stats, name='request_stats'),
+    path('api/results/', results_api, name='results_api'),
+    path('results/stream/', results_stream, name='results_stream'),
+    path('api/turnout/', turnout, name='turnout'),
 ]
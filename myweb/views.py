@@ -5,28 +5,20 @@ from .models import Student, Candidate, Position, Vote
 from .forms import StudentForm, LoginForm
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
 
 
 from datetime import datetime
 from django.shortcuts import render
-from django.db.models import Count
-from .models import Candidate
+from . import results
+from .routers import mark_recent_write, use_results_replica
 
 def home(request):
-    # Get all candidates grouped by their positions
-    candidates = Candidate.objects.select_related('position').annotate(vote_count=Count('vote'))
-
-    # Group candidates by position
-    positions_with_candidates = {}
-    for candidate in candidates:
-        position_title = candidate.position.title  # Assuming your Position model has a 'title' field
-        if position_title not in positions_with_candidates:
-            positions_with_candidates[position_title] = []
-        positions_with_candidates[position_title].append(candidate)
+    # Candidates grouped by position, served from the versioned results cache.
+    # No replica here: the snapshot and its version are always read from the primary.
+    snapshot = results.get_snapshot()
 
     return render(request, 'home.html', {
-        'positions_with_candidates': positions_with_candidates,
+        'positions_with_candidates': snapshot['positions_with_candidates'],
         'year': datetime.now().year,
     })
 
@@ -73,72 +65,148 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .models import Candidate, Position, Vote
+from .voting import BallotError, parse_ballot, get_ballot
+from .vote_writer import submit_ballot
 
 @login_required
 def vote(request):
     student = request.user  # Assuming you're using a custom user model for students
 
-    # Retrieve all the votes the student has already cast
-    votes = Vote.objects.filter(student=student)
-
-    # Create a set of positions the student has already voted for
-    voted_positions = set(vote.candidate.position for vote in votes)
-
     # Handle the POST request when the form is submitted
     if request.method == 'POST':
-        selected_candidates = {}
-
-        for position in Position.objects.all():
-            candidate_id = request.POST.get(f'position_{position.id}')
-            if candidate_id:
-                # Check if the student has already voted for this position
-                if position in voted_positions:
-                    messages.error(request, f"You have already voted for the position: {position.title}.")
-                    return redirect('vote')
-
-                # Create a Vote entry
-                candidate = Candidate.objects.get(id=candidate_id)
-                Vote.objects.create(student=student, candidate=candidate)
-                voted_positions.add(position)  # Add this position to voted_positions to prevent double voting
+        try:
+            # Validate and record the whole ballot in a single transaction (via the vote writer when enabled)
+            submit_ballot(student, parse_ballot(request.POST))
+        except BallotError as e:
+            messages.error(request, str(e))
+            return redirect('vote')
 
         messages.success(request, "Your vote has been successfully cast!")
-        return redirect('success')  # Redirect to results or any appropriate page
+        # Keep this voter on the primary database briefly so the results show their vote
+        return mark_recent_write(redirect('success'))
+
+    # Ids of the positions the student has already voted for
+    voted_positions = set(
+        Vote.objects.filter(student=student).values_list('position_id', flat=True)
+    )
 
-    candidates = Candidate.objects.all()
-    positions = Position.objects.all()
+    # Positions with their candidates, pre-grouped and cached between admin edits
+    ballot = get_ballot()
 
     return render(request, 'vote.html', {
-        'candidates': candidates,
-        'positions': positions,
+        'ballot': ballot,
         'student': student,
         'voted_positions': voted_positions,
     })
 
 
-
 from django.shortcuts import render
-from django.db.models import Count
-from .models import Candidate, Student
+from . import results
 
 def success(request):
-    # Get all candidates along with their positions and vote counts
-    candidates = Candidate.objects.select_related('position').annotate(vote_count=Count('vote'))
-
-    # Create a dictionary to group candidates by their positions
-    positions_with_candidates = {}
-    for candidate in candidates:
-        position_title = candidate.position.title  # Assuming your Position model has a 'title' field
-        if position_title not in positions_with_candidates:
-            positions_with_candidates[position_title] = {'candidates': [], 'total_votes': 0}
-        positions_with_candidates[position_title]['candidates'].append(candidate)
-        positions_with_candidates[position_title]['total_votes'] += candidate.vote_count
-
-    # Count total registered students and total votes
-    total_students = Student.objects.count()  # Count of registered students
-    total_votes = sum(candidate.vote_count for candidate in candidates)  # Sum of all votes
+    # Candidates grouped by position with their vote counts, plus the election totals.
+    # The snapshot is recomputed only after a vote or candidate change bumps the results version.
+    snapshot = results.get_snapshot()
 
     return render(request, 'success.html', {
-        'positions_with_candidates': positions_with_candidates,
-        'total_students': total_students,
-        'total_votes': total_votes,
+        'positions_with_candidates': snapshot['positions_with_candidates'],
+        'total_students': snapshot['total_students'],
+        'total_votes': snapshot['total_votes'],
     })
+
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from .middleware import get_request_stats
+
+@staff_member_required
+def request_stats(request):
+    # Per-URL-name figures collected by RequestInstrumentationMiddleware in this process
+    return JsonResponse(get_request_stats())
+
+
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import TurnoutRollup
+
+def _parse_bound(value):
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f"Invalid datetime: {value!r}.")
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+@use_results_replica
+def turnout(request):
+    # Votes per minute for [start, end), read from the rollup table one row per bucket
+    try:
+        start = _parse_bound(request.GET.get('start'))
+        end = _parse_bound(request.GET.get('end'))
+        position = int(request.GET['position']) if request.GET.get('position') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    rollups = TurnoutRollup.objects.all()
+    if start:
+        rollups = rollups.filter(minute__gte=start)
+    if end:
+        rollups = rollups.filter(minute__lt=end)
+    if position is not None:
+        rollups = rollups.filter(position_id=position)
+    buckets = rollups.values('minute').annotate(total=Sum('votes')).order_by('minute')
+
+    return JsonResponse({
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None,
+        'position': position,
+        'buckets': [{'minute': bucket['minute'].isoformat(), 'votes': bucket['total']} for bucket in buckets],
+    })
+
+
+from django.views.decorators.http import condition, require_safe
+
+def _results_etag(request):
+    # A single primary key read of the results version: an unchanged poll never loads the snapshot
+    return f'"results-{results.current_version()}"'
+
+@require_safe
+@condition(etag_func=_results_etag)
+def results_api(request):
+    # Compact results for scoreboards; ?since=<version> returns only the candidates that changed
+    snapshot = results.get_snapshot()
+    data = {
+        'version': snapshot['version'],
+        'total_votes': snapshot['total_votes'],
+        'registered_voters': snapshot['total_students'],
+    }
+    since = request.GET.get('since', '')
+    changed = results.changed_since(snapshot, int(since)) if since.isdigit() else None
+    if changed is None:
+        data['positions'] = snapshot['positions_with_candidates']
+    else:
+        data['since'] = int(since)
+        data['candidates'] = changed
+
+    response = JsonResponse(data)
+    # The snapshot can trail the current version while it is being rebuilt; tag what was actually sent
+    response['ETag'] = f'"results-{snapshot["version"]}"'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from .streams import get_feed
+
+async def results_stream(request):
+    # Server-Sent Events for kiosks without WebSockets: a snapshot, then deltas as the results change.
+    # Needs the ASGI server (myweb.asgi); every client on the worker shares one change feed.
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI Django would drain the endless stream synchronously, holding a worker thread forever
+        return HttpResponse("The results stream needs the ASGI server.", status=501, content_type='text/plain')
+    response = StreamingHttpResponse(get_feed().stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
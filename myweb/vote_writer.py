@@ -0,0 +1,149 @@
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from . import broadcast, journal
+from .voting import BallotError, cast_ballot
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 64  # Ballots committed together in one transaction at most
+SUBMIT_TIMEOUT = 30  # Seconds a request waits for its ballot before giving up
+
+_STOP = object()
+
+
+class VoteWriter:
+    """
+    A single thread that owns every vote write in this process.
+
+    Request threads hand ballots over with submit() and wait on the returned
+    future. The writer takes whatever has queued up while it was busy and
+    commits it as one transaction (each ballot in its own savepoint), so
+    SQLite sees one writer and one fsync per batch instead of a lock fight
+    between request threads. The batch's new counts go out in one results
+    broadcast once every submitter has its answer.
+    """
+
+    def __init__(self, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='vote-writer', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """Write everything already submitted, then stop the thread."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None and thread.is_alive():
+            self.queue.put(_STOP)
+            thread.join()
+
+    def submit(self, student, choices):
+        """Queue a ballot; the future resolves to cast_ballot's result once it is committed."""
+        future = Future()
+        self.start()
+        # The ballot's queries go through the caller's execute wrappers too (request instrumentation, benchmarks)
+        self.queue.put((student, choices, list(connection.execute_wrappers), future))
+        return future
+
+    def run(self):
+        try:
+            stopping = False
+            while not stopping:
+                item = self.queue.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self.write(batch)
+        finally:
+            connection.close()
+
+    def write(self, batch):
+        # The thread lives for the whole process, so honour CONN_MAX_AGE and health checks between batches
+        close_old_connections()
+        outcomes = []
+        try:
+            # One broadcast for the whole batch, sent after the submitters are answered
+            with broadcast.deferred() as candidate_ids, transaction.atomic():
+                for student, choices, wrappers, future in batch:
+                    try:
+                        with ExitStack() as stack:
+                            for wrapper in wrappers:
+                                stack.enter_context(connection.execute_wrapper(wrapper))
+                            outcomes.append((future, cast_ballot(student, choices), None))
+                    except Exception as e:
+                        # cast_ballot's own atomic block rolled back just this ballot
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            logger.exception("Vote writer failed to commit a batch of %d ballot(s).", len(batch))
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, votes, error in outcomes:
+            if error is None:
+                future.set_result(votes)
+            else:
+                future.set_exception(error)
+        if candidate_ids:
+            broadcast.publish_tallies(candidate_ids)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = VoteWriter(getattr(settings, 'VOTE_WRITER_MAX_BATCH', MAX_BATCH))
+            atexit.register(_writer.stop)
+    return _writer
+
+
+def submit_ballot(student, choices):
+    """
+    Record a ballot through the vote journal when VOTE_JOURNAL is on, through
+    the process-wide vote writer when VOTE_WRITER is on, or directly in the
+    calling thread otherwise. Raises BallotError like cast_ballot.
+    """
+    # Inside a transaction (ATOMIC_REQUESTS, tests) the writer could not see
+    # this thread's uncommitted rows, so the ballot has to join it instead
+    if connection.in_atomic_block:
+        return cast_ballot(student, choices)
+    if not choices:
+        return []
+    if getattr(settings, 'VOTE_JOURNAL', False):
+        # Acknowledged once the record is fsynced; the flusher writes the votes shortly after
+        future = journal.get_journal().append(student, choices)
+    elif getattr(settings, 'VOTE_WRITER', False):
+        future = get_writer().submit(student, choices)
+    else:
+        return cast_ballot(student, choices)
+    try:
+        future.result(timeout=SUBMIT_TIMEOUT)
+    except TimeoutError:
+        raise BallotError("The server is busy. Please check the results page before voting again.")
@@ -0,0 +1,142 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+
+from .models import Student, Position, Candidate, Vote
+from . import broadcast, results, tallies
+
+
+BALLOT_KEY = 'ballot:structure'
+# Other workers only see an edit's invalidation through a shared results cache;
+# with a per-process cache this bounds how long they keep serving the old ballot
+BALLOT_TIMEOUT = 60
+
+
+class BallotError(Exception):
+    """Raised when a submitted ballot cannot be accepted."""
+
+
+def parse_ballot(data):
+    """Extract a {position_id: candidate_id} mapping from the submitted form data."""
+    choices = {}
+    for key, value in data.items():
+        if not key.startswith('position_') or not value:
+            continue
+        try:
+            choices[int(key[len('position_'):])] = int(value)
+        except ValueError:
+            raise BallotError("Invalid ballot submitted.")
+    return choices
+
+
+def cast_ballot(student, choices):
+    """
+    Validate and record a whole ballot in one transaction.
+
+    `choices` maps position ids to candidate ids. The number of queries is
+    constant no matter how many positions are on the ballot. A second vote
+    for a position is rejected by the unique (student, position) constraint.
+    """
+    if not choices:
+        return []
+
+    try:
+        with transaction.atomic():
+            candidates = Candidate.objects.in_bulk(choices.values())
+
+            votes = []
+            for position_id, candidate_id in choices.items():
+                candidate = candidates.get(candidate_id)
+                if candidate is None or candidate.position_id != position_id:
+                    raise BallotError("Invalid candidate selected.")
+                votes.append(Vote(student=student, candidate=candidate, position_id=position_id))
+
+            Vote.objects.bulk_create(votes)
+            tallies.record_votes(votes)
+            Student.objects.filter(pk=student.pk).update(has_voted=True)
+            results.invalidate()
+            broadcast.publish_on_commit(vote.candidate_id for vote in votes)
+    except IntegrityError:
+        raise BallotError(_rejection_message(student, choices))
+
+    student.has_voted = True
+    return votes
+
+
+def check_ballot(student, choices):
+    """
+    Validate a ballot without writing anything, for paths that record it later
+    (the vote journal). Uses the cached ballot and one read query.
+    """
+    positions = {
+        candidate['id']: position['id']
+        for position in get_ballot()
+        for candidate in position['candidates']
+    }
+    for position_id, candidate_id in choices.items():
+        if positions.get(candidate_id) != position_id:
+            raise BallotError("Invalid candidate selected.")
+    if Vote.objects.filter(student=student, position_id__in=choices).exists():
+        raise BallotError(_rejection_message(student, choices))
+
+
+def _rejection_message(student, choices):
+    duplicate = Vote.objects.filter(
+        student=student, position_id__in=choices
+    ).select_related('position').first()
+    if duplicate is None:
+        return "Your vote could not be recorded. Please try again."
+    return f"You have already voted for the position: {duplicate.position.title}."
+
+
+def _ballot_positions():
+    return Position.objects.order_by('pk').prefetch_related(
+        Prefetch('candidate_set', queryset=Candidate.objects.order_by('pk'))
+    )
+
+
+def _ballot_data(positions):
+    return [
+        {
+            'id': position.pk,
+            'title': position.title,
+            'candidates': [
+                {
+                    'id': candidate.pk,
+                    'name': candidate.name,
+                    'image_url': candidate.image.url if candidate.image else None,
+                }
+                for candidate in position.candidate_set.all()
+            ],
+        }
+        for position in positions
+    ]
+
+
+def build_ballot():
+    """Return the positions in order, each with its candidates, as plain data."""
+    return _ballot_data(_ballot_positions())
+
+
+def get_ballot():
+    """The ballot only changes when an admin edits positions or candidates, so it is cached in between."""
+    cache = results.get_cache()
+    ballot = cache.get(BALLOT_KEY)
+    if ballot is None:
+        ballot = build_ballot()
+        cache.set(BALLOT_KEY, ballot, timeout=BALLOT_TIMEOUT)
+    return ballot
+
+
+async def aget_ballot():
+    """get_ballot for the async views."""
+    cache = results.get_cache()
+    ballot = await cache.aget(BALLOT_KEY)
+    if ballot is None:
+        ballot = _ballot_data([position async for position in _ballot_positions()])
+        await cache.aset(BALLOT_KEY, ballot, timeout=BALLOT_TIMEOUT)
+    return ballot
+
+
+def invalidate_ballot():
+    """Drop the cached ballot once the current transaction commits."""
+    transaction.on_commit(lambda: results.get_cache().delete(BALLOT_KEY))
@@ -32,16 +32,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myweb.middleware.RequestInstrumentationMiddleware',  # Only active when REQUEST_INSTRUMENTATION is True
     'django.middleware.security.SecurityMiddleware',
+    # WhiteNoise is sync-only. Up here, under ASGI only it and SecurityMiddleware run in a
+    # worker thread; the middleware below and the async views stay on the event loop.
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
 
+# Per-request SQL/timing instrumentation: adds Server-Timing headers and
+# aggregates the figures per URL name (staff can read them at /request-stats/).
+# Ballots written by the vote writer count towards their request; the vote
+# journal's batched writes are reported as 'vote_journal.flush'.
+REQUEST_INSTRUMENTATION = False
+
 ROOT_URLCONF = 'web.urls'
 
 TEMPLATES = [
@@ -61,6 +70,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'web.wsgi.application'
+ASGI_APPLICATION = 'myweb.asgi.application'
 
 # Channel layers configuration for asynchronous communication
 CHANNEL_LAYERS = {
@@ -71,6 +81,40 @@ CHANNEL_LAYERS = {
         },
     },
 }
+# Single-machine deployments without Redis: CHANNEL_LAYER=unix shares channels and
+# groups between the local worker processes through a Unix socket broker
+# (myweb.channel_broker) that the first worker starts, or `manage.py run_channel_broker`.
+if os.environ.get('CHANNEL_LAYER') == 'unix':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'myweb.channel_broker.UnixSocketChannelLayer',
+            'CONFIG': {
+                # Unset: BASE_DIR / 'channels.sock' (myweb.channel_broker.default_path)
+                'path': os.environ.get('CHANNEL_BROKER_SOCKET'),
+            },
+        },
+    }
+
+# Live results sockets (myweb.consumers.ResultsConsumer) send at most one
+# delta message per connection every RESULTS_BROADCAST_INTERVAL seconds.
+RESULTS_BROADCAST_INTERVAL = 1.0
+# Seconds between results version checks by the shared SSE feed (myweb.streams)
+RESULTS_FEED_INTERVAL = 1.0
+# Admin notification sockets (myweb.consumers.NotificationConsumer) send one frame
+# per NOTIFICATION_BATCH_INTERVAL seconds and keep at most NOTIFICATION_QUEUE_SIZE
+# unsent messages per connection, dropping the oldest for clients that fall behind.
+NOTIFICATION_BATCH_INTERVAL = 0.05
+NOTIFICATION_QUEUE_SIZE = 100
+
+# Serve home, login, vote and success with the async views (myweb.async_views)
+# when running under the ASGI server; set ASYNC_VIEWS=1 in the environment.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+# Threads that check passwords for the async login view (myweb.credentials)
+PASSWORD_CHECK_WORKERS = 4
+# Password hashing processes for voter rolls uploaded in the admin. Keep it at 1 (inline):
+# forking a web worker that runs the vote writer and journal threads is unsafe.
+# `manage.py import_voters` uses every core by default.
+ADMIN_IMPORT_WORKERS = 1
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -79,8 +123,71 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests instead of reconnecting every time
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        # SQLite production profile: WAL lets readers run alongside the writer,
+        # busy_timeout makes a second writer wait instead of failing with
+        # "database is locked", and IMMEDIATE transactions take the write lock
+        # up front so two writers can never deadlock on a lock upgrade.
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA busy_timeout=5000;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-20000;'  # 20 MB page cache per connection
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+# Funnel ballots through one writer thread per process that commits them in
+# batches (myweb.vote_writer). Meant for SQLite; turn off on a server database.
+VOTE_WRITER = True
+VOTE_WRITER_MAX_BATCH = 64
+
+# Write-behind vote journal for peak load (myweb.journal): a ballot is acknowledged
+# once its record is fsynced to a local append-only file, and a background flusher
+# applies the records to the Vote table in batches. Takes precedence over VOTE_WRITER.
+VOTE_JOURNAL = False
+VOTE_JOURNAL_DIR = BASE_DIR / 'journal'
+VOTE_JOURNAL_FLUSH_BATCH = 1000
+VOTE_JOURNAL_FLUSH_INTERVAL = 1.0
+VOTE_JOURNAL_ROTATE_BYTES = 64 * 1024 * 1024  # Start a new file past this size; applied files move to applied/
+
+# Optional read replica for the turnout endpoint and admin changelists (myweb.routers).
+# Set RESULTS_DATABASE_NAME (and host/credentials) to enable it.
+if os.environ.get('RESULTS_DATABASE_NAME'):
+    DATABASES['results'] = {
+        'ENGINE': os.environ.get('RESULTS_DATABASE_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.environ['RESULTS_DATABASE_NAME'],
+        'HOST': os.environ.get('RESULTS_DATABASE_HOST', ''),
+        'PORT': os.environ.get('RESULTS_DATABASE_PORT', ''),
+        'USER': os.environ.get('RESULTS_DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('RESULTS_DATABASE_PASSWORD', ''),
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['myweb.routers.ResultsReplicaRouter']
+
+# Seconds a voter's reads stay on the primary after casting a ballot
+RESULTS_REPLICA_RYOW_SECONDS = 10
+
+# Cache configuration
+# The results pages are served from a snapshot in this cache (myweb.results). Its
+# version is kept in the database, so a per-process cache never serves stale results;
+# each worker just builds its own copy once per change. A shared Redis or Memcached
+# cache lets the workers share one rebuild.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
 }
+RESULTS_CACHE_ALIAS = 'default'
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -150,6 +257,15 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # Default Django backend
 ]
 
+# Serve request.user for students from a cached snapshot of the columns the
+# voting pages need (myweb.auth_backends.StudentBackend.get_cached_user).
+# The snapshots live in the results cache: with several workers it must be a
+# shared one, or a password change only logs the user out of one worker.
+STUDENT_USER_CACHE = False
+STUDENT_USER_CACHE_TIMEOUT = 300
+
 # Session engine configuration
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Database sessions that skip writes when the data is unchanged and the expiry is still fresh.
+# Expired rows are removed incrementally with `manage.py purge_sessions`.
+SESSION_ENGINE = 'myweb.sessions'
 
@@ -14,3 +14,6 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web.settings')
 
 application = get_wsgi_application()
+
+from myweb import journal
+journal.start_if_enabled()  # Replays journals left by a crashed process before serving